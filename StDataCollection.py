@@ -1,19 +1,53 @@
 import streamlit as st
-import pandas as pd
 import plotly.express as px
+from datetime import date, datetime, time
+import colStore
+from downsample import downsample_frame, window
+from rollups import RESOLUTIONS, choose_resolution, load_rollup
+from catalog import Catalog
+import schemas
+import parseCache
 
 # Title for the Streamlit app
 st.title('Sensor Data Visualization')
 
-# Function to load and prepare the data
+# Function to load and prepare the data; files of every acquisition script load under the
+# canonical channel names. Each distinct upload is parsed once, reruns reuse the parsed frame
 def load_data(uploaded_file):
-    data = pd.read_csv(uploaded_file)
-    data['Timestamp'] = pd.to_datetime(data['Timestamp'])
-    return data
+    return parseCache.load(uploaded_file)
+
+# Function to load days from the columnar store written with --binary
+def load_stored_data(directory, days, metrics):
+    start, end = days if len(days) == 2 else (days[0], days[0])
+    return schemas.canonical_frame(colStore.load_range(directory, start, end), metrics)
+
+# Function to load days from the daily CSVs in a directory through the catalog
+def load_catalog_data(directory, days, metrics):
+    start, end = days if len(days) == 2 else (days[0], days[0])
+    data = Catalog(directory).update().read_range(datetime.combine(start, time.min), datetime.combine(end, time.max))
+    return schemas.canonical_frame(data, metrics)
+
+# Function to load the rollup resolution that fits the selected days (bucket means are plotted)
+def load_rollup_data(directory, days, metrics):
+    start, end = days if len(days) == 2 else (days[0], days[0])
+    start, end = datetime.combine(start, time.min), datetime.combine(end, time.max)
+    resolution = choose_resolution(start, end)
+    if resolution == "raw":
+        resolution = min(RESOLUTIONS, key=RESOLUTIONS.get)
+    data = load_rollup(directory, resolution, start, end)
+    if data.empty:
+        return data
+    means = {column: column[:-len("_mean")] for column in data.columns if column.endswith("_mean")}
+    data = data[[data.columns[0]] + list(means)].rename(columns=means)
+    return schemas.canonical_frame(data, metrics)
 
 # Function to create plot
 def create_plot(data, metrics):
+    # Metrics the loaded generation does not record are left out of the plot
+    metrics = [metric for metric in metrics if metric in data.columns]
     if not data.empty and metrics:
+        # Cut long series down to about one point per pixel, keeping spikes
+        data = downsample_frame(data, 'Timestamp', metrics)
         fig = px.line(data, x='Timestamp', y=metrics, title='Sensor Data over Time', markers=True)
         fig.update_traces(line=dict(width=2.5), mode='markers+lines')
         fig.update_layout(
@@ -33,24 +67,41 @@ def create_plot(data, metrics):
 # Define sidebar for user input
 metrics = st.sidebar.multiselect(
     'Select metrics to visualize',
-    options=["Motor Temp", "Cooler Temp", "Oil Temp", "Oil Pressure",
-             "Air Pressure", "PSI100 Pressure", "Phase_A_Current_(A)", "Phase_B_Current_(A)",
-             "Phase_C_Current_(A)", "Phase_A_Voltage_(V)", "Phase_B_Voltage_(V)", "Phase_C_Voltage_(V)",
-             "Total Active Power(W)", "Humditiy"],
-    default=["Motor Temp", "Oil Pressure"]
+    options=schemas.numeric_channels(),
+    format_func=lambda channel: "{} ({})".format(channel, schemas.unit(channel)) if schemas.unit(channel) else channel,
+    default=["Motor_Temp", "Oil_Pressure"]
 )
 
-# Upload the CSV file
-uploaded_file = st.file_uploader("Choose a file")
-if uploaded_file is not None:
-    data = load_data(uploaded_file)
+# Choose between an uploaded CSV, a directory of daily CSVs, the columnar day store and the rollups
+source = st.sidebar.radio('Data source', ['Upload CSV', 'CSV directory', 'Binary day store', 'Rollups'])
+data = None
+if source == 'Upload CSV':
+    uploaded_file = st.file_uploader("Choose a file")
+    if uploaded_file is not None:
+        data = load_data(uploaded_file)
+else:
+    directory = st.sidebar.text_input('Data directory', '.')
+    days = st.sidebar.date_input('Days', value=(date.today(), date.today()))
+    if days and source == 'CSV directory':
+        data = load_catalog_data(directory, days, metrics)
+    elif days and source == 'Rollups':
+        data = load_rollup_data(directory, days, metrics)
+    elif days:
+        data = load_stored_data(directory, days, metrics)
+
+if data is not None:
     if not data.empty:
+        # Narrowing the window brings back full resolution once it fits the chart
+        first, last = data['Timestamp'].min().to_pydatetime(), data['Timestamp'].max().to_pydatetime()
+        if first < last:
+            start, end = st.sidebar.slider('Time window', min_value=first, max_value=last, value=(first, last))
+            data = window(data, 'Timestamp', start, end)
         fig = create_plot(data, metrics)
         if isinstance(fig, str):
             st.write(fig)  # Display message if no metrics are selected
         elif fig:
             st.plotly_chart(fig, use_container_width=True)
     else:
-        st.write("The uploaded file is empty or invalid.")
+        st.write("The selected data is empty or invalid.")
 else:
     st.write("Please upload a CSV file to visualize the data.")
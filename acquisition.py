@@ -0,0 +1,114 @@
+import threading
+import time
+from scheduler import Scheduler
+
+### PER-BUS WORKERS ###
+# Every physical bus gets its own thread and lock. The readers on a bus run on that
+# bus's scheduler, so a stalled Modbus transaction only delays the other RS485 readers,
+# never the SPI or I2C ones. The record writer takes a snapshot of the latest values.
+
+class Reading:
+    def __init__(self, name, period, func, default, stale_after):
+        self.name = name
+        self.period = period
+        self.func = func
+        self.default = default
+        self.stale_after = stale_after
+        self.value = default
+        self.updated = None
+        self.errors = 0
+        self.failing = None     # exception type of the current run of failures
+
+class BusWorker:
+    def __init__(self, name, lock=None):
+        self.name = name
+        self.lock = lock or threading.Lock()
+        self.scheduler = Scheduler(name=name)
+        self.readings = {}
+        self._thread = None
+
+    def every(self, period, func, name=None, default=None, stale_after=None):
+        # func() is called under the bus lock; its return value becomes the latest reading,
+        # named after the function without its read_ prefix unless a name is given
+        name = name or func.__name__
+        if name.startswith("read_"):
+            name = name[len("read_"):]
+        reading = Reading(name, period, func, default, stale_after or 3 * period)
+        self.readings[name] = reading
+
+        def task():
+            try:
+                with self.lock:
+                    value = reading.func()
+            except Exception as error:
+                reading.errors += 1
+                # the first failure and every change of error are printed, not each repeat
+                if type(error) is not reading.failing:
+                    reading.failing = type(error)
+                    print("{} reader {} failed: {}: {}".format(self.name, reading.name, type(error).__name__, error))
+                return
+            if reading.failing is not None:
+                print("{} reader {} recovered ({} errors so far)".format(self.name, reading.name, reading.errors))
+                reading.failing = None
+            reading.value = value
+            reading.updated = time.monotonic()
+
+        self.scheduler.every(period, task, name)
+        return reading
+
+    def start(self):
+        self._thread = threading.Thread(target=self.scheduler.run, name="bus-" + self.name, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self.scheduler.stop()
+
+class AcquisitionEngine:
+    def __init__(self):
+        self.buses = {}
+
+    def bus(self, name, lock=None):
+        if name not in self.buses:
+            self.buses[name] = BusWorker(name, lock)
+        return self.buses[name]
+
+    def start(self):
+        for worker in self.buses.values():
+            worker.start()
+
+    def stop(self):
+        for worker in self.buses.values():
+            worker.stop()
+
+    def wait_ready(self, timeout=5.0):
+        # Give every reader a chance to fill in its first value before recording starts
+        deadline = time.monotonic() + timeout
+        readings = [reading for worker in self.buses.values() for reading in worker.readings.values()]
+        while time.monotonic() < deadline:
+            if all(reading.updated is not None or reading.errors for reading in readings):
+                return True
+            time.sleep(0.01)
+        return False
+
+    def snapshot(self):
+        # Latest value of every reading; anything not refreshed within stale_after
+        # (or never read) comes back as its default so stale data is never recorded
+        now = time.monotonic()
+        values = {}
+        for worker in self.buses.values():
+            for name, reading in worker.readings.items():
+                if reading.updated is None or now - reading.updated > reading.stale_after:
+                    values[name] = reading.default
+                else:
+                    values[name] = reading.value
+        return values
+
+    def report(self):
+        lines = []
+        for worker in self.buses.values():
+            lines.append("[{}]".format(worker.name))
+            lines.append(worker.scheduler.report())
+            errors = {name: reading.errors for name, reading in worker.readings.items() if reading.errors}
+            if errors:
+                lines.append("errors: {}".format(errors))
+        return "\n".join(lines)
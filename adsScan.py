@@ -0,0 +1,141 @@
+import time
+from array import array
+import metrics
+
+### ADS1115 SCAN ENGINE ###
+# AnalogIn.voltage starts a single-shot conversion at the chip's current data rate and
+# waits for it, so every access costs a full conversion at whatever gain was set last.
+# AdsScanner keeps the gain and data rate per channel and reads raw counts straight from
+# the chip:
+#
+#   scan()    one round-robin pass over the channels in single-shot mode
+#   stream()  keeps one hot channel in continuous-conversion mode and picks up each new
+#             conversion as it lands, up to the 860 SPS the ADS1115 can do
+#
+# Every conversion goes into a preallocated ring of int16 counts with its channel and
+# monotonic timestamp, so pressure transients can be read back at the full scan rate.
+
+DATA_RATES = (8, 16, 32, 64, 128, 250, 475, 860)
+FULL_SCALE = {2 / 3: 6.144, 1: 4.096, 2: 2.048, 4: 1.024, 8: 0.512, 16: 0.256}
+MODE_CONTINUOUS = 0x0000
+MODE_SINGLE = 0x0100
+RING_SIZE = 8192
+
+class ScanChannel:
+    def __init__(self, pin, gain=1, data_rate=128, name=None):
+        if gain not in FULL_SCALE:
+            raise ValueError("gain must be one of {}".format(sorted(FULL_SCALE)))
+        if data_rate not in DATA_RATES:
+            raise ValueError("data rate must be one of {}".format(DATA_RATES))
+        self.pin = pin
+        self.gain = gain
+        self.data_rate = data_rate
+        self.name = name or "P{}".format(pin)
+        self.last = None    # latest counts
+
+    def volts(self, counts):
+        return counts * FULL_SCALE[self.gain] / 32767
+
+class SampleRing:
+    # Fixed-size ring of (monotonic time, channel index, int16 counts)
+    def __init__(self, size=RING_SIZE):
+        self.size = size
+        self.times = array("d", bytes(8 * size))
+        self.channels = array("b", bytes(size))
+        self.counts = array("h", bytes(2 * size))
+        self.written = 0    # total samples ever appended
+
+    def append(self, when, channel, counts):
+        slot = self.written % self.size
+        self.times[slot] = when
+        self.channels[slot] = channel
+        self.counts[slot] = counts
+        self.written += 1
+
+    def since(self, written):
+        # Samples appended after the `written` count a reader last saw (at most one ring)
+        start = max(written, self.written - self.size)
+        rows = []
+        for position in range(start, self.written):
+            slot = position % self.size
+            rows.append((self.times[slot], self.channels[slot], self.counts[slot]))
+        return rows
+
+    def to_numpy(self):
+        # (times, channels, counts) oldest first
+        import numpy as np
+        count = min(self.written, self.size)
+        order = (np.arange(count) + self.written - count) % self.size
+        return (np.frombuffer(self.times, dtype=np.float64)[order],
+                np.frombuffer(self.channels, dtype=np.int8)[order],
+                np.frombuffer(self.counts, dtype=np.int16)[order])
+
+class AdsScanner:
+    def __init__(self, ads, channels, ring_size=RING_SIZE):
+        self.ads = ads
+        self.channels = channels
+        self.ring = SampleRing(ring_size)
+        self._hot = None
+        self.latency = [metrics.histogram("ads_conversion_seconds", "ADS1115 read per conversion", channel=channel.name)
+                        for channel in channels]
+
+    def _select(self, channel, mode):
+        if self.ads.gain != channel.gain:
+            self.ads.gain = channel.gain
+        if self.ads.data_rate != channel.data_rate:
+            self.ads.data_rate = channel.data_rate
+        if self.ads.mode != mode:
+            self.ads.mode = mode
+
+    def _read(self, index, mode):
+        channel = self.channels[index]
+        self._select(channel, mode)
+        began = time.monotonic()
+        counts = self.ads.read(channel.pin)
+        now = time.monotonic()
+        self.latency[index].observe(now - began)
+        channel.last = counts
+        self.ring.append(now, index, counts)
+        return counts
+
+    def scan(self):
+        # One single-shot conversion per channel, in order; returns the counts
+        self._hot = None
+        return [self._read(index, MODE_SINGLE) for index in range(len(self.channels))]
+
+    def stream(self, index, samples=None, seconds=None):
+        # Continuous conversions of one channel, paced by its data rate. The first read
+        # starts the conversions; later reads only fetch the latest result.
+        channel = self.channels[index]
+        period = 1.0 / channel.data_rate
+        deadline = None if seconds is None else time.monotonic() + seconds
+        taken = 0
+        next_read = time.monotonic()
+        while (samples is None or taken < samples) and (deadline is None or time.monotonic() < deadline):
+            if self._hot == index:
+                delay = next_read - time.monotonic()
+                if delay > 0:
+                    time.sleep(delay)
+            self._read(index, MODE_CONTINUOUS)
+            self._hot = index
+            next_read += period
+            taken += 1
+        return taken
+
+    def latest(self, index):
+        channel = self.channels[index]
+        return None if channel.last is None else channel.volts(channel.last)
+
+    def volts(self):
+        return [self.latest(index) for index in range(len(self.channels))]
+
+    def mean_volts(self, written):
+        # Mean per channel of the conversions appended after `written` (ring.written as
+        # the caller last saw it); None for a channel without any
+        totals = [0] * len(self.channels)
+        taken = [0] * len(self.channels)
+        for when, index, counts in self.ring.since(written):
+            totals[index] += counts
+            taken[index] += 1
+        return [channel.volts(total / count) if count else None
+                for channel, total, count in zip(self.channels, totals, taken)]
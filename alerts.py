@@ -0,0 +1,287 @@
+import json
+import math
+import os
+import socket
+import subprocess
+import time
+from collections import deque
+from datetime import datetime
+import schemas
+
+RATE_SLOTS = 60     # samples RateOfChange keeps per window
+
+### STREAMING ALERT RULES ###
+# Every rule keeps a fixed amount of state (a few numbers, RateOfChange at most
+# RATE_SLOTS + 2 samples) and looks at one record at a time, so a record costs the same
+# however long the loop has run. A rule's check() returns True (condition
+# present), False (absent) or None (no usable value, the debounce count is left alone).
+# AlertEngine raises an alert after `hold` consecutive True samples and clears it after
+# `clear` consecutive False ones, and hands each change to the sinks straight away. The
+# default hold of 1 raises within one record period; `clear` keeps a flapping value from
+# clearing and raising it again every record.
+
+def _number(value):
+    if value is None or value == "":
+        return None
+    try:
+        value = float(value)
+    except (TypeError, ValueError):
+        return None
+    return None if value != value else value
+
+class Rule:
+    def __init__(self, name, columns, severity="warning", hold=1, clear=3):
+        self.name = name
+        self.columns = columns
+        self.severity = severity
+        self.hold = hold
+        self.clear = clear
+        self.active = False
+        self._count = 0
+        self.value = None       # value behind the latest check, for the message
+
+    def check(self, when, values):
+        raise NotImplementedError
+
+    def describe(self):
+        return "{} = {}".format(", ".join(self.columns), self.value)
+
+class Threshold(Rule):
+    # Value above/below a limit, or equal to a text state such as an E-Shutdown message
+    def __init__(self, name, column, above=None, below=None, equals=None, **options):
+        Rule.__init__(self, name, [column], **options)
+        self.above = above
+        self.below = below
+        self.equals = equals
+
+    def check(self, when, values):
+        value = values[0]
+        if self.equals is not None:
+            self.value = value
+            return None if value is None else value == self.equals
+        value = _number(value)
+        self.value = value
+        if value is None:
+            return None
+        return (self.above is not None and value > self.above) or (self.below is not None and value < self.below)
+
+class RateOfChange(Rule):
+    # Change over the last `per` seconds beyond `limit`: a rise for direction "rising", a
+    # fall for "falling", either for "both". The change is measured from the newest value
+    # at least `per` seconds old, so a slow steady climb counts in full and a single noisy
+    # sample is not scaled up; nothing is reported until `per` seconds of history exist.
+    # Stored samples are at least per / RATE_SLOTS apart, which bounds the window and
+    # lets the reference be up to that much older than `per`. A gap longer than `per`
+    # (a restart, a dead sensor) starts the history over.
+    DIRECTIONS = ("rising", "falling", "both")
+
+    def __init__(self, name, column, limit, per=60.0, direction="both", **options):
+        if direction not in self.DIRECTIONS:
+            raise ValueError("direction must be one of {}".format(self.DIRECTIONS))
+        Rule.__init__(self, name, [column], **options)
+        self.limit = limit
+        self.per = per
+        self.direction = direction
+        self._window = deque()      # (time, value), oldest first
+
+    def check(self, when, values):
+        value = _number(values[0])
+        if value is None:
+            return None
+        window = self._window
+        if window and (when - window[-1][0]).total_seconds() > self.per:
+            window.clear()
+        if not window or (when - window[-1][0]).total_seconds() >= self.per / RATE_SLOTS:
+            window.append((when, value))
+        while len(window) > 1 and (when - window[1][0]).total_seconds() >= self.per:
+            window.popleft()
+        if (when - window[0][0]).total_seconds() < self.per:
+            return None
+        change = value - window[0][1]
+        self.value = round(change, 4)
+        if self.direction == "rising":
+            return change > self.limit
+        if self.direction == "falling":
+            return change < -self.limit
+        return abs(change) > self.limit
+
+    def describe(self):
+        return "{} changed {} in {:g} s".format(self.columns[0], self.value, self.per)
+
+class ZScore(Rule):
+    # Distance from the exponentially weighted mean in units of the weighted standard
+    # deviation; `alpha` sets how fast the baseline follows the channel
+    def __init__(self, name, column, limit=4.0, alpha=0.01, warmup=60, **options):
+        Rule.__init__(self, name, [column], **options)
+        self.limit = limit
+        self.alpha = alpha
+        self.warmup = warmup
+        self.samples = 0
+        self.mean = 0.0
+        self.variance = 0.0
+
+    def check(self, when, values):
+        value = _number(values[0])
+        if value is None:
+            return None
+        self.samples += 1
+        if self.samples == 1:
+            self.mean = value
+            return None
+        difference = value - self.mean
+        score = abs(difference) / math.sqrt(self.variance) if self.variance > 0 else 0.0
+        increment = self.alpha * difference
+        self.mean += increment
+        self.variance = (1 - self.alpha) * (self.variance + difference * increment)
+        self.value = round(score, 2)
+        if self.samples <= self.warmup:
+            return None
+        return score > self.limit
+
+class PhaseImbalance(Rule):
+    # Largest deviation from the average of the phases, in percent of the average
+    # (NEMA MG 1 definition); ignored while the average is below `minimum` (motor idle)
+    def __init__(self, name, columns, limit=10.0, minimum=1.0, **options):
+        Rule.__init__(self, name, columns, **options)
+        self.limit = limit
+        self.minimum = minimum
+
+    def check(self, when, values):
+        phases = [_number(value) for value in values]
+        if None in phases:
+            return None
+        average = sum(phases) / len(phases)
+        if average < self.minimum:
+            self.value = None
+            return False
+        self.value = round(max(abs(phase - average) for phase in phases) / average * 100, 2)
+        return self.value > self.limit
+
+RULE_TYPES = {"threshold": Threshold, "rate": RateOfChange, "zscore": ZScore, "imbalance": PhaseImbalance}
+
+ALERT_RULES = "alerts.json"
+
+def load_rules(path):
+    # [{"type": "threshold", "name": "...", "column": "...", "above": 200}, ...]
+    with open(path) as file:
+        return [RULE_TYPES[entry.pop("type")](**entry) for entry in json.load(file)]
+
+def configured_rules(defaults, path=ALERT_RULES):
+    # An alerts.json in the working directory replaces the script's built-in rules
+    return load_rules(path) if os.path.exists(path) else defaults
+
+### ENGINE ###
+class AlertEngine:
+    def __init__(self, header, rules, sinks):
+        # values a script writes past the end of its header (sensorsAq.py) are found by
+        # their registry names (schemas.py)
+        generation = schemas.identify(header)
+        if generation is not None and generation.header == header:
+            header = generation.layout
+        self.rules = []
+        self.sinks = sinks
+        self.records = 0
+        self.seconds = 0.0      # time spent in process(), to compare with the record period
+        self.worst = 0.0
+        self.raised = 0
+        for rule in rules:
+            if all(column in header for column in rule.columns):
+                # positions are resolved once so a record only costs list indexing
+                self.rules.append((rule, [header.index(column) for column in rule.columns]))
+            else:
+                print("alert rule {} skipped, missing columns {}".format(
+                    rule.name, [column for column in rule.columns if column not in header]))
+
+    def process(self, row):
+        began = time.perf_counter()
+        when = row[0]
+        for rule, positions in self.rules:
+            present = rule.check(when, [row[position] if position < len(row) else None for position in positions])
+            if present is None:
+                continue
+            if present == rule.active:
+                rule._count = 0
+                continue
+            rule._count += 1
+            if rule._count >= (rule.hold if present else rule.clear):
+                rule.active = present
+                rule._count = 0
+                self.raised += present
+                self._emit(when, rule)
+        elapsed = time.perf_counter() - began
+        self.records += 1
+        self.seconds += elapsed
+        self.worst = max(self.worst, elapsed)
+
+    def _emit(self, when, rule):
+        event = {"time": when.isoformat() if isinstance(when, datetime) else str(when),
+                 "name": rule.name, "state": "active" if rule.active else "cleared",
+                 "severity": rule.severity, "detail": rule.describe()}
+        for sink in self.sinks:
+            try:
+                sink.send(event)
+            except Exception as error:
+                print("alert sink {} failed: {}".format(type(sink).__name__, error))
+
+    def active(self):
+        return [rule.name for rule, positions in self.rules if rule.active]
+
+    def report(self):
+        mean = self.seconds / self.records * 1e6 if self.records else 0.0
+        return "alerts: {} rules, {} raised, active {}, {:.0f} us/record (max {:.0f} us)".format(
+            len(self.rules), self.raised, self.active() or "none", mean, self.worst * 1e6)
+
+    def close(self):
+        for sink in self.sinks:
+            sink.close()
+
+### SINKS ###
+class LogSink:
+    def __init__(self, path="alerts.log"):
+        self.file = open(path, "a")
+
+    def send(self, event):
+        self.file.write("{time} {state:<7} {severity:<8} {name}: {detail}\n".format(**event))
+        self.file.flush()
+
+    def close(self):
+        self.file.close()
+
+class SocketSink:
+    # One JSON datagram per event to a local Unix socket; nothing happens when no one listens
+    def __init__(self, path="/tmp/acm-alerts.sock"):
+        self.path = path
+        self.socket = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        self.socket.setblocking(False)
+
+    def send(self, event):
+        try:
+            self.socket.sendto(json.dumps(event).encode(), self.path)
+        except (FileNotFoundError, ConnectionRefusedError, BlockingIOError):
+            pass
+
+    def close(self):
+        self.socket.close()
+
+class CommandSink:
+    # Runs a shell command per event without waiting for it; the event is passed in
+    # ALERT_NAME, ALERT_STATE, ALERT_SEVERITY, ALERT_TIME and ALERT_DETAIL
+    def __init__(self, command):
+        self.command = command
+        self.running = []
+
+    def send(self, event):
+        self.running = [process for process in self.running if process.poll() is None]
+        environment = dict(os.environ)
+        environment.update({"ALERT_" + key.upper(): str(value) for key, value in event.items()})
+        self.running.append(subprocess.Popen(self.command, shell=True, env=environment))
+
+    def close(self):
+        pass
+
+def default_sinks(log_path="alerts.log"):
+    # Log file and local socket always; a command hook when ACM_ALERT_COMMAND is set
+    sinks = [LogSink(log_path), SocketSink()]
+    if os.environ.get("ACM_ALERT_COMMAND"):
+        sinks.append(CommandSink(os.environ["ACM_ALERT_COMMAND"]))
+    return sinks
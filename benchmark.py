@@ -0,0 +1,192 @@
+import getopt
+import sys
+import threading
+import time
+import hal
+from modbusBlocks import plan_blocks, read_modbus_floats
+from spiPool import MAX31855, SpiPool, max31855_celsius
+from acquisition import AcquisitionEngine
+
+### ACQUISITION BENCHMARK ###
+# Runs the sensorsAq2.py channel set against the simulated devices in hal.py and
+# compares loop variants on the same workload:
+#
+#   sequential  every channel read inline, a new MAX31855 driver per read and one Modbus
+#               request per register (the original loops)
+#   blocks      every channel read inline, pooled thermocouples, coalesced meter blocks
+#   workers     per-bus worker threads (acquisition.py) over the pooled/block readers
+#
+# Each variant runs flat out for the given time and reports complete cycles (every reader
+# has produced a fresh value) and channel samples per second, read latency percentiles per
+# reader, error counts and CPU use.
+#
+# python benchmark.py [--seconds N] [--error-rate R] [--latency-scale S] [--replay FILE] [variant ...]
+
+METER_REGISTERS = [1000, 1002, 1004, 1010, 1012, 1014, 1034]
+CS_PINS = ["D17", "D27", "D22"]
+HYT939_ADDRESS = 0x28
+
+def percentile(values, fraction):
+    if not values:
+        return float("nan")
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+class Rig:
+    # The devices sensorsAq2.py builds, plus a latency log per reader
+    def __init__(self):
+        self.spi = hal.spi()
+        self.cs_pins = [hal.output_pin(pin) for pin in CS_PINS]
+        self.thermocouples = SpiPool(self.spi)
+        for cs in self.cs_pins:
+            self.thermocouples.add(cs, **MAX31855)
+        self.i2c = hal.i2c()
+        ads1 = hal.ads1115(self.i2c)
+        ads2 = hal.ads1115(self.i2c, address=0x49)
+        self.pressures = [hal.ads_channel(ads1, channel) for channel in range(3)]
+        self.e_shutdown = hal.ads_channel(ads2, 0)
+        self.smbus = hal.smbus(1)
+        self.instr = hal.modbus_instrument('/dev/ttySC0', 1)
+        self.blocks = plan_blocks(METER_REGISTERS)
+        self.latency = {}
+        self.samples = 0
+        self.errors = 0
+        self._lock = threading.Lock()
+
+    def timed(self, name, func):
+        def reader():
+            start = time.perf_counter()
+            try:
+                values = func()
+            except Exception:
+                with self._lock:
+                    self.errors += 1
+                raise
+            finally:
+                elapsed = time.perf_counter() - start
+                with self._lock:
+                    self.latency.setdefault(name, []).append(elapsed)
+            with self._lock:
+                self.samples += sum(value is not None for value in values)
+            return values
+        reader.__name__ = name
+        return reader
+
+    def read_temperatures(self):
+        temperatures = []
+        for cs in self.cs_pins:
+            cs.value = False
+            temperatures.append(hal.max31855(self.spi, cs).temperature)
+            cs.value = True
+        return temperatures
+
+    def read_temperatures_pooled(self):
+        return max31855_celsius(self.thermocouples.read())
+
+    def read_pressures(self):
+        return [channel.voltage for channel in self.pressures]
+
+    def read_e_shutdown(self):
+        return [self.e_shutdown.value]
+
+    def read_humidity(self):
+        return self.smbus.read_i2c_block_data(HYT939_ADDRESS, 0x00, 4)[:1]
+
+    def read_meter_registers(self):
+        values = []
+        for register in METER_REGISTERS:
+            value = None
+            for i in range(10):
+                try:
+                    value = round(self.instr.read_float(register, 3, 2), 4)
+                    break
+                except Exception:
+                    continue
+            values.append(value)
+        return values
+
+    def read_meter_blocks(self):
+        return read_modbus_floats(self.instr, METER_REGISTERS, self.blocks)
+
+    def readers(self, temperatures, meter):
+        return [self.timed("temperatures", temperatures),
+                self.timed("pressures", self.read_pressures),
+                self.timed("e_shutdown", self.read_e_shutdown),
+                self.timed("humidity", self.read_humidity),
+                self.timed("meter", meter)]
+
+def _guarded(reader):
+    try:
+        return reader()
+    except Exception:
+        return None
+
+### VARIANTS ###
+def run_inline(rig, seconds, temperatures, meter):
+    readers = rig.readers(temperatures, meter)
+    deadline = time.monotonic() + seconds
+    while time.monotonic() < deadline:
+        for reader in readers:
+            _guarded(reader)
+
+def run_sequential(rig, seconds):
+    return run_inline(rig, seconds, rig.read_temperatures, rig.read_meter_registers)
+
+def run_blocks(rig, seconds):
+    return run_inline(rig, seconds, rig.read_temperatures_pooled, rig.read_meter_blocks)
+
+def run_workers(rig, seconds, period=0.001):
+    temperatures, pressures, e_shutdown, humidity, meter = rig.readers(rig.read_temperatures_pooled, rig.read_meter_blocks)
+    engine = AcquisitionEngine()
+    engine.bus("spi").every(period, temperatures)
+    engine.bus("i2c").every(period, pressures)
+    engine.bus("i2c").every(period, e_shutdown)
+    engine.bus("i2c").every(period, humidity)
+    engine.bus("rs485").every(period, meter)
+    engine.start()
+    deadline = time.monotonic() + seconds
+    try:
+        # the record loop only copies the latest values, as the live scripts do
+        while time.monotonic() < deadline:
+            engine.snapshot()
+            time.sleep(0.05)
+    finally:
+        engine.stop()
+
+VARIANTS = {"sequential": run_sequential, "blocks": run_blocks, "workers": run_workers}
+
+def benchmark(name, seconds):
+    rig = Rig()
+    wall = time.perf_counter()
+    cpu = time.process_time()
+    VARIANTS[name](rig, seconds)
+    wall = time.perf_counter() - wall
+    cpu = time.process_time() - cpu
+    cycles = min(len(latencies) for latencies in rig.latency.values())
+    lines = ["{}: {:.1f} cycles/s, {:.1f} samples/s, {} errors, CPU {:.1f}%".format(
+        name, cycles / wall, rig.samples / wall, rig.errors, cpu / wall * 100)]
+    for reader, latencies in rig.latency.items():
+        lines.append("  {:<13} {:>6} reads  p50 {:7.2f} ms  p95 {:7.2f} ms  p99 {:7.2f} ms".format(
+            reader, len(latencies), percentile(latencies, 0.5) * 1000,
+            percentile(latencies, 0.95) * 1000, percentile(latencies, 0.99) * 1000))
+    return "\n".join(lines)
+
+if __name__ == "__main__":
+    opts, args = getopt.getopt(sys.argv[1:], "s:", ["seconds=", "error-rate=", "latency-scale=", "replay=", "sim"])
+    seconds = 5.0
+    settings = {"backend": "sim"}
+    for opt, arg in opts:
+        if opt in ("-s", "--seconds"):
+            seconds = float(arg)
+        elif opt == "--error-rate":
+            settings["error_rate"] = float(arg)
+        elif opt == "--latency-scale":
+            settings["latency_scale"] = float(arg)
+        elif opt == "--replay":
+            settings["replay"] = arg
+    hal.configure(**settings)
+    for name in args or list(VARIANTS):
+        if name not in VARIANTS:
+            print("unknown variant {}, choose from {}".format(name, ", ".join(VARIANTS)))
+            sys.exit(1)
+        print(benchmark(name, seconds))
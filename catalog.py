@@ -0,0 +1,176 @@
+import csv
+import glob
+import io
+import json
+import os
+import sys
+from bisect import bisect_right
+from datetime import datetime
+import compaction
+import schemas
+
+### DATASET CATALOG ###
+# Records, for every MM-DD-YYYY-data.csv / -runtime.csv in a directory, its header, row
+# count, first and last timestamp, plus a sparse index holding the byte offset of every
+# INDEX_EVERY-th row. A range query only opens the days that overlap the range and seeks
+# straight to the indexed row before the start. update() only reads the bytes appended
+# since the last scan, so keeping today's growing file indexed costs almost nothing. A
+# file that was replaced rather than appended to (another inode, another header line, or
+# shorter than what was scanned) is scanned again from the top.
+# Days compacted to .cdz files (compaction.py) are catalogued from their footer, and
+# their ranges are read through the time index of their chunks.
+
+CATALOG_FILE = "catalog.json"
+INDEX_EVERY = 600
+KINDS = ("data", "runtime")
+
+def parse_time(text):
+    return datetime.fromisoformat(text.strip().strip('"'))
+
+def _header_line(path):
+    with open(path, "rb") as file:
+        return file.readline(65536).decode(errors="replace")
+
+def file_day(path, kind):
+    name = os.path.splitext(os.path.basename(path))[0]
+    if not name.endswith("-" + kind):
+        return None
+    try:
+        return datetime.strptime(name[:-len("-" + kind)], "%m-%d-%Y").date()
+    except ValueError:
+        return None
+
+class Catalog:
+    def __init__(self, directory="."):
+        self.directory = directory
+        self.path = os.path.join(directory, CATALOG_FILE)
+        self.files = {}
+        if os.path.exists(self.path):
+            with open(self.path) as file:
+                self.files = json.load(file)["files"]
+
+    def update(self):
+        changed = False
+        seen = set()
+        for kind in KINDS:
+            for path in glob.glob(os.path.join(self.directory, "*-{}.csv".format(kind))):
+                day = file_day(path, kind)
+                if day is None:
+                    continue
+                name = os.path.basename(path)
+                seen.add(name)
+                entry = self.files.get(name)
+                stat = os.stat(path)
+                size = stat.st_size
+                if (entry is None or size < entry["size"] or entry.get("inode") != stat.st_ino
+                        or (entry["header"] is not None and entry.get("header_line") != _header_line(path))):
+                    entry = {"day": day.isoformat(), "kind": kind, "header": None, "header_line": None,
+                             "header_end": 0, "rows": 0, "first": None, "last": None, "size": 0,
+                             "inode": stat.st_ino, "index": []}
+                    self.files[name] = entry
+                    changed = True
+                if size > entry["size"]:
+                    self._scan(path, entry, size)
+                    changed = True
+            for path in glob.glob(os.path.join(self.directory, "*-{}{}".format(kind, compaction.EXTENSION))):
+                day = file_day(path, kind)
+                if day is None:
+                    continue
+                name = os.path.basename(path)
+                seen.add(name)
+                size = os.path.getsize(path)
+                if name not in self.files or self.files[name]["size"] != size:
+                    footer = compaction.read_footer(path)
+                    self.files[name] = {"day": day.isoformat(), "kind": kind, "header": footer["header"],
+                                        "rows": footer["rows"], "first": footer["first"], "last": footer["last"],
+                                        "size": size, "compacted": True, "index": []}
+                    changed = True
+        for name in list(self.files):
+            if name not in seen:
+                del self.files[name]
+                changed = True
+        if changed:
+            self.save()
+        return self
+
+    def _scan(self, path, entry, size):
+        with open(path, "rb") as file:
+            file.seek(entry["size"])
+            chunk = file.read(size - entry["size"])
+        # only complete lines are indexed; a half-written row is picked up next time
+        cut = chunk.rfind(b"\n") + 1
+        offset = entry["size"]
+        for line in chunk[:cut].splitlines(keepends=True):
+            if entry["header"] is None:
+                entry["header"] = next(csv.reader([line.decode()]))
+                entry["header_line"] = line.decode(errors="replace")
+                entry["header_end"] = offset + len(line)
+            elif line.strip():
+                try:
+                    stamp = parse_time(line.split(b",", 1)[0].decode())
+                except ValueError:
+                    offset += len(line)
+                    continue
+                if entry["rows"] % INDEX_EVERY == 0:
+                    entry["index"].append([stamp.isoformat(), offset])
+                if entry["first"] is None:
+                    entry["first"] = stamp.isoformat()
+                entry["last"] = stamp.isoformat()
+                entry["rows"] += 1
+            offset += len(line)
+        entry["size"] = offset
+
+    def save(self):
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w") as file:
+            json.dump({"files": self.files}, file)
+        os.replace(tmp_path, self.path)
+
+    def days(self, start, end, kind="data"):
+        # Catalogued files overlapping [start, end], oldest first
+        names = [name for name, entry in self.files.items()
+                 if entry["kind"] == kind and entry["first"] is not None
+                 and entry["first"] <= end.isoformat() and entry["last"] >= start.isoformat()]
+        return sorted(names, key=lambda name: self.files[name]["first"])
+
+    def read_range(self, start, end, columns=None, kind="data"):
+        import pandas as pd
+        frames = []
+        for name in self.days(start, end, kind):
+            frames.append(self._read_file(name, start, end, columns))
+        if not frames:
+            return pd.DataFrame()
+        return pd.concat(frames, ignore_index=True)
+
+    def _read_file(self, name, start, end, columns):
+        import pandas as pd
+        entry = self.files[name]
+        if entry.get("compacted"):
+            return compaction.load(os.path.join(self.directory, name), columns, start, end)
+        stamps = [stamp for stamp, offset in entry["index"]]
+        # start at the last indexed row at or before `start`, stop at the first one after `end`
+        first = bisect_right(stamps, start.isoformat()) - 1
+        after = bisect_right(stamps, end.isoformat())
+        begin = entry["index"][first][1] if first >= 0 else entry["header_end"]
+        stop = entry["index"][after][1] if after < len(entry["index"]) else entry["size"]
+        with open(os.path.join(self.directory, name), "rb") as file:
+            file.seek(begin)
+            chunk = file.read(stop - begin)
+        header = entry["header"]
+        time_column = header[0]
+        # values some scripts write past the end of their header get the registry's names
+        generation = schemas.identify(header)
+        names = generation.layout if generation is not None and generation.header == header else header
+        usecols = None if columns is None else [time_column] + [column for column in columns if column in names]
+        data = pd.read_csv(io.BytesIO(chunk), header=None, names=names, usecols=usecols, index_col=False)
+        data[time_column] = pd.to_datetime(data[time_column], format="ISO8601")
+        data = data[(data[time_column] >= start) & (data[time_column] <= end)]
+        return data.reset_index(drop=True)
+
+if __name__ == "__main__":
+    # python catalog.py [directory]  -- update the catalog and list what it holds
+    catalog = Catalog(sys.argv[1] if len(sys.argv) > 1 else ".").update()
+    for name in sorted(catalog.files, key=lambda name: (catalog.files[name]["day"], name)):
+        entry = catalog.files[name]
+        print("{}: {} rows, {} to {}, {} columns, {} index points".format(
+            name, entry["rows"], entry["first"], entry["last"], len(entry["header"] or []), len(entry["index"])))
@@ -0,0 +1,226 @@
+import json
+import os
+import time
+from array import array
+from datetime import date, datetime, timedelta
+import schemas
+
+### COLUMNAR DAY STORE ###
+# Each day is a directory (e.g. 06-14-2024-data.col/) holding schema.json and one raw
+# little-endian file per column: int64 epoch nanoseconds for the timestamp, float32 for
+# numeric channels and int8 category codes for text channels such as Location or
+# E-Shutdown. Every file is a plain array, so readers can memory-map them straight into
+# NumPy/pandas without parsing. Timestamps keep the naive local wall-clock time the CSVs
+# use, so both formats load to the same values.
+# Values are matched to the schema by column name. A header that gains a column part way
+# through a day adds its file filled with missing values (NaN, or code -1) for the rows
+# already stored, and columns the header no longer has get missing values from then on,
+# so every column file stays as long as the time file.
+
+EPOCH = datetime(1970, 1, 1)
+MISSING = {"f4": array("f", [float("nan")]).tobytes(), "i1": array("b", [-1]).tobytes()}
+TIME_FILE = "time.i8"
+SCHEMA_FILE = "schema.json"
+
+def to_epoch_ns(when):
+    return (when - EPOCH) // timedelta(microseconds=1) * 1000
+
+def day_path(directory, day, suffix="data", date_format="%m-%d-%Y"):
+    return os.path.join(directory, "{}-{}.col".format(day.strftime(date_format), suffix))
+
+def _number(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return float("nan")
+
+def _whole_values(path, itemsize):
+    # Values stored in a column file, a torn last value is cut off
+    if not os.path.exists(path):
+        return 0
+    count, torn = divmod(os.path.getsize(path), itemsize)
+    if torn:
+        os.truncate(path, count * itemsize)
+    return count
+
+### WRITER ###
+class DailyColumnSink:
+    # Same interface as csvSink.DailyCsvSink: write(row), flush(), close()
+    def __init__(self, suffix, header, directory=".", text_columns=(), flush_rows=60, flush_interval=60.0,
+                 fsync=True, date_format="%m-%d-%Y"):
+        self.suffix = suffix
+        self.header = header
+        self.text_columns = text_columns
+        self.directory = directory
+        self.flush_rows = flush_rows
+        self.flush_interval = flush_interval
+        self.fsync = fsync
+        self.date_format = date_format
+        self.path = None
+        self._key = None
+        self._schema = None
+        self._positions = None
+        self._files = None
+        self._buffers = None
+        self._pending = 0
+        self._last_flush = time.monotonic()
+
+    def write(self, row, when=None):
+        if when is None:
+            when = row[0] if isinstance(row[0], (datetime, date)) else datetime.now()
+        key = when.strftime(self.date_format)
+        if key != self._key:
+            self._rotate(when, key, row)
+        self._buffers[0].append(to_epoch_ns(row[0]))
+        for column, buffer, index in zip(self._schema["columns"], self._buffers[1:], self._positions):
+            value = row[index] if index is not None and index < len(row) else None
+            if column["dtype"] == "i1":
+                buffer.append(self._code(column, value))
+            else:
+                buffer.append(_number(value))
+        self._pending += 1
+        if self._pending >= self.flush_rows or time.monotonic() - self._last_flush >= self.flush_interval:
+            self.flush()
+
+    def flush(self):
+        if self._files is None:
+            return
+        for file, buffer in zip(self._files, self._buffers):
+            file.write(buffer.tobytes())
+            del buffer[:]
+            file.flush()
+            if self.fsync:
+                os.fsync(file.fileno())
+        self._pending = 0
+        self._last_flush = time.monotonic()
+
+    def close(self):
+        if self._files is not None:
+            self.flush()
+            for file in self._files:
+                file.close()
+        self._files = None
+        self._buffers = None
+        self._key = None
+
+    def _code(self, column, value):
+        if value is None:
+            return -1
+        labels = column["labels"]
+        value = str(value)
+        if value not in labels:
+            labels.append(value)
+            self._save_schema()
+        return labels.index(value)
+
+    def _rotate(self, when, key, row):
+        self.close()
+        self.path = day_path(self.directory, when, self.suffix, self.date_format)
+        schema_path = os.path.join(self.path, SCHEMA_FILE)
+        existed = os.path.exists(schema_path)
+        if existed:
+            with open(schema_path) as file:
+                self._schema = json.load(file)
+        else:
+            os.makedirs(self.path, exist_ok=True)
+            self._schema = {"timestamp": self.header[0], "time_file": TIME_FILE, "columns": [],
+                            "generation": schemas.stamp(self.header)}
+        columns = self._schema["columns"]
+        known = set(column["name"] for column in columns)
+        added = [(name, value) for name, value in zip(self.header[1:], row[1:]) if name not in known]
+        for name, value in added:
+            if name in self.text_columns or isinstance(value, str):
+                columns.append({"name": name, "file": "c{:02d}.i1".format(len(columns)), "dtype": "i1", "labels": []})
+            else:
+                columns.append({"name": name, "file": "c{:02d}.f4".format(len(columns)), "dtype": "f4"})
+        if added or not existed:
+            if existed:
+                print("{} gains columns {}, earlier rows get missing values".format(self.path, [name for name, value in added]))
+            self._save_schema()
+        self._align()
+        position = {name: index for index, name in enumerate(self.header)}
+        self._positions = [position.get(column["name"]) for column in columns]
+        self._files = [open(os.path.join(self.path, TIME_FILE), "ab")]
+        self._buffers = [array("q")]
+        for column in self._schema["columns"]:
+            self._files.append(open(os.path.join(self.path, column["file"]), "ab"))
+            self._buffers.append(array("b") if column["dtype"] == "i1" else array("f"))
+        self._key = key
+        self._last_flush = time.monotonic()
+
+    def _align(self):
+        # Bring every column file to the length of the time file: columns added today are
+        # filled for the rows already stored, and a flush interrupted between files is
+        # completed with missing values (or cut back to the last whole timestamp)
+        rows = _whole_values(os.path.join(self.path, TIME_FILE), 8)
+        for column in self._schema["columns"]:
+            path = os.path.join(self.path, column["file"])
+            missing = MISSING[column["dtype"]]
+            stored = _whole_values(path, len(missing))
+            if stored > rows:
+                os.truncate(path, rows * len(missing))
+            elif stored < rows:
+                with open(path, "ab") as file:
+                    file.write(missing * (rows - stored))
+
+    def _save_schema(self):
+        tmp_path = os.path.join(self.path, SCHEMA_FILE + ".tmp")
+        with open(tmp_path, "w") as file:
+            json.dump(self._schema, file, indent=1)
+        os.replace(tmp_path, os.path.join(self.path, SCHEMA_FILE))
+
+### READERS ###
+# NumPy and pandas are only imported here, the acquisition side only needs the writer
+def _map(path, dtype):
+    import numpy as np
+    # only whole values, a flush in progress can leave part of one at the end
+    count = os.path.getsize(path) // np.dtype(dtype).itemsize
+    if count == 0:
+        return np.zeros(0, dtype)
+    return np.memmap(path, dtype=dtype, mode="r", shape=(count,))
+
+def load_day(path, columns=None):
+    # Memory-map one day. Columns are views on the files, so nothing is copied until
+    # the caller modifies or concatenates them.
+    import numpy as np
+    import pandas as pd
+    with open(os.path.join(path, SCHEMA_FILE)) as file:
+        schema = json.load(file)
+    wanted = [column for column in schema["columns"] if columns is None or column["name"] in columns]
+    times = _map(os.path.join(path, schema["time_file"]), "<i8")
+    arrays = [_map(os.path.join(path, column["file"]), "<" + column["dtype"]) for column in wanted]
+    # A writer interrupted mid-flush can leave a column file short; the writer completes
+    # it when it reopens the day, until then the missing values read as NaN
+    rows = len(times)
+    data = {schema["timestamp"]: times.view("datetime64[ns]")}
+    for column, values in zip(wanted, arrays):
+        if len(values) < rows:
+            values = np.concatenate([values, np.full(rows - len(values), -1 if column["dtype"] == "i1" else np.nan,
+                                                     values.dtype)])
+        if column["dtype"] == "i1":
+            data[column["name"]] = pd.Categorical.from_codes(values[:rows], column["labels"])
+        else:
+            data[column["name"]] = values[:rows]
+    return pd.DataFrame(data, copy=False)
+
+def list_days(directory, suffix="data", date_format="%m-%d-%Y"):
+    ending = "-{}.col".format(suffix)
+    days = []
+    for name in os.listdir(directory):
+        if name.endswith(ending):
+            try:
+                days.append(datetime.strptime(name[:-len(ending)], date_format).date())
+            except ValueError:
+                continue
+    return sorted(days)
+
+def load_range(directory, start, end, columns=None, suffix="data"):
+    # Load every stored day from start to end (inclusive dates) into one frame
+    import pandas as pd
+    frames = [load_day(day_path(directory, day, suffix), columns)
+              for day in list_days(directory, suffix) if start <= day <= end]
+    if not frames:
+        return pd.DataFrame()
+    if len(frames) == 1:
+        return frames[0]
+    return pd.concat(frames, ignore_index=True)
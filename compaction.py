@@ -0,0 +1,416 @@
+import csv
+import getopt
+import json
+import os
+import shutil
+import struct
+import subprocess
+import sys
+import time
+import zlib
+from datetime import date, datetime, timedelta
+import schemas
+
+### COMPACTION OF CLOSED DAYS ###
+# A closed day (before today, untouched for SETTLE_SECONDS) is rewritten from
+# MM-DD-YYYY-data.csv / -runtime.csv to a compressed .cdz file of the same name. Rows are
+# cut into chunks of CHUNK_ROWS, and inside a chunk every column is its own zlib block:
+#
+#   time     int64 epoch nanoseconds
+#   int      int64
+#   decimal  int64 of value * 10**decimals, for numbers written with at most MAX_DECIMALS
+#            places; divided back they give the exact float64 pandas parses from the text
+#   float    float64, anything else
+#   text     int8/int16 codes into the labels kept in the footer (-1 for a blank)
+#
+# Integer columns are delta-encoded, so a steady cadence or a slowly moving channel turns
+# into small numbers, and every block is byte-shuffled before compression so the nearly
+# constant high-order bytes sit next to each other. The file ends with a JSON footer (header,
+# column types, labels, and per chunk its rows, first and last timestamp and block
+# offsets), the footer length and the magic again. A range read only decompresses the
+# chunks and columns it needs. The CSV is deleted only after the new file loads back
+# equal to a fresh pandas parse of the CSV.
+#
+# Retention deletes raw days (-data.csv, -data.cdz and the .col store) older than
+# RETENTION_DAYS, and only once their month has rollups. Rollups and runtime files are
+# kept forever.
+
+MAGIC = b"ACMCDZ1\n"
+EXTENSION = ".cdz"
+CHUNK_ROWS = 3600
+LEVEL = 6
+MAX_DECIMALS = 6
+MISSING = -2 ** 63      # NaT, and a blank in an int64 coded number
+SETTLE_SECONDS = 900
+COMPACT_PERIOD = 3600.0
+KINDS = ("data", "runtime")
+DATE_FORMAT = "%m-%d-%Y"
+EPOCH = datetime(1970, 1, 1)
+# 0 keeps raw days forever
+RETENTION_DAYS = int(os.environ.get("ACM_RETENTION_DAYS", "365"))
+
+def compacted_path(path):
+    return os.path.splitext(path)[0] + EXTENSION
+
+def file_day(path, kind="data"):
+    name = os.path.basename(path)
+    for extension in (".csv", EXTENSION):
+        ending = "-{}{}".format(kind, extension)
+        if name.endswith(ending):
+            try:
+                return datetime.strptime(name[:-len(ending)], DATE_FORMAT).date()
+            except ValueError:
+                return None
+    return None
+
+def day_files(directory, kind="data"):
+    # [(day, path)] oldest first. A day written to again after it was compacted has both
+    # files; the .cdz holds the older rows, so it comes first.
+    files = []
+    for name in os.listdir(directory):
+        day = file_day(name, kind)
+        if day is not None:
+            files.append((day, name.endswith(".csv"), os.path.join(directory, name)))
+    return [(day, path) for day, is_csv, path in sorted(files)]
+
+def _layout(header):
+    # values some scripts write past the end of their header get the registry's names
+    generation = schemas.identify(header)
+    return generation.layout if generation is not None and generation.header == header else header
+
+### ENCODING ###
+def _shuffle(values):
+    import numpy as np
+    return np.ascontiguousarray(values).view(np.uint8).reshape(len(values), -1).T.tobytes()
+
+def _unshuffle(data, dtype, rows):
+    import numpy as np
+    return np.frombuffer(data, np.uint8).reshape(-1, rows).T.copy().view(dtype).reshape(rows)
+
+def _typed(series, is_time):
+    # (type, values, labels or decimals) of a column; text that parses as numbers everywhere is numeric
+    import numpy as np
+    import pandas as pd
+    if is_time:
+        if not pd.api.types.is_datetime64_any_dtype(series):
+            series = pd.to_datetime(series, format="ISO8601", errors="coerce")
+        return "time", series.to_numpy("datetime64[ns]").view("i8"), None
+    if pd.api.types.is_integer_dtype(series) and not series.isna().any():
+        return "int", series.to_numpy("i8"), None
+    if pd.api.types.is_numeric_dtype(series) and not pd.api.types.is_bool_dtype(series):
+        return _float(series.to_numpy("f8", na_value=np.nan))
+    present = series.notna()
+    numbers = pd.to_numeric(series.astype(object), errors="coerce")
+    if (numbers.notna() | ~present).all():
+        if present.all() and series.astype(str).str.fullmatch(r"[+-]?\d{1,18}").all():
+            return "int", numbers.to_numpy("i8"), None
+        return _float(numbers.to_numpy("f8", na_value=np.nan))
+    codes, labels = pd.factorize(series.astype(object))
+    dtype = "i1" if len(labels) < 128 else "i2" if len(labels) < 32768 else "i4"
+    return "text", codes.astype(dtype), [str(label) for label in labels]
+
+def _float(values):
+    # Smallest number of decimal places that reproduces every value exactly
+    import numpy as np
+    present = ~np.isnan(values)
+    finite = values[present]
+    if np.isfinite(finite).all() and (len(finite) == 0 or np.abs(finite).max() < 1e12):
+        for decimals in range(MAX_DECIMALS + 1):
+            scaled = np.round(finite * 10.0 ** decimals)
+            if (scaled / 10.0 ** decimals == finite).all():
+                coded = np.full(len(values), MISSING, "i8")
+                coded[present] = scaled.astype("i8")
+                return "decimal", coded, decimals
+    return "float", values, None
+
+def _encode(kind, values):
+    if kind != "float" and kind != "text":
+        values = values.copy()
+        values[1:] = values[1:] - values[:-1]   # wraps around MISSING, the cumsum wraps back
+    return zlib.compress(_shuffle(values), LEVEL)
+
+def _decode(column, data, rows):
+    import numpy as np
+    values = _unshuffle(zlib.decompress(data), "<" + column["dtype"], rows)
+    if column["type"] == "float" or column["type"] == "text":
+        return values
+    values = np.cumsum(values, dtype="i8")
+    if column["type"] == "decimal":
+        missing = values == MISSING
+        values = values / 10.0 ** column["decimals"]
+        values[missing] = np.nan
+    return values
+
+def write_frame(data, path, header, kind, source=None):
+    # Writes the frame as one .cdz file, through a temporary file and a rename
+    columns = []
+    arrays = []
+    for index, name in enumerate(data.columns):
+        column_type, values, extra = _typed(data[name], index == 0)
+        column = {"name": name, "type": column_type, "dtype": values.dtype.str[1:]}
+        if column_type == "text":
+            column["labels"] = extra
+        elif column_type == "decimal":
+            column["decimals"] = extra
+        columns.append(column)
+        arrays.append(values.astype("<" + column["dtype"], copy=False))
+    chunks = []
+    rows = len(data)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as file:
+        file.write(MAGIC)
+        for begin in range(0, rows, CHUNK_ROWS):
+            stamps = arrays[0][begin:begin + CHUNK_ROWS]
+            valid = stamps[stamps != MISSING]
+            blocks = []
+            for column, values in zip(columns, arrays):
+                block = _encode(column["type"], values[begin:begin + CHUNK_ROWS])
+                blocks.append([file.tell(), len(block)])
+                file.write(block)
+            chunks.append({"rows": len(stamps), "first": int(valid.min()) if len(valid) else None,
+                           "last": int(valid.max()) if len(valid) else None, "blocks": blocks})
+        stamps = [chunk[edge] for chunk in chunks for edge in ("first", "last") if chunk[edge] is not None]
+        footer = {"kind": kind, "header": header, "generation": schemas.stamp(header), "rows": rows,
+                  "first": _iso(min(stamps)) if stamps else None, "last": _iso(max(stamps)) if stamps else None,
+                  "columns": columns, "chunks": chunks, "source": source}
+        encoded = json.dumps(footer).encode()
+        file.write(encoded)
+        file.write(struct.pack(">Q", len(encoded)))
+        file.write(MAGIC)
+        file.flush()
+        os.fsync(file.fileno())
+    return tmp_path
+
+def _iso(nanoseconds):
+    # same text as the catalog's datetime.isoformat() for CSV days
+    return (EPOCH + timedelta(microseconds=nanoseconds // 1000)).isoformat()
+
+### READING ###
+def read_footer(path):
+    with open(path, "rb") as file:
+        return _footer(file)
+
+def _footer(file):
+    file.seek(-(8 + len(MAGIC)), os.SEEK_END)
+    tail = file.read()
+    if tail[8:] != MAGIC:
+        raise ValueError("{} is not a complete {} file".format(file.name, EXTENSION))
+    length = struct.unpack(">Q", tail[:8])[0]
+    file.seek(-(8 + len(MAGIC) + length), os.SEEK_END)
+    return json.loads(file.read(length))
+
+def load(path, columns=None, start=None, end=None):
+    # One compacted day with its original column names; with start/end only the chunks
+    # overlapping the range are decompressed
+    import numpy as np
+    import pandas as pd
+    with open(path, "rb") as file:
+        footer = _footer(file)
+        wanted = [(index, column) for index, column in enumerate(footer["columns"])
+                  if index == 0 or columns is None or column["name"] in columns]
+        chunks = footer["chunks"]
+        if start is not None or end is not None:
+            low = _nanoseconds(start) if start is not None else np.iinfo("i8").min
+            high = _nanoseconds(end) if end is not None else np.iinfo("i8").max
+            chunks = [chunk for chunk in chunks
+                      if chunk["first"] is not None and chunk["last"] >= low and chunk["first"] <= high]
+        parts = {index: [] for index, column in wanted}
+        for chunk in chunks:
+            for index, column in wanted:
+                offset, length = chunk["blocks"][index]
+                file.seek(offset)
+                parts[index].append(_decode(column, file.read(length), chunk["rows"]))
+    data = {}
+    for index, column in wanted:
+        values = np.concatenate(parts[index]) if parts[index] else np.zeros(0, "<" + column["dtype"])
+        if column["type"] == "time":
+            data[column["name"]] = values.view("datetime64[ns]")
+        elif column["type"] == "text":
+            data[column["name"]] = pd.Categorical.from_codes(values, column["labels"])
+        else:
+            data[column["name"]] = values
+    data = pd.DataFrame(data, copy=False)
+    if start is not None or end is not None:
+        stamps = data[footer["columns"][0]["name"]]
+        keep = stamps.notna()
+        if start is not None:
+            keep &= stamps >= start
+        if end is not None:
+            keep &= stamps <= end
+        data = data[keep].reset_index(drop=True)
+    return data
+
+def _nanoseconds(when):
+    import pandas as pd
+    return pd.Timestamp(when).as_unit("ns").value
+
+def read_csv_day(path, dtype=None):
+    import pandas as pd
+    with open(path, newline="") as file:
+        header = next(csv.reader(file))
+    data = pd.read_csv(path, header=None, skiprows=1, names=_layout(header), index_col=False,
+                       dtype=dtype, low_memory=False)
+    return header, data
+
+def read_day(path, columns=None):
+    # A day file in either format, timestamp column parsed
+    import pandas as pd
+    if path.endswith(EXTENSION):
+        return load(path, columns)
+    header, data = read_csv_day(path)
+    if columns is not None:
+        data = data[[data.columns[0]] + [column for column in data.columns[1:] if column in columns]]
+    time_column = data.columns[0]
+    data[time_column] = pd.to_datetime(data[time_column], format="ISO8601", errors="coerce")
+    return data
+
+### COMPACTION ###
+def _same(expected, actual):
+    import numpy as np
+    import pandas as pd
+    if list(expected.columns) != list(actual.columns) or len(expected) != len(actual):
+        return False
+    for name in expected.columns:
+        left, right = expected[name], actual[name]
+        if pd.api.types.is_datetime64_any_dtype(left):
+            same = np.array_equal(left.to_numpy("datetime64[ns]").view("i8"), right.to_numpy("datetime64[ns]").view("i8"))
+        elif pd.api.types.is_numeric_dtype(left) and pd.api.types.is_numeric_dtype(right):
+            same = np.array_equal(left.to_numpy("f8", na_value=np.nan), right.to_numpy("f8", na_value=np.nan),
+                                  equal_nan=True)
+        else:
+            same = ([None if value is None or value != value else str(value) for value in left.astype(object)] ==
+                    [None if value is None or value != value else str(value) for value in right.astype(object)])
+        if not same:
+            return False
+    return True
+
+def compact_file(path, kind):
+    # Returns (bytes before, bytes after); raises ValueError when the day cannot be compacted
+    import pandas as pd
+    target = compacted_path(path)
+    header, text = read_csv_day(path, dtype=str)
+    time_column = text.columns[0]
+    text[time_column] = pd.to_datetime(text[time_column], format="ISO8601", errors="coerce")
+    reference = read_day(path)
+    before = os.path.getsize(path)
+    if os.path.exists(target):
+        # the day was written to again after it was compacted: merge the new rows in
+        if read_footer(target)["header"] != header:
+            raise ValueError("header differs from the compacted day")
+        existing = load(target)
+        before += os.path.getsize(target)
+        text = pd.concat([existing, text], ignore_index=True)
+        reference = pd.concat([existing, reference], ignore_index=True)
+    tmp_path = write_frame(text, target, header, kind, source=os.path.basename(path))
+    if not _same(reference, load(tmp_path)):
+        os.remove(tmp_path)
+        raise ValueError("round trip mismatch, CSV kept")
+    os.replace(tmp_path, target)
+    _sync_directory(os.path.dirname(target))
+    os.remove(path)
+    return before, os.path.getsize(target)
+
+def _sync_directory(directory):
+    # the rename must be on the card before the CSV goes
+    descriptor = os.open(directory or ".", os.O_RDONLY)
+    try:
+        os.fsync(descriptor)
+    finally:
+        os.close(descriptor)
+
+def _closed(day, path, today, now):
+    return day < today and os.path.getmtime(path) < now - SETTLE_SECONDS
+
+def _has_rollups(directory, day):
+    from rollups import RESOLUTIONS
+    return all(os.path.exists(os.path.join(directory, "{}-rollup-{}.csv".format(day.strftime("%m-%Y"), name)))
+               for name in RESOLUTIONS)
+
+def _expired(directory, retention_days, today):
+    # Raw day files and .col directories past the retention period
+    from colStore import day_path, list_days
+    if retention_days <= 0:
+        return []
+    cutoff = today - timedelta(days=retention_days)
+    expired = [(day, path) for day, path in day_files(directory, "data") if day < cutoff]
+    expired.extend((day, day_path(directory, day)) for day in list_days(directory) if day < cutoff)
+    return sorted(expired)
+
+def pending(directory=".", retention_days=RETENTION_DAYS, today=None):
+    # Cheap directory listing check, so the hourly task only starts a process with work to do
+    today = today or date.today()
+    now = time.time()
+    for kind in KINDS:
+        for day, path in day_files(directory, kind):
+            if path.endswith(".csv") and _closed(day, path, today, now):
+                return True
+    return any(_has_rollups(directory, day) for day, path in _expired(directory, retention_days, today))
+
+def compact_directory(directory=".", retention_days=RETENTION_DAYS, today=None):
+    today = today or date.today()
+    now = time.time()
+    for kind in KINDS:
+        for day, path in day_files(directory, kind):
+            if not path.endswith(".csv") or not _closed(day, path, today, now):
+                continue
+            began = time.perf_counter()
+            try:
+                before, after = compact_file(path, kind)
+            except (ValueError, OSError) as error:
+                print("compaction: kept {}: {}".format(path, error))
+                continue
+            print("compaction: {} {:.1f} MB -> {:.1f} MB ({:.1f}x) in {:.1f} s".format(
+                os.path.basename(path), before / 1e6, after / 1e6, before / max(after, 1), time.perf_counter() - began))
+    for day, path in _expired(directory, retention_days, today):
+        if not _has_rollups(directory, day):
+            print("compaction: kept {}, its month has no rollups".format(path))
+            continue
+        if os.path.isdir(path):
+            shutil.rmtree(path)
+        else:
+            os.remove(path)
+        print("compaction: removed {} (older than {} days)".format(path, retention_days))
+
+### BACKGROUND JOB ###
+def lower_priority():
+    # Lowest CPU priority, and the idle I/O class so the logger's writes always go first
+    try:
+        os.nice(19)
+        os.sched_setscheduler(0, os.SCHED_IDLE, os.sched_param(0))
+    except (AttributeError, OSError):
+        pass
+    if shutil.which("ionice"):
+        subprocess.call(["ionice", "-c", "3", "-p", str(os.getpid())])
+
+class BackgroundCompaction:
+    # Scheduler task for the acquisition scripts: at most one low-priority compaction
+    # process at a time, started only when a closed day or an expired one is waiting
+    def __init__(self, directory=".", retention_days=RETENTION_DAYS):
+        self.directory = directory
+        self.retention_days = retention_days
+        self.process = None
+        self.runs = 0
+
+    def run(self):
+        if self.process is not None and self.process.poll() is None:
+            return
+        if not pending(self.directory, self.retention_days):
+            return
+        self.process = subprocess.Popen([sys.executable, os.path.abspath(__file__), "--retention",
+                                         str(self.retention_days), self.directory], start_new_session=True)
+        self.runs += 1
+
+    def report(self):
+        state = "running" if self.process is not None and self.process.poll() is None else "idle"
+        return "compaction: {}, {} runs".format(state, self.runs)
+
+if __name__ == "__main__":
+    # python compaction.py [--retention DAYS] [directory ...]
+    opts, args = getopt.getopt(sys.argv[1:], "r:", ["retention="])
+    retention_days = RETENTION_DAYS
+    for opt, arg in opts:
+        if opt in ("-r", "--retention"):
+            retention_days = int(arg)
+    lower_priority()
+    for directory in args or ["."]:
+        compact_directory(directory, retention_days)
@@ -0,0 +1,106 @@
+import csv
+import os
+import time
+from datetime import date, datetime
+
+### DAILY CSV SINK ###
+# Keeps the day's file open and lets the csv writer batch rows in the file buffer.
+# Rows are pushed to the SD card every `flush_rows` rows or `flush_interval` seconds,
+# whichever comes first. The file a row lands in is picked from the row's own timestamp,
+# and the old day is flushed, synced and closed before the new one is opened, so a row
+# written around midnight is never lost or written twice. A file started with other
+# columns (the script restarted with other options, e.g. -v) keeps them: rows are written
+# in the file's column order, blank in columns this sink lacks, and columns the file lacks
+# start with the next file.
+
+class DailyCsvSink:
+    def __init__(self, suffix, header, directory=".", flush_rows=10, flush_interval=10.0,
+                 fsync=True, date_format="%m-%d-%Y"):
+        self.suffix = suffix
+        self.header = header
+        self.directory = directory
+        self.flush_rows = flush_rows
+        self.flush_interval = flush_interval
+        self.fsync = fsync
+        self.date_format = date_format
+        self.path = None
+        self._key = None
+        self._file = None
+        self._writer = None
+        self._columns = None    # row index of each file column, when the file's header differs
+        self._pending = 0
+        self._last_flush = time.monotonic()
+
+    def path_for(self, day):
+        return os.path.join(self.directory, "{}-{}.csv".format(day.strftime(self.date_format), self.suffix))
+
+    def write(self, row, when=None):
+        if when is None:
+            when = row[0] if isinstance(row[0], (datetime, date)) else date.today()
+        key = when.strftime(self.date_format)
+        if key != self._key:
+            self._rotate(when, key)
+        if self._columns is not None:
+            # values past the end of the header (sensorsAq.py) stay at the end
+            row = [row[index] if index is not None else None for index in self._columns] + list(row[len(self.header):])
+        self._writer.writerow(row)
+        self._pending += 1
+        if self._pending >= self.flush_rows or time.monotonic() - self._last_flush >= self.flush_interval:
+            self.flush()
+
+    def flush(self):
+        if self._file is None:
+            return
+        self._file.flush()
+        if self.fsync:
+            os.fsync(self._file.fileno())
+        self._pending = 0
+        self._last_flush = time.monotonic()
+
+    def close(self):
+        if self._file is not None:
+            self.flush()
+            self._file.close()
+        self._file = None
+        self._writer = None
+        self._key = None
+
+    def _rotate(self, when, key):
+        self.close()
+        path = self.path_for(when)
+        self._columns = None
+        if not os.path.exists(path) or os.path.getsize(path) == 0:
+            self._create(path)
+        else:
+            self._adopt(path)
+        self._file = open(path, "a", newline="")
+        self._writer = csv.writer(self._file)
+        self._key = key
+        self.path = path
+        self._last_flush = time.monotonic()
+
+    def _adopt(self, path):
+        # The file keeps the columns it was started with: readers (catalog.py, tailReader.py)
+        # rely on day files only ever growing by appended rows
+        with open(path, newline="") as file:
+            header = next(csv.reader(file), [])
+        names = [str(name) for name in self.header]
+        if header == names:
+            return
+        dropped = [name for name in names[1:] if name not in header]
+        print("{} was started with other columns; writing its {} columns{}".format(
+            path, len(header), ", {} left out until the next file".format(dropped) if dropped else ""))
+        position = {name: index for index, name in enumerate(names)}
+        self._columns = [position.get(name) for name in header]
+
+    def _create(self, path):
+        # Write the header to a temporary file and move it into place, so the day's file
+        # either doesn't exist or starts with exactly one complete header
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w", newline="") as file:
+            csv.writer(file).writerow(self.header)
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(tmp_path, path)
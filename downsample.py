@@ -0,0 +1,72 @@
+import numpy as np
+
+### PLOT DOWNSAMPLING ###
+# A chart can only show about one point per horizontal pixel, so long series are cut
+# down to roughly that many points before they are sent to the browser. The default
+# keeps the minimum and maximum of every bucket so short spikes stay visible; LTTB gives
+# a smoother shape for slowly changing channels. Series that already fit are untouched,
+# so zooming into a short window brings back the raw samples.
+
+PLOT_POINTS = 1500
+
+def minmax_indices(values, buckets):
+    values = np.asarray(values, dtype=float)
+    size = -(-len(values) // buckets)
+    padded = np.full(size * buckets, np.nan)
+    padded[:len(values)] = values
+    blocks = padded.reshape(buckets, size)
+    missing = np.isnan(blocks)
+    low = np.where(missing, np.inf, blocks).argmin(axis=1)
+    high = np.where(missing, -np.inf, blocks).argmax(axis=1)
+    offsets = np.arange(buckets) * size
+    indices = np.concatenate([offsets + low, offsets + high])
+    return np.unique(indices[indices < len(values)])
+
+def lttb_indices(x, y, points):
+    # Largest-Triangle-Three-Buckets: keep the first and last sample and, from each bucket
+    # in between, the sample forming the largest triangle with its neighbours
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    y = np.where(np.isnan(y), np.nanmean(y) if not np.isnan(y).all() else 0.0, y)
+    edges = np.linspace(1, len(y) - 1, points - 1).astype(int)
+    selected = np.empty(points, dtype=int)
+    selected[0] = 0
+    selected[-1] = len(y) - 1
+    previous = 0
+    for bucket in range(points - 2):
+        start, stop = edges[bucket], edges[bucket + 1]
+        next_stop = edges[bucket + 2] if bucket + 2 < len(edges) else len(y)
+        next_x = x[stop:next_stop].mean() if next_stop > stop else x[-1]
+        next_y = y[stop:next_stop].mean() if next_stop > stop else y[-1]
+        area = np.abs((x[previous] - next_x) * (y[start:stop] - y[previous])
+                      - (x[previous] - x[start:stop]) * (next_y - y[previous]))
+        previous = start + int(area.argmax()) if stop > start else start
+        selected[bucket + 1] = previous
+    return np.unique(selected)
+
+def _axis(series):
+    if np.issubdtype(series.dtype, np.datetime64):
+        return series.to_numpy().astype("datetime64[ns]").astype(np.int64)
+    return series.to_numpy(dtype=float)
+
+def downsample_frame(data, x, columns, points=PLOT_POINTS, method="minmax"):
+    # Keep the rows any of the plotted columns needs, so px.line can still draw every
+    # metric against one shared x axis
+    if len(data) <= points or not columns:
+        return data
+    keep = []
+    for column in columns:
+        if method == "lttb":
+            keep.append(lttb_indices(_axis(data[x]), data[column].to_numpy(dtype=float, na_value=np.nan), points))
+        else:
+            keep.append(minmax_indices(data[column].to_numpy(dtype=float, na_value=np.nan), points // 2))
+    return data.iloc[np.unique(np.concatenate(keep))]
+
+def window(data, x, start=None, end=None):
+    # Rows inside [start, end]; used by the dashboards to zoom before downsampling
+    mask = np.ones(len(data), dtype=bool)
+    if start is not None:
+        mask &= (data[x] >= start).to_numpy()
+    if end is not None:
+        mask &= (data[x] <= end).to_numpy()
+    return data[mask]
@@ -1,31 +1,29 @@
-import os
 import sys, getopt
-import csv
-import busio
-import board
-import digitalio
-from time import sleep
-import minimalmodbus
-from datetime import datetime, date
-import adafruit_mcp3xxx.mcp3008 as MCP
-from adafruit_mcp3xxx.analog_in import AnalogIn
+import signal
+from datetime import datetime
+import hal
+from spiPool import MAX6675, SpiPool, max6675_celsius
+from modbusBlocks import plan_blocks
+from modbusClient import ModbusClient
+from scheduler import Scheduler
+import metrics
+from acquisition import AcquisitionEngine
+from csvSink import DailyCsvSink
+from compaction import COMPACT_PERIOD, BackgroundCompaction
+from colStore import DailyColumnSink
+from rollups import Rollup
+from alerts import AlertEngine, configured_rules, default_sinks
+from liveRing import publish
+from pushServer import PushServer
+from fleet import PORT as FLEET_PORT, Uplink
+from runtimeEngine import RUNTIME_HEADERS, RuntimeTracker
+from pipeline import RecordPipeline, default_rules
+from vibration import VIBRATION_COLUMNS, VibrationCapture
 
 
 ### SENSOR FUNCTIONS ###
-def read_data(spi_bus, cs_pin, sensor_baudrate, sensor_phase, sensor_polarity, result):
-    while not spi_bus.try_lock():
-        pass
-    spi_bus.configure(baudrate=sensor_baudrate, phase=sensor_phase, polarity=sensor_polarity)
-    cs_pin.value=False
-    spi_bus.readinto(result)
-    cs_pin.value=True
-    spi_bus.unlock()
-
-def conv_temp(sensor_bytes):
-    temp=int.from_bytes(sensor_bytes,"big")
-    temp = (temp & 0x7ff8)>>3
-    temp=32+temp*9/5*.25
-    return temp
+def conv_temp(celsius):
+    return 32+celsius*9/5
 
 def conv_pressure(voltage):
     return round((voltage-0.5)/4*300,4)
@@ -33,21 +31,14 @@ def conv_pressure(voltage):
 def conv_flowRate(voltage):
     return round((voltage*23),3)
 
-def read_modbus_float(register):
-    for i in range(10):
-        try:
-            value = instr.read_float(register)
-            return round(value,4)
-        except:
-            value = None
-    return value
 
 
 ### GET COMMAND LINE ARGUMENTS ###
-vibration, runSignal, kaeser = 0,0,0
+vibration, runSignal, kaeser, binary, push = 0,0,0,0,0
 location = "Unspecified"
-run_charge_time = [0, 0]    #first number stores time, second number determines if compressor is running or idle. 0 for idle, 1 for running
-opts, args = getopt.getopt(sys.argv[1:], "kvrl:", ["kaeser","vibration","runSignal","location"])
+uplink_address = None
+runtime_tracker = RuntimeTracker()    # tracks whether the compressor is running or compressing
+opts, args = getopt.getopt(sys.argv[1:], "kvrbpl:", ["kaeser","vibration","runSignal","binary","push","location","sim","uplink="])
 for opt, arg in opts:
     if opt in ("-v","--vibration"):
         vibration=1
@@ -56,82 +47,152 @@ for opt, arg in opts:
     elif opt in ("-k","--kaeser"):
         kaeser=1
         vibration=1
+    elif opt in ("-b","--binary"):
+        binary=1
+    elif opt in ("-p","--push"):
+        push=1
     elif opt in ("-l","--location"):
         location = arg
-
-
-### OPEN CSV FILE ###
-datafile = "{}-data.csv".format(date.today().strftime("%m-%d-%Y"))
-runtimes = "{}-runtime.csv".format(date.today().strftime("%m-%d-%Y"))
-open_datafile = open(datafile,"a+")
-open_runtimes = open(runtimes,"a+")
-new_writer = csv.writer(open_datafile)
-runtimes_writer = csv.writer(open_runtimes)
-old_day = date.today()
+    elif opt == "--sim":
+        hal.configure(backend="sim")
+    elif opt == "--uplink":
+        uplink_address = arg
 
 
 ### INITIALIZE SENSORS ###
-spi = busio.SPI(clock=board.SCK, MISO=board.MISO, MOSI=board.MOSI)
+# hal.py picks the real or simulated devices (--sim / ACM_BACKEND=sim)
+spi = hal.spi()
 
 # Initialize Oil Temp
-cs1 = digitalio.DigitalInOut(board.D22)
-cs1.direction = digitalio.Direction.OUTPUT
-cs1.value = True
+cs1 = hal.output_pin("D22")
 
 # Initialize Compressor Cooler Temp
-cs2 = digitalio.DigitalInOut(board.D27)
-cs2.direction = digitalio.Direction.OUTPUT
-cs2.value = True
+cs2 = hal.output_pin("D27")
 
 # Initialize Motor Temp
-cs3 = digitalio.DigitalInOut(board.D17)
-cs3.direction = digitalio.Direction.OUTPUT
-cs3.value = True
+cs3 = hal.output_pin("D17")
+
+# Oil, Cooler and Motor thermocouples are read together under one lock and configure
+thermocouples = SpiPool(spi)
+for cs in (cs1, cs2, cs3):
+    thermocouples.add(cs, **MAX6675)
 
 # Initialize ADC Sensor
-cs4 = digitalio.DigitalInOut(board.D23)
-mcp = MCP.MCP3008(spi,cs4)
+cs4 = hal.output_pin("D23")
+mcp = hal.mcp3008(spi,cs4)
 
 # Initialize Oil Pressure Channel
-chan0 = AnalogIn(mcp,MCP.P0)
+chan0 = hal.mcp_channel(mcp,0)
 
 # Initialize Air Pressure Channel
-chan1 = AnalogIn(mcp,MCP.P1)
+chan1 = hal.mcp_channel(mcp,1)
 
 # Initialize Flow Rate Channel
-chan2 = AnalogIn(mcp,MCP.P2)
+chan2 = hal.mcp_channel(mcp,2)
+
+# One worker per bus reads the channels (see DATA GATHERING LOOP)
+engine = AcquisitionEngine()
 
 # Initialize Vibration
 if(vibration):
-    chan3 = AnalogIn(mcp,MCP.P3)
+    chan3 = hal.mcp_channel(mcp,3)
+    # Sampled at a fixed rate in its own thread; features come out once per second.
+    # Each sample takes the SPI worker's lock, as the MCP3008 is shared with the other readers.
+    # kill -USR1 <pid> saves the next raw window to bursts/
+    vibration_capture = VibrationCapture(chan3, lock=engine.bus("spi").lock)
+    signal.signal(signal.SIGUSR1, lambda signum, frame: vibration_capture.request_burst())
 
 # Initialize Run Signal
 if(runSignal):
-    chan4 = AnalogIn(mcp,MCP.P4)
+    chan4 = hal.mcp_channel(mcp,4)
 
 # Initialize Modbus Reader
-instr = minimalmodbus.Instrument('/dev/ttyS0',1)
-instr.serial.baudrate = 9600
+instr = hal.modbus_instrument('/dev/ttyS0',1,baudrate=9600)
 instr.handle_local_echo = True
+meter_registers = [1016, 1018, 1020, 1000, 1002, 1004]
+meter_blocks = plan_blocks(meter_registers)
+# Bounded retries and timeouts; an unplugged meter opens the circuit and reads as blank
+meter = ModbusClient(instr, "meter")
 
 
 ### DATA GATHERING LOOP ###
-result = bytearray(2)
-runtime_headers = ["start_time", "stop_time","Duration(seconds)","Running_or_Compressing","Trusted"]
+runtime_headers = RUNTIME_HEADERS
 headers = ["datetime", "Compressor_Type", "Location", "Oil_Temp_(F)","Cooler_Temp_(F)","Motor_Temp_(F)","Oil_Pressure_(PSI)",
            "Air_Pressure_(PSI)","Flow_Rate_(L/min)", "Phase_A_Current_(A)", "Phase_B_Current_(A)", 
            "Phase_C_Current_(A)", "Phase_A_Voltage_(V)", "Phase_B_Voltage_(V)", "Phase_C_Voltage_(V)", 
            "Vibration_(V)", "Run_Signal_(V)", "Trusted"]
-if (os.path.getsize(str(datafile))==0):
-    new_writer.writerow(headers)
-if (os.path.getsize(str(runtimes))==0):
-    runtimes_writer.writerow(runtime_headers)
+# The vibration features are only logged with -v
+if(vibration):
+    headers += VIBRATION_COLUMNS
+
+### OPEN CSV FILES ###
+data_sink = DailyCsvSink("data", headers)
+runtime_sink = DailyCsvSink("runtime", runtime_headers, flush_rows=1)
+rollup = Rollup(headers, text_columns=["Compressor_Type", "Location"])
+# Every record is also published to shared memory for the live dashboards
+live_ring = publish("data", headers, text_columns=["Compressor_Type", "Location"])
+# Live page on port 8080; every record is pushed to the open browsers
+if(push):
+    push_server = PushServer(headers).start()
+# --uplink host[:port] spools every record locally and forwards it to the fleet collector
+uplink = None
+if(uplink_address):
+    host, _, port = uplink_address.partition(":")
+    uplink = Uplink(host, location, "Kaeser" if kaeser else "Ingersoll Rand", headers, int(port or FLEET_PORT)).start()
+if(binary):
+    binary_sink = DailyColumnSink("data", headers, text_columns=["Compressor_Type", "Location"])
+
+### ALERT RULES ###
+alert_engine = AlertEngine(headers, configured_rules(default_rules("finalCode")), default_sinks())
+
+### RECORD PIPELINE ###
+# Runtime intervals, CSV, rollup, alerts, then the live outputs; replay.py runs recorded
+# days through the same code
+pipeline = RecordPipeline(headers, data_sink, rollup, alert_engine,
+                          [("live_ring", live_ring), ("push", push_server if push else None),
+                           ("uplink", uplink), ("binary", binary_sink if binary else None)],
+                          runtime_tracker, runtime_sink)
+
+### SAMPLE RATES (seconds) ###
+RECORD_PERIOD = 1.0
+ANALOG_PERIOD = 1.0
+METER_PERIOD = 1.0
+TEMPERATURE_PERIOD = 1.0
+STATS_PERIOD = 60.0
+
+### CHANNEL READERS ###
+def read_temperatures():
+    # Get Oil, Cooler and Motor temperature. (Gathered in order listed)
+    return [conv_temp(celsius) for celsius in max6675_celsius(thermocouples.read())]
+
+def read_analog():
+    # Get Oil Pressure, Air Pressure, and Flow Rate
+    return [conv_pressure(chan0.voltage), conv_pressure(chan1.voltage), conv_flowRate(chan2.voltage)]
+
+def read_meter():
+    # Get current and voltage of power supply
+    return meter.read_floats(meter_registers, meter_blocks)
+
+def read_run_signal():
+    return chan4.voltage
+
+# Thermocouples, MCP3008 and the run signal share the SPI bus; the meter is on RS485
+if(not kaeser):
+    engine.bus("spi").every(TEMPERATURE_PERIOD, read_temperatures, default=[None] * 3)
+    engine.bus("spi").every(ANALOG_PERIOD, read_analog, default=[None] * 3)
+    engine.bus("rs485").every(METER_PERIOD, read_meter, default=[None] * len(meter_registers))
+if(vibration):
+    vibration_capture.start()
+if(runSignal):
+    engine.bus("spi").every(ANALOG_PERIOD, read_run_signal)
+engine.start()
+engine.wait_ready()
 
 # Gather Data for Samachurlsama
-while 1:
+def gather_record():
+    lap = record_stages.start()
     data_list = []
-    runtime_list = []
-    today = date.today()
+    latest = engine.snapshot()
     data_list.append(datetime.now())
     
     if(kaeser):
@@ -141,98 +202,69 @@ while 1:
 
     data_list.append(location)    
     
-    # Change CSV file that is written to
-    if(old_day!=today):
-        old_day = today
-        datafile = "{}-data.csv".format(date.today().strftime("%m-%d-%Y"))
-        runtimes = "{}-runtime.csv".format(date.today().strftime("%m-%d-%Y"))
-        open_datafile = open(datafile,"a+")
-        open_runtimes = open(runtimes,"a+")
-        runtimes_writer = csv.writer(open_runtimes)
-        new_writer = csv.writer(open_datafile)
-        new_writer.writerow(headers)
-        runtimes_writer.writerow(runtime_headers)
-
     if(not kaeser):
-        # Get Oil, Cooler and Motor temperature. (Gathered in order listed)
-        read_data(spi,cs1,4000000,0,0,result)
-        oil_temperature = conv_temp(result)
-        data_list.append(oil_temperature)
-        
-        read_data(spi,cs2,4000000,0,0,result)
-        cooler_temperature = conv_temp(result)
-        data_list.append(cooler_temperature)
-
-        read_data(spi,cs3,4000000,0,0,result)
-        motor_temperature = conv_temp(result)
-        data_list.append(motor_temperature)
-
-        # Get Oil Pressure, Air Pressure, and Flow Rate
-        data_list.append(conv_pressure(chan0.voltage))
-        data_list.append(conv_pressure(chan1.voltage))
-        data_list.append(conv_flowRate(chan2.voltage))
-
-        # Get current and voltage of power supply
-        data_list.append(read_modbus_float(1016))
-        data_list.append(read_modbus_float(1018))
-        data_list.append(read_modbus_float(1020))
-        data_list.append(read_modbus_float(1000))
-        data_list.append(read_modbus_float(1002))
-        data_list.append(read_modbus_float(1004))
+        data_list.extend(latest["temperatures"])
+        data_list.extend(latest["analog"])
+        data_list.extend(latest["meter"])
     else:
         for i in range(12):
             data_list.append(None)
     
 
     # Get vibration, run Signal
-    if(vibration):
-        data_list.append(chan3.voltage)
-    else:
-        data_list.append(None)
-    
-    if(runSignal):
-        data_list.append(chan4.voltage)
-    else:
-        data_list.append(None)
+    data_list.append(vibration_capture.level if vibration else None)
+    data_list.append(latest.get("run_signal"))
+    lap("snapshot")
 
     
     # Calculate run time or charge time
-    if(run_charge_time[0]==0 or ((data_list[9]!=None and data_list[9]<1) or (data_list[10]!=None and data_list[10]<1) or (data_list[11]!=None and data_list[11]<1) and data_list[7]<5)):
-        run_charge_time[0] = datetime.now()
-        run_charge_time[1] = 1
-
-    if((data_list[6] != None and data_list[6]>70) or (data_list[7] != None and data_list[7]<=100)):
-        if(run_charge_time[1] == 0):
-            runtime_list.append(run_charge_time[0])
-            runtime_list.append(data_list[0])
-            runtime_list.append((data_list[0]-run_charge_time[0]).total_seconds())
-            runtime_list.append("Running")
-            if(runtime_list[2] < 0):
-                runtime_list.append(0)
-            else:
-                runtime_list.append(1)
-            run_charge_time[0] = datetime.now()
-            runtimes_writer.writerow(runtime_list)
-        run_charge_time[1] = 1
-    elif((data_list[6] != None and data_list[6]<=70)):
-        if(run_charge_time[1] == 1):
-            runtime_list.append(run_charge_time[0])
-            runtime_list.append(data_list[0])
-            runtime_list.append((data_list[0]-run_charge_time[0]).total_seconds())
-            runtime_list.append("Compressing")
-            if(runtime_list[2] < 0):
-                runtime_list.append(0)
-            else:
-                runtime_list.append(1)
-            run_charge_time[0] = datetime.now()
-            runtimes_writer.writerow(runtime_list)
-        run_charge_time[1] = 0
+    pipeline.track_runtime(data_list, lap)
 
     # Check if data has any gaps (Invalid if there are) (check if correct data types)
     if(None in data_list[8:15] or (data_list[14]==None and vibration)):
         data_list.append(0)
     else:
         data_list.append(1)
+
+    # Vibration features of the latest window
+    if(vibration):
+        data_list.extend(vibration_capture.features)
    
-    new_writer.writerow(data_list)
-    sleep(1)
\ No newline at end of file
+    pipeline.write(data_list, lap)
+
+def print_stats():
+    print(scheduler.report())
+    print(engine.report())
+    print(meter.report())
+    print(alert_engine.report())
+    print(compactor.report())
+    if(push):
+        print(push_server.report())
+    if(uplink):
+        print(uplink.report())
+    if(vibration):
+        print("vibration: {} samples, {} late, {} errors, features {:.1f} ms".format(
+            vibration_capture.written, vibration_capture.overruns, vibration_capture.errors,
+            vibration_capture.feature_time * 1000))
+
+# Latency histograms, error counters and queue depths on http://127.0.0.1:9108/metrics
+# and in metrics.prom; SIGUSR2 or POST /disable switches collection off
+record_stages = metrics.Stages("record")
+
+# Closed days are compacted, and raw days past retention removed, by a low-priority
+# process started from here at most once an hour
+compactor = BackgroundCompaction()
+
+scheduler = Scheduler()
+scheduler.every(RECORD_PERIOD, gather_record)
+scheduler.every(STATS_PERIOD, print_stats, offset=STATS_PERIOD)
+scheduler.every(COMPACT_PERIOD, compactor.run, name="compaction", offset=STATS_PERIOD)
+scheduler.every(metrics.DUMP_PERIOD, metrics.dump, name="metrics", offset=metrics.DUMP_PERIOD)
+metrics.watch(scheduler, engine, [meter], alert_engine, push_server if push else None, uplink,
+              sinks={"csv": data_sink, "runtime": runtime_sink})
+metrics.serve()
+try:
+    scheduler.run()
+finally:
+    pipeline.close()
+
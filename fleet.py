@@ -0,0 +1,469 @@
+import asyncio
+import csv
+import json
+import os
+import re
+import signal
+import socket
+import struct
+import sys
+import threading
+import time
+import uuid
+import zlib
+from datetime import datetime
+from csvSink import DailyCsvSink
+
+### FLEET COLLECTOR AND NODE UPLINK ###
+# Every node (one Pi per compressor) numbers its records 1, 2, 3, ... and appends them to
+# a local spool file before anything goes on the network. The node id, made up once and
+# kept in the spool directory, tells nodes apart even when they share a location and
+# compressor name. A sender thread ships the
+# records the collector has not acknowledged yet in zlib-compressed batches over TCP. The
+# collector writes each batch to the compressor's store and then acknowledges the highest
+# record number it holds. After a network loss or a restart of either side, the hello
+# handshake returns that number and the node resumes right after it. Records the
+# collector already has are dropped, so a batch resent after a lost ack is not stored twice.
+# A spool line torn by a power cut is cut off when the spool is opened, and a line that
+# still cannot be parsed is skipped and counted.
+#
+# Wire format: frames of [length uint32][type uint8][payload]
+#   HELLO  node -> collector  JSON {"node", "location", "compressor", "header"}
+#   BATCH  node -> collector  zlib(JSON {"first": record number, "rows": [...]}), consecutive records
+#   ACK    collector -> node  uint64 highest stored record number
+#
+# Store: <directory>/<location>/<compressor>/<node>/MM-DD-YYYY-data.csv (csvSink.DailyCsvSink),
+# with the record number in a "Sequence" column. At startup the collector reads it back
+# from the newest file, so the store itself is the dedup state. A node that comes back
+# with another header is written in the day file's columns until its next file starts; a
+# second connection with another header while the first is still open is refused.
+
+PORT = 9750
+HELLO, BATCH, ACK = 1, 2, 3
+FRAME = struct.Struct(">IB")
+SEQ = struct.Struct(">Q")
+MAX_FRAME = 16 * 1024 * 1024
+BATCH_ROWS = 300
+BATCH_PERIOD = 5.0          # seconds between batches while connected
+RECONNECT = 1.0             # first reconnect delay, doubled up to MAX_RECONNECT
+MAX_RECONNECT = 60.0
+SPOOL_COMPACT = 1 << 20     # bytes; a fully acknowledged spool larger than this is emptied
+SEQUENCE_COLUMN = "Sequence"
+NODE_FILE = "node.id"
+
+def _frame(kind, payload):
+    return FRAME.pack(len(payload), kind) + payload
+
+def partition_name(text):
+    return re.sub(r"[^A-Za-z0-9_.-]+", "_", str(text)).strip("_") or "Unspecified"
+
+def node_id(spool_directory):
+    # This node's id, created on first use and kept next to the spool
+    path = os.path.join(spool_directory, NODE_FILE)
+    if os.path.exists(path):
+        with open(path) as file:
+            node = file.read().strip()
+        if node:
+            return node
+    node = uuid.uuid4().hex[:12]
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w") as file:
+        file.write(node + "\n")
+        file.flush()
+        os.fsync(file.fileno())
+    os.replace(tmp_path, path)
+    return node
+
+def _json_value(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if isinstance(value, float) and value != value:
+        return None
+    return value
+
+### NODE SIDE ###
+class Uplink:
+    # Same interface as csvSink.DailyCsvSink: write(row), flush(), close()
+    def __init__(self, host, location, compressor, header, port=PORT, spool_directory="uplink",
+                 batch_rows=BATCH_ROWS, batch_period=BATCH_PERIOD):
+        self.address = (host, port)
+        self.batch_rows = batch_rows
+        self.batch_period = batch_period
+        os.makedirs(spool_directory, exist_ok=True)
+        self.node = node_id(spool_directory)
+        self.hello = json.dumps({"node": self.node, "location": location, "compressor": compressor,
+                                 "header": header}).encode()
+        self.spool_path = os.path.join(spool_directory, "spool.jsonl")
+        self.ack_path = os.path.join(spool_directory, "ack.json")
+        self.acked, self.offset = 0, 0      # highest acknowledged record, spool offset after it
+        if os.path.exists(self.ack_path):
+            with open(self.ack_path) as file:
+                state = json.load(file)
+            self.acked, self.offset = state["seq"], state["offset"]
+        self.skipped = 0                    # spool lines that could not be parsed
+        size = self._repair_spool()
+        self.offset = min(self.offset, size)
+        self.seq = max(self.acked, self._last_spooled())
+        self.spool = open(self.spool_path, "a")
+        self.lock = threading.Lock()
+        self.connected = False
+        self.sent_batches = 0
+        self.reconnects = 0
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self.thread = threading.Thread(target=self._run, name="uplink", daemon=True)
+
+    def _repair_spool(self):
+        # A power cut can leave the last line half written. The next record would be
+        # appended to it and neither could be parsed, so the spool is cut back to its last
+        # complete line. Returns the spool size.
+        if not os.path.exists(self.spool_path):
+            return 0
+        with open(self.spool_path, "r+b") as file:
+            size = file.seek(0, os.SEEK_END)
+            end = size
+            while end > 0:
+                start = max(0, end - 65536)
+                file.seek(start)
+                cut = file.read(end - start).rfind(b"\n")
+                if cut >= 0:
+                    end = start + cut + 1
+                    break
+                end = start
+            if end < size:
+                print("uplink spool: dropped {} bytes of a torn last line".format(size - end))
+                file.truncate(end)
+        return end
+
+    def _last_spooled(self):
+        if not os.path.exists(self.spool_path) or os.path.getsize(self.spool_path) == 0:
+            return 0
+        with open(self.spool_path, "rb") as file:
+            file.seek(max(0, os.path.getsize(self.spool_path) - 65536))
+            lines = [line for line in file.read().split(b"\n") if line]
+        for line in reversed(lines):
+            try:
+                return json.loads(line)[0]
+            except ValueError:
+                continue
+        return 0
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def write(self, row, when=None):
+        with self.lock:
+            self.seq += 1
+            self.spool.write(json.dumps([self.seq, [_json_value(value) for value in row]]) + "\n")
+            self.spool.flush()
+            if self.seq - self.acked >= self.batch_rows:
+                self._wake.set()
+
+    def flush(self):
+        with self.lock:
+            self.spool.flush()
+            os.fsync(self.spool.fileno())
+
+    def close(self):
+        self._stop.set()
+        self._wake.set()
+        if self.thread.is_alive():
+            self.thread.join(timeout=5)
+        self.flush()
+        self.spool.close()
+
+    def backlog(self):
+        return self.seq - self.acked
+
+    ### SENDER THREAD ###
+    def _run(self):
+        delay = RECONNECT
+        while not self._stop.is_set():
+            try:
+                with socket.create_connection(self.address, timeout=10) as connection:
+                    self.connected = True
+                    delay = RECONNECT
+                    self._session(connection)
+            except (OSError, ValueError):
+                pass
+            if self.connected:
+                self.reconnects += 1
+            self.connected = False
+            if self._stop.wait(delay):
+                break
+            delay = min(delay * 2, MAX_RECONNECT)
+
+    def _session(self, connection):
+        connection.sendall(_frame(HELLO, self.hello))
+        self._acknowledged(self._read_ack(connection))
+        with open(self.spool_path, "rb") as spool:
+            while True:
+                spool.seek(self.offset)
+                rows, end = self._next_batch(spool)
+                if rows:
+                    payload = zlib.compress(json.dumps({"first": rows[0][0], "rows": [row for seq, row in rows]}).encode())
+                    connection.sendall(_frame(BATCH, payload))
+                    self._acknowledged(self._read_ack(connection), end)
+                    self.sent_batches += 1
+                    if len(rows) == self.batch_rows:
+                        continue    # catching up after an outage: no pause between batches
+                if self._stop.is_set():
+                    return
+                self._wake.wait(self.batch_period)
+                self._wake.clear()
+                self._compact()
+
+    def _next_batch(self, spool):
+        # Consecutive records after the acknowledged ones; a batch stops at a gap left by
+        # a skipped line, so the collector can number its rows from the first
+        rows = []
+        end = self.offset
+        while len(rows) < self.batch_rows:
+            line = spool.readline()
+            if not line.endswith(b"\n"):
+                break       # the writer has not finished this line yet
+            try:
+                seq, row = json.loads(line)
+            except ValueError:
+                self.skipped += 1
+                print("uplink spool: skipped an unreadable line at byte {}".format(end))
+                end += len(line)
+                continue
+            if seq <= self.acked:
+                end += len(line)
+                continue
+            if rows and seq != rows[-1][0] + 1:
+                break
+            end += len(line)
+            rows.append((seq, row))
+        if not rows and end != self.offset:
+            self._acknowledged(self.acked, end)
+        return rows, end
+
+    def _read_ack(self, connection):
+        header = self._receive(connection, FRAME.size)
+        length, kind = FRAME.unpack(header)
+        payload = self._receive(connection, length)
+        if kind != ACK:
+            raise ValueError("expected ACK, got frame type {}".format(kind))
+        return SEQ.unpack(payload)[0]
+
+    def _receive(self, connection, size):
+        data = b""
+        while len(data) < size:
+            chunk = connection.recv(size - len(data))
+            if not chunk:
+                raise ConnectionError("collector closed the connection")
+            data += chunk
+        return data
+
+    def _acknowledged(self, seq, offset=None):
+        # offset is the spool position after the batch the ack answers; a hello ack only
+        # moves the record number and lets _next_batch skip what the collector has
+        if offset is not None and seq >= self.acked:
+            self.offset = offset
+        self.acked = max(self.acked, seq)
+        tmp_path = self.ack_path + ".tmp"
+        with open(tmp_path, "w") as file:
+            json.dump({"seq": self.acked, "offset": self.offset}, file)
+        os.replace(tmp_path, self.ack_path)
+
+    def _compact(self):
+        with self.lock:
+            if self.acked < self.seq or os.path.getsize(self.spool_path) < SPOOL_COMPACT:
+                return
+            self.spool.truncate(0)
+            self.offset = 0
+            self._acknowledged(self.acked)
+
+    def report(self):
+        return "uplink {}:{} (node {}): {}, record {}, {} unacknowledged, {} batches, {} reconnects, {} spool lines skipped".format(
+            self.address[0], self.address[1], self.node, "connected" if self.connected else "disconnected",
+            self.seq, self.backlog(), self.sent_batches, self.reconnects, self.skipped)
+
+### COLLECTOR SIDE ###
+class Partition:
+    def __init__(self, directory, header, seq=None):
+        self.directory = directory
+        self.header = header
+        self.sink = DailyCsvSink("data", header + [SEQUENCE_COLUMN], directory=directory,
+                                 flush_rows=1 << 30, flush_interval=float("inf"))
+        self.seq = self._last_stored() if seq is None else seq
+        self.connections = 0
+
+    def _last_stored(self):
+        import compaction
+        for day, path in compaction.day_files(self.directory, "data")[::-1]:
+            if path.endswith(compaction.EXTENSION):
+                sequence = compaction.load(path, [SEQUENCE_COLUMN])[SEQUENCE_COLUMN].dropna()
+                if len(sequence):
+                    return int(sequence.iloc[-1])
+                continue
+            # found by name, whatever header generation the file was started with
+            with open(path, newline="") as file:
+                columns = next(csv.reader(file), [])
+            if SEQUENCE_COLUMN not in columns:
+                continue
+            index = columns.index(SEQUENCE_COLUMN)
+            with open(path, "rb") as file:
+                file.seek(max(0, os.path.getsize(path) - 65536))
+                lines = file.read().split(b"\n")
+            for line in reversed(lines[:-1]):   # the part after the last newline is torn
+                fields = next(csv.reader([line.decode(errors="replace")]), [])
+                if len(fields) > index and fields[index].strip().isdigit():
+                    return int(fields[index])
+        return 0
+
+    def store(self, first, rows):
+        # rows[i] is record first + i; returns how many were already stored
+        duplicates = 0
+        for seq, row in enumerate(rows, first):
+            if seq <= self.seq:
+                duplicates += 1
+                continue
+            when = datetime.fromisoformat(row[0]) if isinstance(row[0], str) else datetime.now()
+            self.sink.write([when] + row[1:] + [seq], when)
+            self.seq = seq
+        self.sink.flush()
+        return duplicates
+
+class Collector:
+    def __init__(self, directory="fleet", port=PORT, host="0.0.0.0"):
+        self.directory = directory
+        self.port = port
+        self.host = host
+        self.partitions = {}
+        self.writers = set()
+        self.rows = 0
+        self.duplicates = 0
+        self.batches = 0
+        self.bytes = 0
+        self.started = time.monotonic()
+
+    def partition(self, location, compressor, header, node=None):
+        # One partition per node, as record numbers are the node's own; a hello without a
+        # node id (older nodes) is stored under the location and compressor alone
+        key = (partition_name(location), partition_name(compressor)) + ((partition_name(node),) if node else ())
+        partition = self.partitions.get(key)
+        if partition is not None and partition.header != header:
+            if partition.connections:
+                raise ValueError("{} is connected with another header".format("/".join(key)))
+            partition.sink.close()
+            partition = self.partitions[key] = Partition(partition.directory, header, partition.seq)
+        if partition is None:
+            directory = os.path.join(self.directory, *key)
+            os.makedirs(directory, exist_ok=True)
+            partition = self.partitions[key] = Partition(directory, header)
+        return partition
+
+    async def _handle(self, reader, writer):
+        partition = None
+        self.writers.add(writer)
+        try:
+            while True:
+                length, kind = FRAME.unpack(await reader.readexactly(FRAME.size))
+                if length > MAX_FRAME:
+                    break
+                payload = await reader.readexactly(length)
+                self.bytes += FRAME.size + length
+                if kind == HELLO and partition is None:
+                    hello = json.loads(payload)
+                    try:
+                        partition = self.partition(hello["location"], hello["compressor"], hello["header"], hello.get("node"))
+                    except ValueError as error:
+                        print("collector: hello refused: {}".format(error))
+                        break
+                    partition.connections += 1
+                elif kind == BATCH and partition is not None:
+                    batch = json.loads(zlib.decompress(payload))
+                    duplicates = partition.store(batch["first"], batch["rows"])
+                    self.rows += len(batch["rows"]) - duplicates
+                    self.duplicates += duplicates
+                    self.batches += 1
+                else:
+                    break
+                writer.write(_frame(ACK, SEQ.pack(partition.seq)))
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError, ValueError, zlib.error):
+            pass
+        finally:
+            if partition is not None:
+                partition.connections -= 1
+            self.writers.discard(writer)
+            writer.close()
+
+    async def serve(self, report_every=60.0):
+        # Runs until SIGINT/SIGTERM, then lets every connection finish its batch
+        stop = asyncio.Event()
+        for signum in (signal.SIGINT, signal.SIGTERM):
+            asyncio.get_running_loop().add_signal_handler(signum, stop.set)
+        server = await asyncio.start_server(self._handle, self.host, self.port)
+        print("collector listening on port {}, store in {}".format(self.port, self.directory))
+        while not stop.is_set():
+            try:
+                await asyncio.wait_for(stop.wait(), report_every)
+            except asyncio.TimeoutError:
+                print(self.report())
+        server.close()
+        for writer in list(self.writers):
+            writer.close()
+        while self.writers:
+            await asyncio.sleep(0.01)
+
+    def report(self):
+        elapsed = time.monotonic() - self.started
+        connected = sum(1 for partition in self.partitions.values() if partition.connections)
+        return "collector: {} compressors ({} connected), {} rows ({:.0f}/s), {} duplicates dropped, {} batches, {:.1f} MB received".format(
+            len(self.partitions), connected, self.rows, self.rows / elapsed if elapsed else 0.0,
+            self.duplicates, self.batches, self.bytes / 1e6)
+
+    def close(self):
+        for partition in self.partitions.values():
+            partition.sink.close()
+
+### SIMULATED NODES ###
+SIM_HEADER = ["datetime", "Compressor_Type", "Location", "Oil_Temp_(F)", "Oil_Pressure_(PSI)", "Air_Pressure_(PSI)",
+              "Phase_A_Current_(A)", "Phase_B_Current_(A)", "Phase_C_Current_(A)",
+              "Phase_A_Voltage_(V)", "Phase_B_Voltage_(V)", "Phase_C_Voltage_(V)"]
+
+def simulate(count, host="127.0.0.1", port=PORT, seconds=60.0, rate=1.0, spool_directory="uplink-sim", batch_period=BATCH_PERIOD):
+    # `count` nodes at `rate` records per second, each with its own spool and connection
+    from simDevices import SIM_CHANNELS, SIM_METER, Signals
+    channels = [SIM_CHANNELS[("thermocouple", "D22")], SIM_CHANNELS[("mcp3008", 0)], SIM_CHANNELS[("mcp3008", 1)],
+                SIM_METER[1000], SIM_METER[1002], SIM_METER[1004], SIM_METER[1010], SIM_METER[1012], SIM_METER[1014]]
+    nodes = []
+    for number in range(count):
+        location = "Site{}".format(number // 10)
+        compressor = "Compressor{}".format(number % 10)
+        uplink = Uplink(host, location, compressor, SIM_HEADER, port,
+                        os.path.join(spool_directory, location, compressor), batch_period=batch_period).start()
+        nodes.append((uplink, location, Signals(seed=number)))
+    deadline = time.monotonic()
+    stop = deadline + seconds
+    while deadline < stop:
+        deadline += 1 / rate
+        time.sleep(max(0, deadline - time.monotonic()))
+        for uplink, location, signals in nodes:
+            oil_temp, oil, air, *meter = [signals.value(channel) for channel in channels]
+            uplink.write([datetime.now(), "Ingersoll Rand", location, round(oil_temp * 9 / 5 + 32, 2),
+                          round((oil - 0.5) / 4 * 300, 4), round((air - 0.5) / 4 * 300, 4)] + [round(value, 4) for value in meter])
+    for uplink, location, signals in nodes:
+        print(uplink.report())
+        uplink.close()
+
+if __name__ == "__main__":
+    # python fleet.py collector [directory] [port]
+    # python fleet.py simulate <nodes> [seconds] [host] [port]
+    if len(sys.argv) > 1 and sys.argv[1] == "simulate":
+        simulate(int(sys.argv[2]), seconds=float(sys.argv[3]) if len(sys.argv) > 3 else 60.0,
+                 host=sys.argv[4] if len(sys.argv) > 4 else "127.0.0.1",
+                 port=int(sys.argv[5]) if len(sys.argv) > 5 else PORT)
+    else:
+        collector = Collector(sys.argv[2] if len(sys.argv) > 2 else "fleet",
+                              int(sys.argv[3]) if len(sys.argv) > 3 else PORT)
+        try:
+            asyncio.run(collector.serve())
+        finally:
+            print(collector.report())
+            collector.close()
@@ -0,0 +1,136 @@
+import os
+import sys
+
+### HARDWARE ABSTRACTION ###
+# The acquisition scripts build every bus and chip through these functions. With the
+# real backend they return the Blinka, smbus2 and minimalmodbus objects the scripts
+# always used; with the simulated backend they return the stand-ins in simDevices.py,
+# which answer in the same data formats, so the unchanged loops run on any machine.
+#
+#   ACM_BACKEND=sim (or --sim)     use the simulated devices
+#   ACM_SIM_REPLAY=<-data.csv>     replay a recorded day instead of synthetic waveforms
+#   ACM_SIM_ERROR_RATE=0.01        fraction of simulated transactions that fail
+#   ACM_SIM_LATENCY_SCALE=1.0      multiply every simulated bus latency
+
+MODE_RTU = "rtu"
+
+# Per-transaction latency of each simulated bus, seconds
+SIM_LATENCY = {"spi": 0.0001, "i2c": 0.0005, "smbus": 0.001}
+
+_config = {
+    "backend": "sim" if "--sim" in sys.argv else os.environ.get("ACM_BACKEND", "real"),
+    "replay": os.environ.get("ACM_SIM_REPLAY"),
+    "error_rate": float(os.environ.get("ACM_SIM_ERROR_RATE", "0")),
+    "latency_scale": float(os.environ.get("ACM_SIM_LATENCY_SCALE", "1")),
+}
+_signals = None
+_pins = {}
+
+def configure(backend=None, replay=None, error_rate=None, latency_scale=None):
+    # Override the environment, e.g. from the benchmark; call before building devices
+    global _signals
+    for key, value in (("backend", backend), ("replay", replay), ("error_rate", error_rate),
+                       ("latency_scale", latency_scale)):
+        if value is not None:
+            _config[key] = value
+    _signals = None
+
+def simulated():
+    return _config["backend"] == "sim"
+
+def _sim_signals():
+    global _signals
+    import simDevices
+    if _signals is None:
+        _signals = simDevices.Signals(_config["replay"])
+    return _signals
+
+def _sim_bus_args(kind):
+    return {"latency": SIM_LATENCY[kind] * _config["latency_scale"], "error_rate": _config["error_rate"]}
+
+### BUSES ###
+def spi():
+    if simulated():
+        import simDevices
+        bus = simDevices.SimSPI(_sim_signals(), **_sim_bus_args("spi"))
+        bus.pins = _pins
+        return bus
+    import board
+    import busio
+    return busio.SPI(board.SCK, MOSI=board.MOSI, MISO=board.MISO)
+
+def i2c():
+    if simulated():
+        import simDevices
+        return simDevices.SimI2C(_sim_signals(), **_sim_bus_args("i2c"))
+    import board
+    import busio
+    return busio.I2C(board.SCL, board.SDA)
+
+def smbus(bus=1):
+    if simulated():
+        import simDevices
+        return simDevices.SimSMBus(_sim_signals(), **_sim_bus_args("smbus"))
+    import smbus2
+    return smbus2.SMBus(bus)
+
+def output_pin(name):
+    # Chip-select pin by board name ("D17"), configured as an output and left high
+    if simulated():
+        import simDevices
+        pin = simDevices.SimPin(name, _pins)
+    else:
+        import board
+        import digitalio
+        pin = digitalio.DigitalInOut(getattr(board, name))
+        pin.direction = digitalio.Direction.OUTPUT
+    pin.value = True
+    return pin
+
+### CHIPS ###
+def ads1115(i2c_bus, address=0x48):
+    if simulated():
+        import simDevices
+        return simDevices.SimADS1115(i2c_bus, address)
+    import adafruit_ads1x15.ads1115 as ADS
+    return ADS.ADS1115(i2c_bus, address=address)
+
+def ads_channel(ads, channel):
+    # channel 0-3, single ended
+    if simulated():
+        import simDevices
+        return simDevices.SimADSAnalogIn(ads, channel)
+    from adafruit_ads1x15.analog_in import AnalogIn
+    return AnalogIn(ads, channel)
+
+def mcp3008(spi_bus, cs):
+    if simulated():
+        import simDevices
+        return simDevices.SimMCP3008(spi_bus, cs)
+    import adafruit_mcp3xxx.mcp3008 as MCP
+    return MCP.MCP3008(spi_bus, cs)
+
+def mcp_channel(mcp, channel):
+    # channel 0-7, single ended
+    if simulated():
+        import simDevices
+        return simDevices.SimMCPAnalogIn(mcp, channel)
+    from adafruit_mcp3xxx.analog_in import AnalogIn
+    return AnalogIn(mcp, channel)
+
+def max31855(spi_bus, cs):
+    if simulated():
+        import simDevices
+        return simDevices.SimMAX31855(spi_bus, cs)
+    import adafruit_max31855
+    return adafruit_max31855.MAX31855(spi_bus, cs)
+
+def modbus_instrument(port, address, baudrate=9600):
+    if simulated():
+        import simDevices
+        return simDevices.SimModbusInstrument(baudrate=baudrate, signals=_sim_signals(),
+                                              error_rate=_config["error_rate"])
+    import minimalmodbus
+    instr = minimalmodbus.Instrument(port, address)
+    instr.serial.baudrate = baudrate
+    return instr
@@ -0,0 +1,276 @@
+import json
+import os
+import random
+import time
+from datetime import date, datetime
+from multiprocessing import shared_memory
+import schemas
+from colStore import to_epoch_ns
+
+### SHARED-MEMORY LIVE RING ###
+# The acquisition script publishes every record into a fixed-schema ring in
+# multiprocessing.shared_memory; dashboards attach read-only and take the last N
+# records or minutes without touching the SD card. Layout of the segment:
+#
+#   header     magic, capacity, column count, committed record count, schema version,
+#              schema length, writer id, writer pid (int64 each)
+#   schema     JSON: header names and the labels of text columns (codes index into them)
+#   slot_seq   int64[capacity]  record number held by each slot, -1 while it is written
+#   time       int64[capacity]  naive local epoch ns, like colStore
+#   values     float64[columns, capacity], one contiguous row per column
+#
+# The single writer marks a slot -1, fills it, stamps its record number and only then
+# bumps the committed count, so readers need no lock. Each slot works as a seqlock: a
+# reader copies the stamps, then the times and values, then reads the stamps again and
+# drops any slot whose stamp was not its record number both times (overwritten meanwhile).
+# A segment whose writer pid is gone is left over from a crash and is replaced; one whose
+# writer is still running is left alone, and the second script runs without a ring.
+
+MAGIC = b"ACMLIVE1"
+HEADER_BYTES = 64
+META_FIELDS = 8
+SCHEMA_BYTES = 16384
+CAPACITY = 3600         # one hour of 1 s records
+
+def segment_name(suffix="data"):
+    return "acm-live-" + suffix
+
+def _layout(capacity, columns):
+    slot_seq = HEADER_BYTES + SCHEMA_BYTES
+    times = slot_seq + 8 * capacity
+    values = times + 8 * capacity
+    return slot_seq, times, values, values + 8 * capacity * columns
+
+def _views(buffer, capacity, columns):
+    import numpy as np
+    slot_seq, times, values, end = _layout(capacity, columns)
+    return (np.ndarray((META_FIELDS,), dtype=np.int64, buffer=buffer),
+            np.ndarray((capacity,), dtype=np.int64, buffer=buffer, offset=slot_seq),
+            np.ndarray((capacity,), dtype=np.int64, buffer=buffer, offset=times),
+            np.ndarray((columns, capacity), dtype=np.float64, buffer=buffer, offset=values))
+
+### WRITER ###
+class LiveRing:
+    # Same interface as csvSink.DailyCsvSink: write(row), flush(), close()
+    def __init__(self, suffix, header, text_columns=(), capacity=CAPACITY):
+        self.header = header
+        self.capacity = capacity
+        self.name = segment_name(suffix)
+        self.text = {index: [] for index, name in enumerate(header) if name in text_columns}
+        self.labels = {index: {} for index in self.text}
+        columns = len(header) - 1
+        try:
+            # attached untracked, so a refused start does not unlink the running writer's segment
+            existing = _attach_segment(self.name)
+        except FileNotFoundError:
+            existing = None
+        if existing is not None:
+            pid = _writer_pid(existing)
+            existing.close()
+            if pid is not None:
+                raise FileExistsError("{} is published by running process {}".format(self.name, pid))
+            # a segment left behind by a crashed run would keep readers on stale data
+            stale = shared_memory.SharedMemory(self.name)
+            stale.close()
+            stale.unlink()
+        self.shm = shared_memory.SharedMemory(self.name, create=True, size=_layout(capacity, columns)[3])
+        # plain memoryview casts keep the acquisition side free of NumPy
+        slot_seq, times, values, end = _layout(capacity, columns)
+        self.meta = self.shm.buf[:HEADER_BYTES].cast("q")
+        self.slot_seq = self.shm.buf[slot_seq:times].cast("q")
+        self.times = self.shm.buf[times:values].cast("q")
+        self.values = self.shm.buf[values:end].cast("d")
+        for slot in range(capacity):
+            self.slot_seq[slot] = -1
+        self.seq = 0
+        self.shm.buf[:8] = MAGIC
+        for index, value in enumerate([capacity, columns, 0, 0, 0, random.getrandbits(62), os.getpid()], 1):
+            self.meta[index] = value
+        self._write_schema()
+
+    def _write_schema(self):
+        schema = json.dumps({"header": self.header, "generation": schemas.stamp(self.header),
+                             "text": {self.header[index]: labels for index, labels in self.text.items()}}).encode()
+        if len(schema) > SCHEMA_BYTES:
+            raise ValueError("live ring schema does not fit in {} bytes".format(SCHEMA_BYTES))
+        self.meta[4] += 1           # odd while the schema is rewritten
+        self.shm.buf[HEADER_BYTES:HEADER_BYTES + len(schema)] = schema
+        self.meta[5] = len(schema)
+        self.meta[4] += 1
+
+    def _code(self, index, value):
+        if value is None or value == "":
+            return float("nan")
+        codes = self.labels[index]
+        if value not in codes:
+            codes[value] = len(self.text[index])
+            self.text[index].append(value)
+            self._write_schema()
+        return codes[value]
+
+    def write(self, row, when=None):
+        slot = self.seq % self.capacity
+        self.slot_seq[slot] = -1
+        self.times[slot] = to_epoch_ns(row[0] if isinstance(row[0], (datetime, date)) else datetime.now())
+        for index, value in enumerate(row[1:len(self.header)], 1):
+            position = (index - 1) * self.capacity + slot
+            if index in self.text:
+                self.values[position] = self._code(index, value)
+            else:
+                try:
+                    self.values[position] = float(value) if value is not None else float("nan")
+                except (TypeError, ValueError):
+                    self.values[position] = float("nan")
+        self.slot_seq[slot] = self.seq
+        self.seq += 1
+        self.meta[3] = self.seq
+
+    def flush(self):
+        pass
+
+    def close(self):
+        for view in (self.meta, self.slot_seq, self.times, self.values):
+            view.release()
+        self.shm.close()
+        self.shm.unlink()
+
+def _writer_pid(shm):
+    # Pid of the process still writing the segment, None when it has exited
+    if shm.size < HEADER_BYTES or bytes(shm.buf[:8]) != MAGIC:
+        return None
+    meta = shm.buf[:HEADER_BYTES].cast("q")
+    pid = meta[META_FIELDS - 1]
+    meta.release()
+    if pid <= 0:
+        return None
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return None
+    except PermissionError:
+        pass
+    return pid
+
+def publish(suffix, header, text_columns=(), capacity=CAPACITY):
+    # Ring for an acquisition script, or None when another running script already
+    # publishes under that name
+    try:
+        return LiveRing(suffix, header, text_columns, capacity)
+    except FileExistsError as error:
+        print("{}, not publishing a live ring".format(error))
+        return None
+
+### READER ###
+def _attach_segment(name):
+    try:
+        # Python 3.13+: do not let this process's resource tracker own the segment
+        return shared_memory.SharedMemory(name, track=False)
+    except TypeError:
+        pass
+    shm = shared_memory.SharedMemory(name)
+    # Older versions register every attach and unlink the segment when the reader exits
+    from multiprocessing import resource_tracker
+    try:
+        resource_tracker.unregister(shm._name, "shared_memory")
+    except Exception:
+        pass
+    return shm
+
+class LiveReader:
+    def __init__(self, shm):
+        import numpy as np
+        self.shm = shm
+        if bytes(shm.buf[:8]) != MAGIC:
+            raise ValueError("{} is not a live ring".format(shm.name))
+        meta = np.ndarray((META_FIELDS,), dtype=np.int64, buffer=shm.buf)
+        self.capacity, self.columns = int(meta[1]), int(meta[2])
+        self.meta, self.slot_seq, self.times, self.values = _views(shm.buf, self.capacity, self.columns)
+        for array in (self.meta, self.slot_seq, self.times, self.values):
+            array.flags.writeable = False
+        self.writer = int(self.meta[6])
+        self._schema_version = None
+        self.schema = None
+        self._last_seq = None
+        self._last_change = time.monotonic()
+        self._read_schema()
+
+    def _read_schema(self):
+        while True:
+            version = int(self.meta[4])
+            if version % 2:
+                time.sleep(0.001)
+                continue
+            raw = bytes(self.shm.buf[HEADER_BYTES:HEADER_BYTES + int(self.meta[5])])
+            if int(self.meta[4]) == version:
+                break
+        self.schema = json.loads(raw)
+        self.header = self.schema["header"]
+        self._schema_version = version
+
+    @property
+    def seq(self):
+        return int(self.meta[3])
+
+    def stale(self, seconds):
+        # True when no record has been committed for `seconds` (writer stopped or restarted
+        # with a new segment that this mapping no longer sees)
+        seq = self.seq
+        if seq != self._last_seq:
+            self._last_seq = seq
+            self._last_change = time.monotonic()
+        return time.monotonic() - self._last_change > seconds
+
+    def arrays(self, count=None, seconds=None):
+        # (times, values) of the newest records, oldest first, copied out of shared memory
+        import numpy as np
+        head = self.seq
+        # one slot is kept back: the writer may be filling it right now
+        available = min(head, self.capacity - 1)
+        count = available if count is None else min(count, available)
+        positions = np.arange(head - count, head)
+        first = (head - count) % self.capacity
+        if first + count <= self.capacity:
+            slots = slice(first, first + count)
+        else:
+            slots = positions % self.capacity
+        # fancy indexing copies; a slice is copied explicitly
+        stamps = np.array(self.slot_seq[slots])
+        times, values = np.array(self.times[slots]), np.array(self.values[:, slots])
+        valid = (stamps == positions) & (self.slot_seq[slots] == stamps)
+        if not valid.all():
+            times, values = times[valid], values[:, valid]
+        if seconds is not None and len(times):
+            begin = np.searchsorted(times, times[-1] - int(seconds * 1e9))
+            times, values = times[begin:], values[:, begin:]
+        return times, values
+
+    def frame(self, count=None, seconds=None):
+        import pandas as pd
+        while True:
+            if int(self.meta[4]) != self._schema_version:
+                self._read_schema()
+            times, values = self.arrays(count, seconds)
+            # a label added while the records were copied would leave codes past the
+            # labels read, so the schema is checked again and the copy retried
+            if int(self.meta[4]) == self._schema_version:
+                break
+        data = {self.header[0]: pd.to_datetime(times, unit="ns")}
+        for index, name in enumerate(self.header[1:]):
+            labels = self.schema["text"].get(name)
+            if labels is None:
+                data[name] = values[index]
+            else:
+                codes = pd.Series(values[index]).fillna(-1).astype("int64").to_numpy()
+                data[name] = pd.Categorical.from_codes(codes, categories=labels)
+        return pd.DataFrame(data)
+
+    def close(self):
+        del self.meta, self.slot_seq, self.times, self.values
+        self.shm.close()
+
+def attach(suffix="data"):
+    # Reader for the running acquisition script's ring, or None when none is published
+    try:
+        return LiveReader(_attach_segment(segment_name(suffix)))
+    except (FileNotFoundError, ValueError):
+        return None
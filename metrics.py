@@ -0,0 +1,279 @@
+import os
+import signal
+import threading
+import time
+from bisect import bisect_left
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+### LOOP METRICS ###
+# Counters, gauges and latency histograms for the acquisition loop, exported in the
+# Prometheus text format. The hot path only does an enabled check and a bucket increment.
+# Updates take no lock because each metric is written by a single thread: a bus worker,
+# the record task, or the Modbus probe while the bus is idle. Everything that already
+# keeps its own numbers, such as scheduler misses, reader errors, Modbus health, viewer
+# queues and the uplink backlog, is read at scrape time through watch(), so it costs
+# nothing between scrapes.
+#
+#   http://127.0.0.1:9108/metrics   scrape (ACM_METRICS_PORT), POST /enable or /disable
+#   metrics.prom                    the same text, rewritten every DUMP_PERIOD seconds
+#                                   (ACM_METRICS_FILE, readable by node_exporter's
+#                                   textfile collector)
+#   SIGUSR2                         toggles collection in the running script
+#
+# ACM_METRICS=0 starts with collection off.
+
+PREFIX = "acm_"
+PORT = int(os.environ.get("ACM_METRICS_PORT", "9108"))
+HOST = "127.0.0.1"
+STATS_FILE = os.environ.get("ACM_METRICS_FILE", "metrics.prom")
+DUMP_PERIOD = 60.0
+# seconds, from a fast SPI frame to a Modbus timeout
+BUCKETS = (0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+def _labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join('{}="{}"'.format(name, str(value).replace("\\", "\\\\").replace('"', '\\"'))
+                          for name, value in sorted(labels.items())) + "}"
+
+def _number(value):
+    return "NaN" if value is None else repr(float(value)) if isinstance(value, float) else str(value)
+
+class Counter:
+    def __init__(self, registry):
+        self.registry = registry
+        self.value = 0
+
+    def inc(self, amount=1):
+        if self.registry.enabled:
+            self.value += amount
+
+    def samples(self, name, labels):
+        return ["{}{} {}".format(name, _labels(labels), _number(self.value))]
+
+class Gauge:
+    def __init__(self, registry):
+        self.registry = registry
+        self.value = 0
+
+    def set(self, value):
+        if self.registry.enabled:
+            self.value = value
+
+    def samples(self, name, labels):
+        return ["{}{} {}".format(name, _labels(labels), _number(self.value))]
+
+class Histogram:
+    def __init__(self, registry, buckets=BUCKETS):
+        self.registry = registry
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)      # the last one is +Inf
+        self.sum = 0.0
+
+    def observe(self, value):
+        if self.registry.enabled:
+            self.counts[bisect_left(self.buckets, value)] += 1
+            self.sum += value
+
+    def samples(self, name, labels):
+        lines = []
+        total = 0
+        for bound, count in zip(self.buckets + (float("inf"),), self.counts):
+            total += count
+            lines.append("{}_bucket{} {}".format(name, _labels(dict(labels, le="+Inf" if bound == float("inf") else repr(bound))), total))
+        lines.append("{}_sum{} {}".format(name, _labels(labels), repr(self.sum)))
+        lines.append("{}_count{} {}".format(name, _labels(labels), total))
+        return lines
+
+class Registry:
+    def __init__(self, enabled=True):
+        self.enabled = enabled
+        self.families = {}      # name: [type, help, {label items: metric}]
+        self.collectors = []
+        self.lock = threading.Lock()
+
+    def _metric(self, kind, factory, name, help, labels):
+        name = PREFIX + name
+        with self.lock:
+            family = self.families.setdefault(name, [kind, help, {}])
+            key = tuple(sorted(labels.items()))
+            if key not in family[2]:
+                family[2][key] = factory(self)
+            return family[2][key]
+
+    def counter(self, name, help, **labels):
+        return self._metric("counter", Counter, name, help, labels)
+
+    def gauge(self, name, help, **labels):
+        return self._metric("gauge", Gauge, name, help, labels)
+
+    def histogram(self, name, help, **labels):
+        return self._metric("histogram", Histogram, name, help, labels)
+
+    def collector(self, func):
+        # func() returns [(name, type, help, labels, value)], evaluated at every scrape
+        self.collectors.append(func)
+        return func
+
+    def render(self):
+        families = {}
+        with self.lock:
+            for name, (kind, help, metrics) in self.families.items():
+                families[name] = [kind, help, [line for key, metric in metrics.items()
+                                               for line in metric.samples(name, dict(key))]]
+        for collect in self.collectors:
+            try:
+                samples = collect()
+            except Exception as error:
+                print("metrics collector failed: {}".format(error))
+                continue
+            for name, kind, help, labels, value in samples:
+                family = families.setdefault(PREFIX + name, [kind, help, []])
+                family[2].append("{}{} {}".format(PREFIX + name, _labels(labels), _number(value)))
+        lines = ["# HELP {0}enabled 1 while collection is on".format(PREFIX), "# TYPE {0}enabled gauge".format(PREFIX),
+                 "{}enabled {}".format(PREFIX, int(self.enabled))]
+        for name, (kind, help, samples) in families.items():
+            lines.append("# HELP {} {}".format(name, help))
+            lines.append("# TYPE {} {}".format(name, kind))
+            lines.extend(samples)
+        return "\n".join(lines) + "\n"
+
+    def dump(self, path=STATS_FILE):
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w") as file:
+            file.write(self.render())
+        os.replace(tmp_path, path)
+
+# One registry per process, switched as a whole
+REGISTRY = Registry(enabled=os.environ.get("ACM_METRICS", "1") != "0")
+
+def counter(name, help, **labels):
+    return REGISTRY.counter(name, help, **labels)
+
+def gauge(name, help, **labels):
+    return REGISTRY.gauge(name, help, **labels)
+
+def histogram(name, help, **labels):
+    return REGISTRY.histogram(name, help, **labels)
+
+def enabled():
+    return REGISTRY.enabled
+
+def enable(flag=True):
+    REGISTRY.enabled = flag
+
+def dump(path=STATS_FILE):
+    REGISTRY.dump(path)
+
+def _ignore(stage):
+    pass
+
+class Stages:
+    # Time spent in each stage of one pass through a loop:
+    #   lap = stages.start(); write(); lap("csv"); add(); lap("rollup")
+    def __init__(self, loop, registry=REGISTRY):
+        self.loop = loop
+        self.registry = registry
+        self.histograms = {}
+
+    def start(self):
+        if not self.registry.enabled:
+            return _ignore
+        last = [time.perf_counter()]
+
+        def lap(stage):
+            now = time.perf_counter()
+            histogram = self.histograms.get(stage)
+            if histogram is None:
+                histogram = self.histograms[stage] = self.registry.histogram(
+                    "stage_seconds", "Time per stage of a loop pass", loop=self.loop, stage=stage)
+            histogram.observe(now - last[0])
+            last[0] = now
+        return lap
+
+### SCRAPE-TIME COLLECTORS ###
+def watch(scheduler=None, engine=None, modbus=(), alerts=None, push=None, uplink=None, sinks=None):
+    # Numbers the loop objects already keep, read when the metrics are rendered
+    def collect():
+        samples = []
+        schedulers = [scheduler] if scheduler is not None else []
+        if engine is not None:
+            schedulers.extend(worker.scheduler for worker in engine.buses.values())
+        for each in schedulers:
+            for task in each.tasks:
+                labels = {"scheduler": each.name, "task": task.name}
+                samples.append(("task_runs_total", "counter", "Task runs", labels, task.runs))
+                samples.append(("task_missed_deadlines_total", "counter",
+                                "Deadlines skipped because the task overran its period", labels, task.missed))
+        if engine is not None:
+            now = time.monotonic()
+            for bus, worker in engine.buses.items():
+                for name, reading in worker.readings.items():
+                    labels = {"bus": bus, "reading": name}
+                    samples.append(("reader_errors_total", "counter", "Reader calls that raised", labels, reading.errors))
+                    samples.append(("reader_age_seconds", "gauge", "Age of the latest value", labels,
+                                    None if reading.updated is None else now - reading.updated))
+        for client in modbus:
+            health = client.health
+            labels = {"slave": client.name}
+            samples.append(("modbus_requests_total", "counter", "Modbus transactions", labels, health.requests))
+            samples.append(("modbus_errors_total", "counter", "Failed Modbus transactions", labels, health.errors))
+            samples.append(("modbus_circuit_open", "gauge", "1 while the circuit breaker is open", labels,
+                            int(health.state == "open")))
+            samples.append(("modbus_timeout_seconds", "gauge", "Current serial timeout", labels, client.timeout()))
+        if alerts is not None:
+            samples.append(("alerts_active", "gauge", "Alerts currently raised", {}, len(alerts.active())))
+            samples.append(("alerts_raised_total", "counter", "Alerts raised", {}, alerts.raised))
+        if push is not None:
+            depths = [queue.qsize() for queue in list(push.clients)]
+            samples.append(("push_viewers", "gauge", "Connected live viewers", {}, len(depths)))
+            samples.append(("push_queue_depth_max", "gauge", "Deepest viewer queue", {}, max(depths, default=0)))
+            samples.append(("push_dropped_total", "counter", "Viewers dropped for falling behind", {}, push.dropped))
+        if uplink is not None:
+            samples.append(("uplink_backlog", "gauge", "Records not yet acknowledged by the collector", {},
+                            uplink.backlog()))
+            samples.append(("uplink_reconnects_total", "counter", "Uplink reconnects", {}, uplink.reconnects))
+        for name, sink in (sinks or {}).items():
+            samples.append(("sink_pending_rows", "gauge", "Rows written but not yet flushed", {"sink": name},
+                            getattr(sink, "_pending", 0)))
+        return samples
+    return REGISTRY.collector(collect)
+
+### EXPORT ###
+class _Handler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        self._reply(REGISTRY.render().encode(), "text/plain; version=0.0.4")
+
+    def do_POST(self):
+        if self.path not in ("/enable", "/disable"):
+            self.send_error(404)
+            return
+        enable(self.path == "/enable")
+        self._reply("metrics {}\n".format("enabled" if enabled() else "disabled").encode(), "text/plain")
+
+    def _reply(self, body, content_type):
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+def serve(port=PORT, host=HOST):
+    # Scrape endpoint in a daemon thread, and SIGUSR2 to toggle collection (main thread only)
+    try:
+        server = ThreadingHTTPServer((host, port), _Handler)
+    except OSError as error:
+        print("metrics endpoint not started on port {}: {}".format(port, error))
+        server = None
+    else:
+        server.daemon_threads = True
+        threading.Thread(target=server.serve_forever, name="metrics", daemon=True).start()
+    if threading.current_thread() is threading.main_thread() and hasattr(signal, "SIGUSR2"):
+        signal.signal(signal.SIGUSR2, lambda signum, frame: enable(not enabled()))
+    return server
@@ -0,0 +1,176 @@
+import threading
+import time
+import metrics
+from modbusBlocks import FLOAT_REGISTERS, REJECTED, decode_float, is_rejected, plan_blocks, split_block
+
+### MODBUS CLIENT WITH HEALTH TRACKING ###
+# One ModbusClient per slave. Every transaction updates the slave's latency and error
+# averages, and the serial timeout follows the measured latency inside fixed bounds, so
+# a healthy meter is never cut off and a dead one costs little. A read has a retry count
+# and a time budget. After FAILURE_THRESHOLD failed reads in a row the circuit opens:
+# reads return None for every register at once while a background thread probes the
+# slave with one small request, backing off until it answers and the circuit closes.
+# A block the slave rejects with an illegal address exception is split into smaller
+# reads, and the split is remembered for the following reads.
+
+CLOSED = "closed"
+OPEN = "open"
+
+MIN_TIMEOUT = 0.05          # seconds
+MAX_TIMEOUT = 1.0
+READ_BUDGET = 0.5           # seconds one read may spend on retries
+RETRIES = 2
+FAILURE_THRESHOLD = 3
+PROBE_INTERVAL = 5.0
+MAX_PROBE_INTERVAL = 60.0
+SMOOTHING = 0.1             # weight of the newest transaction in the averages
+
+class SlaveHealth:
+    def __init__(self):
+        self.state = CLOSED
+        self.requests = 0
+        self.errors = 0
+        self.latency = None     # average successful transaction time, seconds
+        self.max_latency = 0.0
+        self.error_rate = 0.0   # recent fraction of failed transactions
+        self.failed_reads = 0   # consecutive reads that lost a block
+        self.opened = 0         # times the circuit has opened
+        self.opened_at = None
+
+    def success(self, elapsed):
+        self.requests += 1
+        self.latency = elapsed if self.latency is None else self.latency + SMOOTHING * (elapsed - self.latency)
+        self.max_latency = max(self.max_latency, elapsed)
+        self.error_rate -= SMOOTHING * self.error_rate
+
+    def failure(self):
+        self.requests += 1
+        self.errors += 1
+        self.error_rate += SMOOTHING * (1 - self.error_rate)
+
+class ModbusClient:
+    def __init__(self, instr, name=None, lock=None, retries=RETRIES, read_budget=READ_BUDGET,
+                 min_timeout=MIN_TIMEOUT, max_timeout=MAX_TIMEOUT, failure_threshold=FAILURE_THRESHOLD,
+                 probe_interval=PROBE_INTERVAL, max_probe_interval=MAX_PROBE_INTERVAL):
+        self.instr = instr
+        self.name = name or "slave {}".format(getattr(instr, "address", "?"))
+        self.lock = lock or threading.Lock()
+        self.retries = retries
+        self.read_budget = read_budget
+        self.min_timeout = min_timeout
+        self.max_timeout = max_timeout
+        self.failure_threshold = failure_threshold
+        self.probe_interval = probe_interval
+        self.max_probe_interval = max_probe_interval
+        self.health = SlaveHealth()
+        self.latency = metrics.histogram("modbus_transaction_seconds", "Modbus transaction time", slave=self.name)
+        self.retried = metrics.counter("modbus_retries_total", "Modbus block reads retried", slave=self.name)
+        self._splits = {}       # (start, count) -> the blocks it is read as instead
+        self._probe_register = None
+        self._probe = None
+        self._stop = threading.Event()
+
+    def timeout(self):
+        # A few times the usual answer time, within [min_timeout, max_timeout]
+        if self.health.latency is None:
+            return self.max_timeout
+        return min(self.max_timeout, max(self.min_timeout, 2 * self.health.latency + 0.02))
+
+    def _transaction(self, start, count):
+        self.instr.serial.timeout = self.timeout()
+        began = time.perf_counter()
+        try:
+            words = self.instr.read_registers(start, count)
+        except Exception as error:
+            if is_rejected(error):
+                # the slave answered, the request was wrong
+                elapsed = time.perf_counter() - began
+                self.health.success(elapsed)
+                self.latency.observe(elapsed)
+                return REJECTED
+            self.health.failure()
+            self.latency.observe(time.perf_counter() - began)
+            return None
+        elapsed = time.perf_counter() - began
+        self.health.success(elapsed)
+        self.latency.observe(elapsed)
+        return words
+
+    def read_floats(self, registers, blocks=None):
+        # Values in the order requested, None for registers that could not be read
+        if self.health.state == OPEN:
+            return [None] * len(registers)
+        if blocks is None:
+            blocks = plan_blocks(registers)
+        if self._probe_register is None:
+            self._probe_register = blocks[0][0]
+        deadline = time.monotonic() + self.read_budget
+        values = {}
+        failed = False
+        with self.lock:
+            pending = list(blocks)
+            while pending:
+                start, count = pending.pop(0)
+                if (start, count) in self._splits:
+                    pending[:0] = self._splits[(start, count)]
+                    continue
+                words = None
+                for attempt in range(1 + self.retries):
+                    # no retry that could not finish inside the budget
+                    if attempt and deadline - time.monotonic() < self.timeout():
+                        break
+                    if attempt:
+                        self.retried.inc()
+                    words = self._transaction(start, count)
+                    if words is not None:
+                        break
+                if words is REJECTED:
+                    # a single float the slave does not map is left blank from now on
+                    smaller = split_block(start, count, registers)
+                    print("{}: block {}+{} rejected, reading {} instead".format(self.name, start, count, smaller or "nothing"))
+                    self._splits[(start, count)] = smaller
+                    pending[:0] = smaller
+                    continue
+                failed = failed or words is None
+                for register in registers:
+                    offset = register - start
+                    if 0 <= offset <= count - FLOAT_REGISTERS:
+                        values[register] = None if words is None else round(decode_float(words[offset], words[offset + 1]), 4)
+        if failed:
+            self.health.failed_reads += 1
+            if self.health.failed_reads >= self.failure_threshold:
+                self._open()
+        else:
+            self.health.failed_reads = 0
+        return [values.get(register) for register in registers]
+
+    ### CIRCUIT BREAKER ###
+    def _open(self):
+        self.health.state = OPEN
+        self.health.opened += 1
+        self.health.opened_at = time.monotonic()
+        if self._probe is None or not self._probe.is_alive():
+            self._stop.clear()
+            self._probe = threading.Thread(target=self._run_probe, name="probe-" + self.name, daemon=True)
+            self._probe.start()
+
+    def _run_probe(self):
+        interval = self.probe_interval
+        while not self._stop.wait(interval):
+            with self.lock:
+                words = self._transaction(self._probe_register, FLOAT_REGISTERS)
+            if words is not None:
+                self.health.failed_reads = 0
+                self.health.state = CLOSED
+                return
+            interval = min(interval * 2, self.max_probe_interval)
+
+    def stop(self):
+        self._stop.set()
+
+    def report(self):
+        health = self.health
+        latency = "-" if health.latency is None else "{:.1f} ms".format(health.latency * 1000)
+        return "{}: {}, {} requests, {} errors ({:.0%} recent), latency {} (max {:.1f} ms), timeout {:.2f} s, opened {}x".format(
+            self.name, health.state, health.requests, health.errors, health.error_rate, latency,
+            health.max_latency * 1000, self.timeout(), health.opened)
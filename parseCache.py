@@ -0,0 +1,158 @@
+import hashlib
+import io
+import os
+import threading
+from collections import OrderedDict
+import schemas
+
+### CONTENT-ADDRESSED PARSE CACHE ###
+# Uploaded CSVs are parsed once per distinct content. The key is a BLAKE2 hash of the
+# bytes, so re-uploading the same file, or a Streamlit rerun after a sidebar change, finds
+# the parsed frame instead of parsing again. Frames are parsed through schemas.read_csv()
+# (canonical names, compact dtypes, fixed timestamp format) and kept in two LRU tiers:
+#
+#   memory  frames of this process, evicted least recently used beyond MEMORY_BYTES
+#   disk    one Feather file per key (pickle when pyarrow is not installed) under
+#           DIRECTORY, evicted by access time beyond DISK_BYTES
+#
+# Cached frames are shared between reruns and sessions: callers filter or copy them,
+# they never modify them in place.
+
+DIRECTORY = ".parse-cache"
+MEMORY_BYTES = 256 * 1024 * 1024
+DISK_BYTES = 1024 * 1024 * 1024
+
+try:
+    import pyarrow  # noqa: F401  (Feather support in pandas)
+    EXTENSION = ".feather"
+except ImportError:
+    EXTENSION = ".pkl"
+
+def content_key(data):
+    return hashlib.blake2b(data, digest_size=16).hexdigest()
+
+def _bytes(source):
+    if isinstance(source, (bytes, bytearray)):
+        return bytes(source)
+    if isinstance(source, (str, os.PathLike)):
+        with open(source, "rb") as file:
+            return file.read()
+    if hasattr(source, "getvalue"):     # streamlit UploadedFile, BytesIO
+        return source.getvalue()
+    position = source.tell()
+    data = source.read()
+    source.seek(position)
+    return data
+
+class ParseCache:
+    def __init__(self, directory=DIRECTORY, memory_bytes=MEMORY_BYTES, disk_bytes=DISK_BYTES, parse=schemas.read_csv):
+        self.directory = directory
+        self.memory_bytes = memory_bytes
+        self.disk_bytes = disk_bytes
+        self.parse = parse
+        self.frames = OrderedDict()     # key: (frame, bytes in memory)
+        self.memory_used = 0
+        self.uploads = {}               # Streamlit upload file_id: content key
+        self.hits = {"memory": 0, "disk": 0, "parsed": 0}
+        self.lock = threading.Lock()
+
+    def load(self, source):
+        # A Streamlit upload keeps its file_id across reruns, so it is hashed only once
+        upload = getattr(source, "file_id", None)
+        key = self.uploads.get(upload) if upload is not None else None
+        data = None
+        if key is None:
+            data = _bytes(source)
+            key = content_key(data)
+            if upload is not None:
+                if len(self.uploads) >= 1024:
+                    self.uploads.clear()
+                self.uploads[upload] = key
+        with self.lock:
+            if key in self.frames:
+                self.frames.move_to_end(key)
+                self.hits["memory"] += 1
+                return self.frames[key][0]
+        frame = self._read_disk(key)
+        if frame is not None:
+            self.hits["disk"] += 1
+        else:
+            frame = self.parse(io.BytesIO(data if data is not None else _bytes(source)))
+            self.hits["parsed"] += 1
+            self._write_disk(key, frame)
+        self._remember(key, frame)
+        return frame
+
+    def _remember(self, key, frame):
+        size = int(frame.memory_usage(deep=True).sum())
+        with self.lock:
+            if key in self.frames:
+                return
+            self.frames[key] = (frame, size)
+            self.memory_used += size
+            # the newest frame stays even when it alone is over the limit
+            while self.memory_used > self.memory_bytes and len(self.frames) > 1:
+                old_frame, old_size = self.frames.popitem(last=False)[1]
+                self.memory_used -= old_size
+
+    ### DISK TIER ###
+    def _path(self, key):
+        return os.path.join(self.directory, key + EXTENSION)
+
+    def _read_disk(self, key):
+        import pandas as pd
+        path = self._path(key)
+        if not os.path.exists(path):
+            return None
+        try:
+            frame = pd.read_feather(path) if EXTENSION == ".feather" else pd.read_pickle(path)
+        except Exception:
+            os.remove(path)     # torn or unreadable entry: parse again
+            return None
+        os.utime(path)          # mtime is the access time the eviction goes by
+        return frame
+
+    def _write_disk(self, key, frame):
+        if self.disk_bytes <= 0:
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        path = self._path(key)
+        tmp_path = "{}.{}.tmp".format(path, threading.get_ident())
+        if EXTENSION == ".feather":
+            frame.reset_index(drop=True).to_feather(tmp_path)
+        else:
+            frame.to_pickle(tmp_path)
+        os.replace(tmp_path, path)
+        self._evict_disk()
+
+    def _evict_disk(self):
+        entries = []
+        for name in os.listdir(self.directory):
+            if name.endswith(EXTENSION):
+                stat = os.stat(os.path.join(self.directory, name))
+                entries.append((stat.st_mtime, stat.st_size, name))
+        total = sum(size for mtime, size, name in entries)
+        for mtime, size, name in sorted(entries)[:-1]:
+            if total <= self.disk_bytes:
+                break
+            os.remove(os.path.join(self.directory, name))
+            total -= size
+
+    def report(self):
+        return "parse cache: {} frames, {:.1f} MB in memory, {} memory hits, {} disk hits, {} parsed".format(
+            len(self.frames), self.memory_used / 1e6, self.hits["memory"], self.hits["disk"], self.hits["parsed"])
+
+# One cache per process: a Streamlit app imports this module once, while the app script
+# itself re-runs on every interaction
+_shared = None
+_shared_lock = threading.Lock()
+
+def shared():
+    global _shared
+    with _shared_lock:
+        if _shared is None:
+            _shared = ParseCache()
+        return _shared
+
+def load(source):
+    return shared().load(source)
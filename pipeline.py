@@ -0,0 +1,135 @@
+from alerts import PhaseImbalance, RateOfChange, Threshold, ZScore
+from runtimeEngine import AIR_PRESSURE_COLUMNS, CURRENT_COLUMNS, OIL_PRESSURE_COLUMNS
+
+### PER-RECORD PIPELINE ###
+# Everything that happens to a record once the acquisition script has assembled it.
+# finalCode.py, sensorsAq.py and sensorsAq2.py each build one RecordPipeline from their
+# own sinks, and replay.py builds the same pipeline over recorded days, so a replayed day
+# goes through exactly the code a live day did, in the same order:
+#
+#   runtime   RuntimeTracker.update(); finished intervals go to the runtime CSV
+#   csv       the day CSV, first so the record is stored before anything else can fail
+#   rollup    Rollup.add()
+#   alerts    AlertEngine.process()
+#   outputs   live ring, push server, uplink, column store, in the order given
+
+def _no_lap(stage):
+    pass
+
+def _position(header, names):
+    for name in names:
+        if name in header:
+            return header.index(name)
+    return None
+
+class RecordPipeline:
+    def __init__(self, header, data_sink=None, rollup=None, alert_engine=None, outputs=(),
+                 runtime_tracker=None, runtime_sink=None):
+        # outputs: [(stage name, sink)]; None sinks (an option that is off) are left out
+        self.header = header
+        self.data_sink = data_sink
+        self.rollup = rollup
+        self.alert_engine = alert_engine
+        self.outputs = [(name, sink) for name, sink in outputs if sink is not None]
+        self.runtime_tracker = runtime_tracker
+        self.runtime_sink = runtime_sink
+        self.runtime_columns = None
+        if runtime_tracker is not None:
+            columns = [_position(header, OIL_PRESSURE_COLUMNS), _position(header, AIR_PRESSURE_COLUMNS)]
+            columns.extend(_position(header, [name]) for name in CURRENT_COLUMNS)
+            if None in columns:
+                print("runtime tracking off: no oil/air pressure or phase current columns")
+                self.runtime_tracker = None
+            else:
+                self.runtime_columns = columns
+
+    def _runtime(self, row):
+        # The tracker only needs the leading measurement columns, so it can run on a
+        # record that is still being assembled
+        return self.runtime_tracker.update(row[0], *[row[index] if index < len(row) else None
+                                                     for index in self.runtime_columns])
+
+    def track_runtime(self, row, lap=_no_lap):
+        if self.runtime_tracker is None:
+            return
+        interval = self._runtime(row)
+        if interval and self.runtime_sink is not None:
+            self.runtime_sink.write(interval, row[0])
+        lap("runtime")
+
+    def write(self, row, lap=_no_lap):
+        # lap(stage) is called after each stage (metrics.Stages)
+        if self.data_sink is not None:
+            self.data_sink.write(row)
+            lap("csv")
+        if self.rollup is not None:
+            self.rollup.add(row)
+            lap("rollup")
+        if self.alert_engine is not None:
+            self.alert_engine.process(row)
+            lap("alerts")
+        for name, sink in self.outputs:
+            sink.write(row)
+            lap(name)
+
+    def process(self, row, lap=_no_lap):
+        self.track_runtime(row, lap)
+        self.write(row, lap)
+
+    def warm(self, row):
+        # State only: the runtime tracker and the alert rules see the row, nothing is
+        # written and no alert is sent
+        if self.runtime_tracker is not None:
+            self._runtime(row)
+        if self.alert_engine is not None:
+            engine = self.alert_engine
+            sinks, raised, engine.sinks = engine.sinks, engine.raised, []
+            try:
+                engine.process(row)
+            finally:
+                engine.sinks, engine.raised = sinks, raised
+
+    def close(self):
+        for sink in [self.data_sink, self.runtime_sink, self.rollup, self.alert_engine] + [sink for name, sink in self.outputs]:
+            if sink is not None:
+                sink.close()
+
+### SCRIPT DEFAULTS ###
+# Keyed by the script part of the schema generation name (schemas.py)
+
+# Columns each script keeps out of its rollup and live ring
+TEXT_COLUMNS = {"finalCode": ["Compressor_Type", "Location"], "sensorsAq2": ["E-Shutdown"], "sensorsAq": []}
+
+# The built-in alert rules of each script; an alerts.json in the working directory replaces them
+def default_rules(script):
+    if script == "finalCode":
+        return [
+            Threshold("Oil over temperature", "Oil_Temp_(F)", above=230, severity="critical"),
+            Threshold("Motor over temperature", "Motor_Temp_(F)", above=250, severity="critical"),
+            RateOfChange("Oil temperature rising fast", "Oil_Temp_(F)", limit=20, direction="rising"),
+            ZScore("Oil pressure unusual", "Oil_Pressure_(PSI)"),
+            ZScore("Vibration unusual", "Vibration_RMS_(V)"),
+            PhaseImbalance("Phase current imbalance", ["Phase_A_Current_(A)", "Phase_B_Current_(A)", "Phase_C_Current_(A)"], limit=10),
+            PhaseImbalance("Phase voltage imbalance", ["Phase_A_Voltage_(V)", "Phase_B_Voltage_(V)", "Phase_C_Voltage_(V)"], limit=3, minimum=50),
+        ]
+    if script == "sensorsAq2":
+        return [
+            Threshold("E-Shutdown pressed", "E-Shutdown", equals="E-Shutdown has been pressed", severity="critical"),
+            Threshold("Motor over temperature", "Motor Temp", above=110, severity="critical"),
+            Threshold("Oil over temperature", "Oil Temp", above=100),
+            RateOfChange("Motor temperature rising fast", "Motor Temp", limit=10, direction="rising"),
+            ZScore("Oil pressure unusual", "Oil Pressure"),
+            PhaseImbalance("Phase current imbalance", ["Phase_A_Current_(A)", "Phase_B_Current_(A)", "Phase_C_Current_(A)"], limit=10),
+            PhaseImbalance("Phase voltage imbalance", ["Phase_A_Voltage_(V)", "Phase_B_Voltage_(V)", "Phase_C_Voltage_(V)"], limit=3, minimum=50),
+        ]
+    if script == "sensorsAq":
+        return [
+            Threshold("Temperature1 high", "Temperature1", above=100),
+            Threshold("Temperature2 high", "Temperature2", above=100),
+            Threshold("Temperature3 high", "Temperature3", above=100),
+            # The phase currents are registers 1000/1002/1004 whatever the labels say, and the phase
+            # voltages 1010/1012/1014 are written past the end of the header (see schemas.py)
+            PhaseImbalance("Phase current imbalance", ["Voltage (1000)", "Current (1002)", "Voltage (1004)"], limit=10),
+            PhaseImbalance("Phase voltage imbalance", ["1010", "1012", "1014"], limit=3, minimum=50),
+        ]
+    return []
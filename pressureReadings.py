@@ -1,11 +1,9 @@
 import os
 import csv
-from time import sleep
-import busio
-import board
 from datetime import datetime, date
-import adafruit_ads1x15.ads1115 as ADS
-from adafruit_ads1x15.analog_in import AnalogIn
+import hal
+from scheduler import Scheduler
+from adsScan import AdsScanner, ScanChannel
 
 ### SENSOR FUNCTIONS ###
 def conv_pressure(voltage):
@@ -15,26 +13,45 @@ def conv_pressure2(voltage):
     return round((voltage / 3.3 - 0.1) / 0.66667, 4)
 
 ### INITIALIZE SENSORS ###
-i2c = busio.I2C(board.SCL, board.SDA)
-ads = ADS.ADS1115(i2c)
+i2c = hal.i2c()
+ads = hal.ads1115(i2c)
 
-oil_pressure = AnalogIn(ads, ADS.P0)
-air_pressure = AnalogIn(ads, ADS.P1)
-psi100_pressure = AnalogIn(ads, ADS.P2)
+# Round-robin single-shot scan at 860 SPS; every conversion is kept in pressure_scan.ring
+pressure_scan = AdsScanner(ads, [ScanChannel(0, data_rate=860, name="Oil Pressure"),
+                                 ScanChannel(1, data_rate=860, name="Air Pressure"),
+                                 ScanChannel(2, data_rate=860, name="PSI100 Pressure")])
 
 ### SETUP CSV FILE ###
 today = date.today()
-header = ["Timestamp", "Oil Pressure", "Air Pressure", "PSI100 Pressure"]
+header = ["Timestamp", "Oil Pressure", "Air Pressure", "PSI100 Pressure", "Conversions"]
 
-### DATA GATHERING LOOP ###
-while True:
+### SAMPLE RATES (seconds) ###
+RECORD_PERIOD = 1.0
+# One pass is three single-shot conversions of ~1.2 ms at 860 SPS plus the I2C traffic,
+# about 5 ms, so scans are started every 10 ms (~100 per channel per second)
+SCAN_PERIOD = 0.01
+
+### RECORD TASK ###
+scanned = 0
+
+def read_pressures():
+    global scanned
     data_list = [datetime.now()]
     
-    # Get Pressure readings
-    data_list.append(conv_pressure(oil_pressure.voltage))
-    data_list.append(conv_pressure(air_pressure.voltage))
-    data_list.append(conv_pressure2(psi100_pressure.voltage))
+    # Get Pressure readings (mean of the scans since the last record), and how many
+    # conversions they held
+    written = pressure_scan.ring.written
+    oil, air, psi100 = pressure_scan.mean_volts(scanned)
+    data_list.append(None if oil is None else conv_pressure(oil))
+    data_list.append(None if air is None else conv_pressure(air))
+    data_list.append(None if psi100 is None else conv_pressure2(psi100))
+    data_list.append(written - scanned)
+    scanned = written
     
     print(data_list)
-    
-    sleep(1)  # Sleep for 1 second to prevent too frequent sampling
+
+### DATA GATHERING LOOP ###
+scheduler = Scheduler()
+scheduler.every(SCAN_PERIOD, pressure_scan.scan, name="scan")
+scheduler.every(RECORD_PERIOD, read_pressures, offset=RECORD_PERIOD)
+scheduler.run()
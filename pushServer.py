@@ -0,0 +1,351 @@
+import asyncio
+import json
+import math
+import os
+import sys
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime
+from urllib.parse import parse_qs, urlsplit
+
+### PUSH SERVER FOR LIVE VIEWERS ###
+# Runs an asyncio HTTP server in a thread of the acquisition script. The record task
+# hands every record over with write(row), the same call as the other sinks. The record
+# is encoded once into a Server-Sent Events message and queued to every connected
+# browser, so a viewer costs a socket write per record and nothing is re-read or
+# re-rendered on the Pi. The page at / appends points to its own charts.
+#
+#   /           the live page
+#   /events     SSE stream: a "schema" event with the header, then one "record" event per
+#               record. Event ids are record numbers, so a reconnecting browser gets the
+#               records it missed from the last BACKLOG ones.
+#   /range      ?start=&end=&columns=&points=  history as JSON, raw rows from the catalog
+#               (downsampled) or rollup means when the span needs more than `points`
+#   /days       catalogued day files
+#
+# A viewer that falls QUEUE_DEPTH records behind is disconnected; its browser reconnects
+# and catches up from the backlog.
+
+# There is no access control: anyone who can reach the port reads the live records and,
+# through /range, the whole history. The server listens on the Pi itself unless
+# ACM_PUSH_HOST=0.0.0.0 opens it to the network, which should be a trusted one.
+HOST = os.environ.get("ACM_PUSH_HOST", "127.0.0.1")
+PORT = 8080
+BACKLOG = 600           # records kept for reconnecting viewers
+QUEUE_DEPTH = 120       # records a slow viewer may fall behind before it is dropped
+KEEPALIVE = 15.0        # seconds between comments on an idle stream
+MAX_REQUEST = 8192
+
+def _json_value(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, float) and not math.isfinite(value):
+        return None
+    return value
+
+def _event(kind, data, seq=None):
+    lines = "" if seq is None else "id: {}\n".format(seq)
+    return "{}event: {}\ndata: {}\n\n".format(lines, kind, data).encode()
+
+class PushServer:
+    # Same interface as csvSink.DailyCsvSink: write(row), flush(), close()
+    def __init__(self, header, port=PORT, host=HOST, directory=".", backlog=BACKLOG):
+        self.header = header
+        self.port = port
+        self.host = host
+        self.directory = directory
+        self.recent = deque(maxlen=backlog)
+        self.clients = set()
+        self.seq = 0
+        self.dropped = 0
+        self.loop = None
+        self._server = None
+        self._ready = threading.Event()
+        self._history = ThreadPoolExecutor(max_workers=1, thread_name_prefix="push-history")
+        self._catalog = None
+        self._schema = _event("schema", json.dumps({"header": header}))
+        self.thread = threading.Thread(target=self._run, name="push-server", daemon=True)
+
+    def start(self):
+        self.thread.start()
+        self._ready.wait()
+        return self
+
+    def _run(self):
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+        try:
+            self._server = self.loop.run_until_complete(
+                asyncio.start_server(self._handle, self.host, self.port, limit=MAX_REQUEST))
+        except OSError as error:
+            print("push server not started on port {}: {}".format(self.port, error))
+            self.loop = None
+            self._ready.set()
+            return
+        self._ready.set()
+        self.loop.run_forever()
+
+    ### FEED (acquisition thread) ###
+    def write(self, row, when=None):
+        if self.loop is None:
+            return
+        self.seq += 1
+        message = _event("record", json.dumps([_json_value(value) for value in row]), self.seq)
+        self.loop.call_soon_threadsafe(self._publish, self.seq, message)
+
+    def flush(self):
+        pass
+
+    def close(self):
+        if self.loop is not None:
+            self.loop.call_soon_threadsafe(self.loop.stop)
+            self.thread.join(timeout=2)
+        self._history.shutdown(wait=False)
+
+    def _publish(self, seq, message):
+        self.recent.append((seq, message))
+        for queue in list(self.clients):
+            if queue.full():
+                self._drop(queue)
+            else:
+                queue.put_nowait(message)
+
+    def _drop(self, queue):
+        self.clients.discard(queue)
+        self.dropped += 1
+        while not queue.empty():
+            queue.get_nowait()
+        queue.put_nowait(None)
+
+    ### HTTP ###
+    async def _handle(self, reader, writer):
+        try:
+            request = await reader.readuntil(b"\r\n\r\n")
+            lines = request.decode("latin-1").split("\r\n")
+            method, target = lines[0].split(" ")[:2]
+            headers = {}
+            for line in lines[1:]:
+                if ":" in line:
+                    name, value = line.split(":", 1)
+                    headers[name.strip().lower()] = value.strip()
+            url = urlsplit(target)
+            query = {name: values[-1] for name, values in parse_qs(url.query).items()}
+            if method != "GET":
+                await self._respond(writer, "405 Method Not Allowed", "text/plain", b"GET only\n")
+            elif url.path == "/":
+                await self._respond(writer, "200 OK", "text/html; charset=utf-8", PAGE.encode())
+            elif url.path == "/events":
+                await self._stream(writer, headers.get("last-event-id", query.get("since")))
+            elif url.path == "/range":
+                body = await self.loop.run_in_executor(self._history, self._range, query)
+                await self._respond(writer, "200 OK", "application/json", body)
+            elif url.path == "/days":
+                body = await self.loop.run_in_executor(self._history, self._days)
+                await self._respond(writer, "200 OK", "application/json", body)
+            else:
+                await self._respond(writer, "404 Not Found", "text/plain", b"not found\n")
+        except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, ConnectionError):
+            pass
+        except ValueError as error:
+            await self._respond(writer, "400 Bad Request", "text/plain", "{}\n".format(error).encode())
+        finally:
+            writer.close()
+
+    async def _respond(self, writer, status, content_type, body):
+        writer.write("HTTP/1.1 {}\r\nContent-Type: {}\r\nContent-Length: {}\r\nConnection: close\r\n\r\n".format(
+            status, content_type, len(body)).encode() + body)
+        await writer.drain()
+
+    async def _stream(self, writer, since):
+        writer.write(b"HTTP/1.1 200 OK\r\nContent-Type: text/event-stream\r\nCache-Control: no-cache\r\n\r\n")
+        writer.write(self._schema)
+        # registering and replaying the backlog happen without yielding to the loop, so
+        # no record is missed or sent twice
+        queue = asyncio.Queue(QUEUE_DEPTH)
+        self.clients.add(queue)
+        since = int(since) if since and since.isdigit() else None
+        for seq, message in self.recent:
+            if since is None or seq > since:
+                writer.write(message)
+        try:
+            await writer.drain()
+            while True:
+                try:
+                    message = await asyncio.wait_for(queue.get(), KEEPALIVE)
+                except asyncio.TimeoutError:
+                    message = b": keepalive\n\n"
+                if message is None:
+                    break
+                writer.write(message)
+                await writer.drain()
+        finally:
+            self.clients.discard(queue)
+
+    ### HISTORY (history thread) ###
+    def _catalog_updated(self):
+        from catalog import Catalog
+        if self._catalog is None:
+            self._catalog = Catalog(self.directory)
+        return self._catalog.update()
+
+    def _range(self, query):
+        from downsample import PLOT_POINTS, downsample_frame
+        from rollups import choose_resolution, load_rollup
+        start = datetime.fromisoformat(query["start"]) if "start" in query else None
+        end = datetime.fromisoformat(query["end"]) if "end" in query else datetime.now()
+        if start is None:
+            raise ValueError("start is required")
+        points = int(query.get("points", PLOT_POINTS))
+        columns = [column for column in query.get("columns", "").split(",") if column] or None
+        resolution = choose_resolution(start, end, points)
+        if resolution == "raw":
+            data = self._catalog_updated().read_range(start, end, columns)
+            if not data.empty:
+                numeric = [column for column in data.columns[1:] if data[column].dtype.kind in "if"]
+                data = downsample_frame(data, data.columns[0], numeric, points)
+        else:
+            data = load_rollup(self.directory, resolution, start, end)
+            if not data.empty:
+                # one series per channel: the bucket means, under the channel's own name
+                means = [column for column in data.columns if column.endswith("_mean")
+                         and (columns is None or column[:-len("_mean")] in columns)]
+                data = data[[data.columns[0]] + means].rename(columns=lambda column: column[:-len("_mean")]
+                                                              if column.endswith("_mean") else column)
+        if data.empty:
+            return json.dumps({"resolution": resolution, "columns": [], "data": []}).encode()
+        body = json.loads(data.to_json(orient="split", index=False, date_format="iso"))
+        return json.dumps({"resolution": resolution, "columns": body["columns"], "data": body["data"]}).encode()
+
+    def _days(self):
+        catalog = self._catalog_updated()
+        return json.dumps([{"file": name, "day": entry["day"], "kind": entry["kind"], "rows": entry["rows"],
+                            "first": entry["first"], "last": entry["last"]}
+                           for name, entry in sorted(catalog.files.items())]).encode()
+
+    def report(self):
+        return "push server: port {}, {} viewers, {} records sent, {} slow viewers dropped".format(
+            self.port, len(self.clients), self.seq, self.dropped)
+
+### LIVE PAGE ###
+# Plain JavaScript and canvas, so the Pi serves a few kilobytes and no library
+PAGE = """<!DOCTYPE html>
+<html><head><meta charset="utf-8"><title>Compressor live data</title>
+<style>
+body { font-family: Arial, sans-serif; margin: 16px; color: #333; }
+#charts { display: grid; grid-template-columns: repeat(auto-fill, minmax(420px, 1fr)); gap: 12px; }
+.chart { border: 1px solid #ddd; padding: 6px; }
+.chart h3 { margin: 0 0 4px; font-size: 14px; color: RebeccaPurple; }
+canvas { width: 100%; height: 160px; }
+#status { font-size: 12px; color: #777; }
+</style></head>
+<body>
+<h2>Real-Time Sensor Data</h2>
+<label>Minutes shown <input id="minutes" type="number" value="10" min="1" max="60"></label>
+<button id="history">Load history</button>
+<span id="status">connecting...</span>
+<div id="charts"></div>
+<script>
+const series = {};
+let header = [];
+const status = document.getElementById("status");
+
+function chart(name) {
+  if (!series[name]) {
+    const box = document.createElement("div");
+    box.className = "chart";
+    box.innerHTML = "<h3></h3><canvas width='840' height='320'></canvas>";
+    box.querySelector("h3").textContent = name;
+    document.getElementById("charts").appendChild(box);
+    series[name] = {t: [], v: [], canvas: box.querySelector("canvas"), title: box.querySelector("h3")};
+  }
+  return series[name];
+}
+
+function append(name, t, v) {
+  const s = chart(name);
+  s.t.push(t);
+  s.v.push(v);
+  const keep = document.getElementById("minutes").value * 60000;
+  while (s.t.length && s.t[0] < t - keep) { s.t.shift(); s.v.shift(); }
+  s.title.textContent = name + (v === null ? "" : "  " + v);
+  s.dirty = true;
+}
+
+function draw() {
+  for (const name in series) {
+    const s = series[name];
+    if (!s.dirty) continue;
+    s.dirty = false;
+    const g = s.canvas.getContext("2d"), w = s.canvas.width, h = s.canvas.height;
+    g.clearRect(0, 0, w, h);
+    const values = s.v.filter(v => v !== null);
+    if (values.length < 2) continue;
+    const lo = Math.min(...values), hi = Math.max(...values), span = (hi - lo) || 1;
+    const t0 = s.t[0], tspan = (s.t[s.t.length - 1] - t0) || 1;
+    g.strokeStyle = "#636efa";
+    g.lineWidth = 2;
+    g.beginPath();
+    let pen = false;
+    for (let i = 0; i < s.t.length; i++) {
+      if (s.v[i] === null) { pen = false; continue; }
+      const x = (s.t[i] - t0) / tspan * (w - 10) + 5, y = h - 5 - (s.v[i] - lo) / span * (h - 10);
+      pen ? g.lineTo(x, y) : g.moveTo(x, y);
+      pen = true;
+    }
+    g.stroke();
+    g.fillStyle = "#777";
+    g.font = "20px Arial";
+    g.fillText(hi.toFixed(2), 5, 20);
+    g.fillText(lo.toFixed(2), 5, h - 8);
+  }
+  requestAnimationFrame(draw);
+}
+
+function add(row, columns) {
+  const t = Date.parse(row[0]);
+  for (let i = 1; i < columns.length; i++) {
+    if (typeof row[i] === "number" || (row[i] === null && series[columns[i]])) append(columns[i], t, row[i]);
+  }
+}
+
+const events = new EventSource("events");
+events.addEventListener("schema", e => { header = JSON.parse(e.data).header; });
+events.addEventListener("record", e => { add(JSON.parse(e.data), header); status.textContent = "live, record " + e.lastEventId; });
+events.onerror = () => { status.textContent = "reconnecting..."; };
+
+document.getElementById("history").onclick = async () => {
+  const end = new Date(), start = new Date(end - document.getElementById("minutes").value * 60000);
+  const local = d => new Date(d - d.getTimezoneOffset() * 60000).toISOString().slice(0, 19);
+  const reply = await (await fetch("range?start=" + local(start) + "&end=" + local(end))).json();
+  for (const name in series) { series[name].t = []; series[name].v = []; }
+  for (const row of reply.data) add(row, reply.columns);
+};
+requestAnimationFrame(draw);
+</script>
+</body></html>
+"""
+
+if __name__ == "__main__":
+    # python pushServer.py [port]  -- serve the running acquisition script's live ring
+    # from a separate process (the scripts can also serve it themselves with --push)
+    import time
+    import liveRing
+    reader = None
+    server = None
+    while True:
+        if reader is None or reader.stale(10):
+            reader = liveRing.attach()
+            if reader is None:
+                time.sleep(1)
+                continue
+            if server is None:
+                server = PushServer(reader.header, int(sys.argv[1]) if len(sys.argv) > 1 else PORT).start()
+            sent = reader.seq
+        if reader.seq > sent:
+            frame = reader.frame(count=reader.seq - sent)
+            for row in frame.itertuples(index=False):
+                server.write([None if isinstance(value, float) and value != value else value
+                              for value in ([row[0].to_pydatetime()] + list(row[1:]))])
+            sent = reader.seq
+        time.sleep(0.1)
@@ -1,27 +1,22 @@
-import board
-import busio
-import adafruit_ads1x15.ads1115 as ADS
-from adafruit_ads1x15.analog_in import AnalogIn
-import time
+import hal
+from adsScan import AdsScanner, ScanChannel
  
-# Initialize the I2C interface
-i2c = busio.I2C(board.SCL, board.SDA)
+# Initialize the I2C interface (hal.py picks the real or simulated devices, --sim)
+i2c = hal.i2c()
  
 # Create an ADS1115 object
-ads = ADS.ADS1115(i2c, address=0x49)
+ads = hal.ads1115(i2c, address=0x49)
  
-# Define the analog input channels
-channel0 = AnalogIn(ads, ADS.P0)
-channel1 = AnalogIn(ads, ADS.P1)
-channel2 = AnalogIn(ads, ADS.P2)
-channel3 = AnalogIn(ads, ADS.P3)
+# Define the analog input channels (gain and data rate per channel)
+scanner = AdsScanner(ads, [ScanChannel(0, gain=1, data_rate=860),
+                           ScanChannel(1, gain=1, data_rate=128),
+                           ScanChannel(2, gain=1, data_rate=128),
+                           ScanChannel(3, gain=1, data_rate=128)])
  
 # Loop to read the analog inputs continuously
 while True:
-    print("Analog Value 0: ", channel0.value, "Voltage 0: ", channel0.voltage)
-    #print("Analog Value 1: ", channel1.value, "Voltage 1: ", channel1.voltage)
-    #print("Analog Value 2: ", channel2.value, "Voltage 2: ", channel2.voltage)
-    #print("Analog Value 3: ", channel3.value, "Voltage 3: ", channel3.voltage)
-    
-    # Delay for 1 second
-    time.sleep(1)
+    # Channel 0 stays in continuous mode; one second of conversions goes into the ring
+    samples = scanner.stream(0, seconds=1)
+    counts = scanner.channels[0].last
+    print("Analog Value 0: ", counts, "Voltage 0: ", scanner.latest(0), "Samples/s: ", samples)
+    #print("Analog Values 0-3: ", scanner.scan(), "Voltages 0-3: ", scanner.volts())
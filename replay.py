@@ -0,0 +1,179 @@
+import csv
+import getopt
+import glob
+import os
+import shutil
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+import compaction
+import schemas
+from alerts import ALERT_RULES, AlertEngine, LogSink, configured_rules
+from csvSink import DailyCsvSink
+from pipeline import TEXT_COLUMNS, RecordPipeline, default_rules
+from rollups import Rollup
+from runtimeEngine import RUNTIME_HEADERS, RuntimeTracker, data_files
+
+### ACCELERATED REPLAY ###
+# Feeds recorded -data.csv / -data.cdz days through the live RecordPipeline (pipeline.py)
+# as fast as the CPU allows, to try new alert rules, runtime thresholds or rollups on
+# months of history. The outputs are those of the live loop, written to --out:
+#
+#   MM-DD-YYYY-runtime.csv      runtime intervals (RuntimeTracker, with the given thresholds)
+#   MM-YYYY-rollup-*.csv        rollups
+#   alerts.log                  raised and cleared alerts (no socket or command hook)
+#
+# The days are split into one contiguous segment per job and the segments run in a
+# process pool, each into its own directory, then the files are joined in day order.
+# A segment starts with the tracker and rules warmed on the last WARMUP_ROWS records of
+# the day before it, so the only difference from --jobs 1, which is exactly the live
+# sequence, is state older than that at the few segment boundaries: a runtime interval
+# open for longer, or a z-score baseline.
+
+WARMUP_ROWS = 3600
+OUT_DIRECTORY = "replayed"
+OUTPUT_PATTERNS = ("*-runtime.csv", "*-rollup-*.csv", "alerts.log")
+
+def _header(path):
+    if path.endswith(compaction.EXTENSION):
+        return compaction.read_footer(path)["header"]
+    with open(path, newline="") as file:
+        return next(csv.reader(file))
+
+def _script(header):
+    generation = schemas.identify(header)
+    return generation.name.split("/")[0] if generation is not None else None
+
+def day_rows(path, last=None):
+    # Records of one day file as the live loop built them: python datetimes, numbers,
+    # text, and None for a blank
+    data = compaction.read_day(path)
+    time_column = data.columns[0]
+    data = data[data[time_column].notna()]
+    if last is not None:
+        data = data.tail(last)
+    times = list(data[time_column].dt.to_pydatetime())
+    values = data.iloc[:, 1:].astype(object)
+    values = values.where(values.notna(), None).values.tolist()
+    return [[when] + row for when, row in zip(times, values)]
+
+def _pipeline(header, directory, rules_path, thresholds):
+    script = _script(header)
+    text_columns = TEXT_COLUMNS.get(script, [])
+    alert_engine = AlertEngine(header, configured_rules(default_rules(script), rules_path),
+                               [LogSink(os.path.join(directory, "alerts.log"))])
+    return RecordPipeline(header, rollup=Rollup(header, text_columns, directory, fsync=False),
+                          alert_engine=alert_engine, runtime_tracker=RuntimeTracker(**thresholds),
+                          runtime_sink=DailyCsvSink("runtime", RUNTIME_HEADERS, directory, fsync=False))
+
+def replay_segment(paths, directory, warmup_path=None, rules_path=ALERT_RULES, thresholds=None):
+    began = time.perf_counter()
+    os.makedirs(directory, exist_ok=True)
+    pipeline = None
+    stats = {"days": len(paths), "rows": 0, "alerts": 0}
+    try:
+        for path in paths:
+            header = _header(path)
+            if pipeline is None or pipeline.header != header:
+                # a new header generation starts over, as the restarted script did
+                if pipeline is not None:
+                    stats["alerts"] += pipeline.alert_engine.raised
+                    pipeline.close()
+                pipeline = _pipeline(header, directory, rules_path, thresholds or {})
+                if warmup_path is not None and _header(warmup_path) == header:
+                    for row in day_rows(warmup_path, WARMUP_ROWS):
+                        pipeline.warm(row)
+            rows = day_rows(path)
+            for row in rows:
+                pipeline.process(row)
+            stats["rows"] += len(rows)
+            warmup_path = path
+    finally:
+        if pipeline is not None:
+            stats["alerts"] += pipeline.alert_engine.raised
+            pipeline.close()
+    stats["seconds"] = time.perf_counter() - began
+    return stats
+
+def _segments(paths, jobs):
+    # Contiguous runs of days of about the same size
+    sizes = [os.path.getsize(path) for path in paths]
+    target = sum(sizes) / max(1, min(jobs, len(paths)))
+    segments, current, size = [], [], 0
+    for path, path_size in zip(paths, sizes):
+        if current and size + path_size / 2 > target and len(segments) < jobs - 1:
+            segments.append(current)
+            current, size = [], 0
+        current.append(path)
+        size += path_size
+    if current:
+        segments.append(current)
+    return segments
+
+def _join(directories, out_directory):
+    # The segments cover consecutive days, so appending their files in order gives the
+    # files one sequential run writes; a rollup bucket cut at a boundary is merged when loaded
+    for directory in directories:
+        for name in sorted(os.listdir(directory)):
+            source = os.path.join(directory, name)
+            target = os.path.join(out_directory, name)
+            if not os.path.exists(target):
+                os.replace(source, target)
+                continue
+            with open(source, newline="") as file:
+                if name.endswith(".csv"):
+                    next(file)
+                with open(target, "a", newline="") as out:
+                    shutil.copyfileobj(file, out)
+        shutil.rmtree(directory)
+
+def replay(paths, out_directory=OUT_DIRECTORY, jobs=None, rules_path=ALERT_RULES, **thresholds):
+    days = data_files(paths)
+    os.makedirs(out_directory, exist_ok=True)
+    if any(glob.glob(os.path.join(out_directory, pattern)) for pattern in OUTPUT_PATTERNS):
+        raise ValueError("{} already holds replay outputs, pick an empty --out directory".format(out_directory))
+    jobs = jobs or os.cpu_count() or 1
+    if jobs == 1 or len(days) < 2:
+        return [replay_segment(days, out_directory, None, rules_path, thresholds)]
+    segments = _segments(days, jobs)
+    directories = [os.path.join(out_directory, ".segment-{}".format(index)) for index in range(len(segments))]
+    warmups = [None] + [days[days.index(segment[0]) - 1] for segment in segments[1:]]
+    with ProcessPoolExecutor(max_workers=len(segments)) as pool:
+        stats = list(pool.map(replay_segment, segments, directories, warmups,
+                              [rules_path] * len(segments), [thresholds] * len(segments)))
+    _join(directories, out_directory)
+    return stats
+
+if __name__ == "__main__":
+    # python replay.py [--out DIR] [--jobs N] [--rules alerts.json] [--oil-loaded PSI]
+    #                  [--air-unloaded PSI] [--idle-current A] [--idle-air PSI]
+    #                  <data files or directories>
+    opts, args = getopt.getopt(sys.argv[1:], "o:j:r:", ["out=", "jobs=", "rules=", "oil-loaded=", "air-unloaded=",
+                                                         "idle-current=", "idle-air="])
+    out_directory = OUT_DIRECTORY
+    jobs = None
+    rules_path = ALERT_RULES
+    thresholds = {}
+    for opt, arg in opts:
+        if opt in ("-o", "--out"):
+            out_directory = arg
+        elif opt in ("-j", "--jobs"):
+            jobs = int(arg)
+        elif opt in ("-r", "--rules"):
+            rules_path = arg
+        elif opt == "--oil-loaded":
+            thresholds["oil_loaded"] = float(arg)
+        elif opt == "--air-unloaded":
+            thresholds["air_unloaded"] = float(arg)
+        elif opt == "--idle-current":
+            thresholds["idle_current"] = float(arg)
+        elif opt == "--idle-air":
+            thresholds["idle_air"] = float(arg)
+    began = time.perf_counter()
+    stats = replay(args or ["."], out_directory, jobs, rules_path, **thresholds)
+    elapsed = time.perf_counter() - began
+    rows = sum(segment["rows"] for segment in stats)
+    for index, segment in enumerate(stats):
+        print("segment {}: {} day files, {} records, {:.1f} s".format(index, segment["days"], segment["rows"], segment["seconds"]))
+    print("replayed {} records in {:.1f} s ({:.0f} records/s), {} alerts raised, outputs in {}".format(
+        rows, elapsed, rows / elapsed if elapsed else 0, sum(segment["alerts"] for segment in stats), out_directory))
@@ -0,0 +1,301 @@
+import csv
+import getopt
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta
+import compaction
+import schemas
+from runtimeEngine import IDLE_CURRENT, RUNTIME_HEADERS
+
+### COMPRESSOR REPORTS ###
+# Daily and weekly summaries per compressor over a directory of days:
+#
+#   running / compressing hours     from the -runtime files (trusted intervals only)
+#   energy (kWh)                    Total Active Power(W), register 1034, integrated over time
+#   specific power                  kWh per m3 of air where flow and power are both logged,
+#                                   and kWh per compressing hour
+#   phase imbalance                 mean and worst current and voltage imbalance (NEMA, as
+#                                   the PhaseImbalance alert rule computes it)
+#   temperatures and pressures      min / max / mean
+#
+# Each day file is reduced by a vectorised kernel to a partial aggregate (sums, counts,
+# extremes) that merges into weeks by plain addition. The kernels run in a process pool,
+# and the partials are cached in .report-cache.json next to the days, keyed by file name,
+# size and mtime, so a re-run only reads days that are new or still being written. A
+# partial is kept after its file is removed by retention, so old weeks stay reportable.
+#
+# A directory holding day files is one compressor; a directory above them (a fleet
+# collector store, <location>/<compressor>/) is searched and each one found is reported.
+
+CACHE_FILE = ".report-cache.json"
+CACHE_VERSION = 1
+OUT_DIRECTORY = "reports"
+MAX_GAP = 10.0          # seconds; longer steps between records are gaps, not integrated over
+VOLTAGE_MINIMUM = 50.0  # V, below this the supply is off and imbalance is not counted
+TEMPERATURES = ["Oil_Temp", "Cooler_Temp", "Motor_Temp"]
+PRESSURES = ["Oil_Pressure", "Air_Pressure", "PSI100_Pressure"]
+CURRENTS = ["Phase_A_Current", "Phase_B_Current", "Phase_C_Current"]
+VOLTAGES = ["Phase_A_Voltage", "Phase_B_Voltage", "Phase_C_Voltage"]
+CHANNELS = TEMPERATURES + PRESSURES + CURRENTS + VOLTAGES + ["Total_Active_Power", "Flow_Rate"]
+
+### PER-DAY KERNELS ###
+def _values(data, name):
+    import numpy as np
+    return data[name].to_numpy(dtype="float64", na_value=np.nan) if name in data.columns else None
+
+def _integral(values, step, joined):
+    # Trapezoids over the steps that are not gaps and have a value at both ends
+    import numpy as np
+    pairs = joined & ~np.isnan(values[1:]) & ~np.isnan(values[:-1])
+    return float(((values[1:] + values[:-1]) / 2 * step)[pairs].sum()), pairs
+
+def _imbalance(data, names, minimum):
+    # [sum, count, max] of the per-record imbalance in percent
+    import numpy as np
+    if not all(name in data.columns for name in names):
+        return [0.0, 0, None]
+    phases = np.column_stack([_values(data, name) for name in names])
+    average = phases.mean(axis=1)
+    counted = ~np.isnan(average) & (average >= minimum)
+    imbalance = np.abs(phases[counted] - average[counted, None]).max(axis=1) / average[counted] * 100
+    return [float(imbalance.sum()), int(len(imbalance)), float(imbalance.max()) if len(imbalance) else None]
+
+def data_partial(path):
+    import numpy as np
+    if path.endswith(compaction.EXTENSION):
+        data = schemas.canonical_frame(compaction.load(path), CHANNELS)
+    else:
+        data = schemas.read_csv(path, CHANNELS)
+    data = data[data[schemas.TIME].notna()]
+    seconds = data[schemas.TIME].to_numpy(dtype="datetime64[ns]").astype("int64") / 1e9
+    step = np.diff(seconds)
+    joined = (step > 0) & (step <= MAX_GAP)
+    partial = {"records": len(data), "logged_seconds": float(step[joined].sum()),
+               "energy_kwh": 0.0, "power_seconds": 0.0, "air_m3": 0.0, "metered_kwh": 0.0,
+               "current_imbalance": _imbalance(data, CURRENTS, IDLE_CURRENT),
+               "voltage_imbalance": _imbalance(data, VOLTAGES, VOLTAGE_MINIMUM), "channels": {}}
+    power = _values(data, "Total_Active_Power")
+    flow = _values(data, "Flow_Rate")
+    if power is not None and len(power) > 1:
+        joules, pairs = _integral(power, step, joined)
+        partial["energy_kwh"] = joules / 3.6e6
+        partial["power_seconds"] = float(step[pairs].sum())
+    if power is not None and flow is not None and len(power) > 1:
+        # air and energy over the steps that have both, for kWh/m3
+        both = _integral(flow, step, joined)[1] & _integral(power, step, joined)[1]
+        partial["air_m3"] = _integral(flow, step, both)[0] / 60 / 1000
+        partial["metered_kwh"] = _integral(power, step, both)[0] / 3.6e6
+    for name in TEMPERATURES + PRESSURES:
+        values = _values(data, name)
+        if values is None or np.isnan(values).all():
+            continue
+        partial["channels"][name] = [float(np.nanmin(values)), float(np.nanmax(values)),
+                                     float(np.nansum(values)), int((~np.isnan(values)).sum())]
+    return partial
+
+def runtime_partial(path):
+    import pandas as pd
+    data = compaction.read_day(path)
+    trusted = pd.to_numeric(data[RUNTIME_HEADERS[4]], errors="coerce") == 1
+    durations = pd.to_numeric(data[RUNTIME_HEADERS[2]], errors="coerce")
+    labels = data[RUNTIME_HEADERS[3]].astype(str)
+    return {"running_seconds": float(durations[trusted & (labels == "Running")].sum()),
+            "compressing_seconds": float(durations[trusted & (labels == "Compressing")].sum()),
+            "intervals": int(trusted.sum()), "untrusted": int((~trusted).sum())}
+
+KERNELS = {"data": data_partial, "runtime": runtime_partial}
+
+def _compute(task):
+    kind, path = task
+    try:
+        return KERNELS[kind](path)
+    except Exception as error:
+        # an unreadable day is left out of the report and tried again next run
+        print("report: {} skipped: {}".format(path, error))
+        return None
+
+### MERGING ###
+def _add_imbalance(total, part):
+    return [total[0] + part[0], total[1] + part[1],
+            part[2] if total[2] is None else total[2] if part[2] is None else max(total[2], part[2])]
+
+def merge(partials):
+    total = {"records": 0, "logged_seconds": 0.0, "energy_kwh": 0.0, "power_seconds": 0.0, "air_m3": 0.0,
+             "metered_kwh": 0.0, "current_imbalance": [0.0, 0, None], "voltage_imbalance": [0.0, 0, None],
+             "channels": {}, "running_seconds": 0.0, "compressing_seconds": 0.0, "intervals": 0, "untrusted": 0}
+    for partial in partials:
+        for key, value in partial.items():
+            if key.endswith("_imbalance"):
+                total[key] = _add_imbalance(total[key], value)
+            elif key == "channels":
+                for name, (low, high, amount, count) in value.items():
+                    if name in total["channels"]:
+                        low = min(low, total["channels"][name][0])
+                        high = max(high, total["channels"][name][1])
+                        amount += total["channels"][name][2]
+                        count += total["channels"][name][3]
+                    total["channels"][name] = [low, high, amount, count]
+            else:
+                total[key] += value
+    return total
+
+### REPORT ROWS ###
+def report_header():
+    header = ["Compressor", "Period", "Records", "Logged_(h)", "Running_(h)", "Compressing_(h)",
+              "Energy_(kWh)", "Mean_Power_(kW)", "Specific_Power_(kWh/m3)", "Energy_per_Compressing_Hour_(kWh/h)",
+              "Current_Imbalance_Mean_(%)", "Current_Imbalance_Max_(%)",
+              "Voltage_Imbalance_Mean_(%)", "Voltage_Imbalance_Max_(%)"]
+    for name in TEMPERATURES + PRESSURES:
+        header.extend("{}_{}_({})".format(name, stat, schemas.unit(name)) for stat in ("Min", "Max", "Mean"))
+    return header
+
+def _ratio(numerator, denominator):
+    return round(numerator / denominator, 3) if denominator else None
+
+def report_row(compressor, period, total):
+    current, voltage = total["current_imbalance"], total["voltage_imbalance"]
+    compressing_hours = total["compressing_seconds"] / 3600
+    row = [compressor, period, total["records"], round(total["logged_seconds"] / 3600, 3),
+           round(total["running_seconds"] / 3600, 3), round(compressing_hours, 3),
+           round(total["energy_kwh"], 3) if total["power_seconds"] else None,
+           _ratio(total["energy_kwh"] * 3600, total["power_seconds"]),
+           _ratio(total["metered_kwh"], total["air_m3"]),
+           _ratio(total["energy_kwh"], compressing_hours) if total["power_seconds"] else None,
+           _ratio(current[0], current[1]), None if current[2] is None else round(current[2], 3),
+           _ratio(voltage[0], voltage[1]), None if voltage[2] is None else round(voltage[2], 3)]
+    for name in TEMPERATURES + PRESSURES:
+        if name in total["channels"]:
+            low, high, amount, count = total["channels"][name]
+            row.extend([round(low, 3), round(high, 3), _ratio(amount, count)])
+        else:
+            row.extend([None, None, None])
+    return row
+
+### CACHE ###
+def _load_cache(directory):
+    try:
+        with open(os.path.join(directory, CACHE_FILE)) as file:
+            cache = json.load(file)
+    except (OSError, ValueError):
+        return {}
+    return cache.get("files", {}) if cache.get("version") == CACHE_VERSION else {}
+
+def _save_cache(directory, entries):
+    path = os.path.join(directory, CACHE_FILE)
+    tmp_path = path + ".tmp"
+    try:
+        with open(tmp_path, "w") as file:
+            json.dump({"version": CACHE_VERSION, "files": entries}, file)
+        os.replace(tmp_path, path)
+    except OSError as error:
+        print("report cache not saved in {}: {}".format(directory, error))
+
+def _stat_key(path):
+    stat = os.stat(path)
+    return [stat.st_size, stat.st_mtime_ns]
+
+### BATCH ###
+def compressors(paths):
+    # {name: directory} of every directory holding day files
+    found = {}
+    for path in paths:
+        root = os.path.abspath(path)
+        for directory, subdirectories, names in os.walk(root):
+            subdirectories.sort()
+            if any(compaction.file_day(name, kind) for name in names for kind in KERNELS):
+                relative = os.path.relpath(directory, os.path.dirname(root))
+                found[relative.replace(os.sep, "/")] = directory
+    return found
+
+def collect(directories, start=None, end=None, jobs=None):
+    # {compressor: {day: merged partial}}; only files missing from the cache are read
+    entries, tasks = {}, []
+    for name, directory in directories.items():
+        cached = _load_cache(directory)
+        current = {}
+        for kind in KERNELS:
+            for day, path in compaction.day_files(directory, kind):
+                if (start and day < start) or (end and day > end):
+                    continue
+                file_name = os.path.basename(path)
+                key = _stat_key(path)
+                entry = cached.get(file_name)
+                if entry is not None and entry["key"] == key:
+                    current[file_name] = entry
+                else:
+                    current[file_name] = {"key": key, "kind": kind, "day": day.isoformat(), "partial": None}
+                    tasks.append((name, file_name, kind, path))
+        # entries of removed files stay unless another file now covers their day
+        covered = {(entry["kind"], entry["day"]) for entry in current.values()}
+        for file_name, entry in cached.items():
+            if file_name not in current and (entry["kind"], entry["day"]) not in covered:
+                current[file_name] = entry
+        entries[name] = current
+    jobs = jobs or os.cpu_count() or 1
+    work = [(kind, path) for name, file_name, kind, path in tasks]
+    if jobs == 1 or len(work) < 2:
+        results = [_compute(task) for task in work]
+    else:
+        with ProcessPoolExecutor(max_workers=min(jobs, len(work))) as pool:
+            results = list(pool.map(_compute, work))
+    for (name, file_name, kind, path), partial in zip(tasks, results):
+        if partial is None:
+            del entries[name][file_name]
+        else:
+            entries[name][file_name]["partial"] = partial
+    days = {}
+    for name, current in entries.items():
+        _save_cache(directories[name], current)
+        grouped = {}
+        for entry in current.values():
+            day = datetime.strptime(entry["day"], "%Y-%m-%d").date()
+            if (start and day < start) or (end and day > end):
+                continue
+            grouped.setdefault(day, []).append(entry["partial"])
+        days[name] = {day: merge(partials) for day, partials in sorted(grouped.items())}
+    return days, len(tasks)
+
+def write_reports(days, out_directory=OUT_DIRECTORY):
+    os.makedirs(out_directory, exist_ok=True)
+    header = report_header()
+    daily, weekly = [], []
+    for name, totals in sorted(days.items()):
+        weeks = {}
+        for day, total in totals.items():
+            daily.append(report_row(name, day.isoformat(), total))
+            weeks.setdefault(day - timedelta(days=day.weekday()), []).append(total)
+        for monday, totals_of_week in sorted(weeks.items()):
+            weekly.append(report_row(name, "week of " + monday.isoformat(), merge(totals_of_week)))
+    for file_name, rows in (("daily-report.csv", daily), ("weekly-report.csv", weekly)):
+        path = os.path.join(out_directory, file_name)
+        with open(path + ".tmp", "w", newline="") as file:
+            writer = csv.writer(file)
+            writer.writerow(header)
+            writer.writerows(rows)
+        os.replace(path + ".tmp", path)
+    return daily, weekly
+
+if __name__ == "__main__":
+    # python report.py [--out DIR] [--jobs N] [--start MM-DD-YYYY] [--end MM-DD-YYYY]
+    #                  <compressor or fleet store directories>
+    opts, args = getopt.getopt(sys.argv[1:], "o:j:", ["out=", "jobs=", "start=", "end="])
+    out_directory = OUT_DIRECTORY
+    jobs = None
+    start = end = None
+    for opt, arg in opts:
+        if opt in ("-o", "--out"):
+            out_directory = arg
+        elif opt in ("-j", "--jobs"):
+            jobs = int(arg)
+        elif opt == "--start":
+            start = datetime.strptime(arg, compaction.DATE_FORMAT).date()
+        elif opt == "--end":
+            end = datetime.strptime(arg, compaction.DATE_FORMAT).date()
+    began = time.perf_counter()
+    days, computed = collect(compressors(args or ["."]), start, end, jobs)
+    daily, weekly = write_reports(days, out_directory)
+    print("{} compressors, {} days ({} day files read, the rest cached), {} weeks in {:.1f} s; reports in {}".format(
+        len(days), len(daily), computed, len(weekly), time.perf_counter() - began, out_directory))
@@ -0,0 +1,193 @@
+import math
+import os
+import sys
+from datetime import datetime, timedelta
+from csvSink import DailyCsvSink
+import compaction
+
+### MULTI-RESOLUTION ROLLUPS ###
+# For every numeric channel the acquisition loop keeps min, max, mean, count and last
+# value over 1 minute, 15 minute and 1 hour buckets. Each sample only touches the open
+# bucket of each resolution, so the cost per sample is constant. A finished bucket is
+# appended to a monthly file such as 06-2024-rollup-1min.csv next to the daily data.
+
+RESOLUTIONS = {"1min": 60, "15min": 900, "1h": 3600}
+STATS = ("min", "max", "mean", "count", "last")
+EPOCH = datetime(1970, 1, 1)
+
+def rollup_header(time_column, channels):
+    return [time_column] + ["{}_{}".format(channel, stat) for channel in channels for stat in STATS]
+
+class Rollup:
+    def __init__(self, header, text_columns=(), directory=".", resolutions=RESOLUTIONS, fsync=True):
+        self.resolutions = resolutions
+        # column positions in the record that hold numbers
+        self.columns = [index for index, name in enumerate(header) if index > 0 and name not in text_columns]
+        self.channels = [header[index] for index in self.columns]
+        out_header = rollup_header(header[0], self.channels)
+        self.sinks = {name: DailyCsvSink("rollup-" + name, out_header, directory, flush_rows=1,
+                                          fsync=fsync, date_format="%m-%Y")
+                      for name in resolutions}
+        self.bucket = {name: None for name in resolutions}
+        self.acc = {name: self._empty() for name in resolutions}
+
+    def _empty(self):
+        # [min, max, sum, count, last] per channel
+        return [[math.inf, -math.inf, 0.0, 0, None] for channel in self.channels]
+
+    def add(self, row):
+        seconds = int((row[0] - EPOCH).total_seconds())
+        # the record's numbers are parsed once, then added to every resolution
+        values = []
+        for slot, index in enumerate(self.columns):
+            value = row[index]
+            if value is None or value == "":
+                continue
+            try:
+                value = float(value)
+            except (TypeError, ValueError):
+                continue
+            if value == value:
+                values.append((slot, value))
+        for name, period in self.resolutions.items():
+            bucket = seconds - seconds % period
+            if bucket != self.bucket[name]:
+                self._emit(name)
+                self.bucket[name] = bucket
+            accs = self.acc[name]
+            for slot, value in values:
+                acc = accs[slot]
+                if value < acc[0]:
+                    acc[0] = value
+                if value > acc[1]:
+                    acc[1] = value
+                acc[2] += value
+                acc[3] += 1
+                acc[4] = value
+
+    def _emit(self, name):
+        if self.bucket[name] is None:
+            return
+        start = EPOCH + timedelta(seconds=self.bucket[name])
+        out = [start]
+        for low, high, total, count, last in self.acc[name]:
+            if count:
+                out.extend([low, high, total / count, count, last])
+            else:
+                out.extend([None, None, None, 0, None])
+        self.sinks[name].write(out)
+        self.acc[name] = self._empty()
+
+    def close(self):
+        # The open buckets are written as they stand; if the loop restarts inside the
+        # same bucket the loader merges the two partial rows
+        for name in self.resolutions:
+            self._emit(name)
+            self.bucket[name] = None
+            self.sinks[name].close()
+
+### LOADING ###
+def choose_resolution(start, end, points=1500, resolutions=RESOLUTIONS):
+    # Finest resolution that still fits the time range into the plot's point budget,
+    # "raw" when the samples themselves fit
+    span = (end - start).total_seconds()
+    if span <= points:
+        return "raw"
+    for name, period in sorted(resolutions.items(), key=lambda item: item[1]):
+        if span / period <= points:
+            return name
+    return max(resolutions, key=resolutions.get)
+
+def _months(start, end):
+    month = datetime(start.year, start.month, 1)
+    while month <= end:
+        yield month
+        month = datetime(month.year + month.month // 12, month.month % 12 + 1, 1)
+
+def merge_rows(data, time_column):
+    # Combine rows that share a bucket (a restart mid-bucket writes it twice)
+    import pandas as pd
+    if not data[time_column].duplicated().any():
+        return data
+    channels = sorted({column.rsplit("_", 1)[0] for column in data.columns if column != time_column})
+    grouped = data.groupby(time_column, sort=True)
+    merged = {}
+    for channel in channels:
+        count = grouped[channel + "_count"].sum()
+        weighted = (data[channel + "_mean"] * data[channel + "_count"]).groupby(data[time_column]).sum()
+        merged[channel + "_min"] = grouped[channel + "_min"].min()
+        merged[channel + "_max"] = grouped[channel + "_max"].max()
+        merged[channel + "_mean"] = weighted / count.where(count > 0)
+        merged[channel + "_count"] = count
+        merged[channel + "_last"] = grouped[channel + "_last"].last()
+    return pd.DataFrame(merged).reset_index()
+
+def load_rollup(directory, resolution, start, end):
+    import pandas as pd
+    frames = []
+    for month in _months(start, end):
+        path = os.path.join(directory, "{}-rollup-{}.csv".format(month.strftime("%m-%Y"), resolution))
+        if os.path.exists(path):
+            frames.append(pd.read_csv(path))
+    if not frames:
+        return pd.DataFrame()
+    data = pd.concat(frames, ignore_index=True)
+    time_column = data.columns[0]
+    data[time_column] = pd.to_datetime(data[time_column], format="ISO8601")
+    data = merge_rows(data, time_column)
+    return data[(data[time_column] >= start) & (data[time_column] <= end)].reset_index(drop=True)
+
+### REBUILD FROM DAILY CSVs ###
+def _data_files(directory):
+    # CSV and compacted days alike
+    return [path for day, path in compaction.day_files(directory, "data")]
+
+def rollup_frame(data, time_column, period):
+    # Vectorised equivalent of Rollup.add() over a whole frame
+    import pandas as pd
+    numeric = [column for column in data.columns
+               if column != time_column and pd.api.types.is_numeric_dtype(data[column])]
+    buckets = data[time_column].dt.floor("{}s".format(period))
+    grouped = data[numeric].groupby(buckets)
+    stats = {"min": grouped.min(), "max": grouped.max(), "mean": grouped.mean(),
+             "count": grouped.count(), "last": grouped.last()}
+    out = pd.DataFrame(index=stats["min"].index)
+    for column in numeric:
+        for stat in STATS:
+            out["{}_{}".format(column, stat)] = stats[stat][column]
+    out.index.name = time_column
+    return out.reset_index()
+
+def rebuild(directory, resolutions=RESOLUTIONS):
+    import pandas as pd
+    months = {}
+    for path in _data_files(directory):
+        data = compaction.read_day(path)
+        time_column = data.columns[0]
+        for name, period in resolutions.items():
+            frame = rollup_frame(data, time_column, period)
+            for month, rows in frame.groupby(frame[time_column].dt.strftime("%m-%Y")):
+                months.setdefault((month, name), []).append(rows)
+        print("rolled up", path)
+    for (month, name), frames in months.items():
+        out_path = os.path.join(directory, "{}-rollup-{}.csv".format(month, name))
+        data = pd.concat(frames, ignore_index=True)
+        time_column = data.columns[0]
+        if os.path.exists(out_path):
+            # buckets before the first raw day left are all that remains of the days
+            # retention (compaction.py) has removed
+            kept = pd.read_csv(out_path)
+            kept[time_column] = pd.to_datetime(kept[time_column], format="ISO8601")
+            data = pd.concat([kept[kept[time_column] < data[time_column].min()], data], ignore_index=True)
+        data = merge_rows(data, time_column)
+        tmp_path = out_path + ".tmp"
+        data.to_csv(tmp_path, index=False)
+        os.replace(tmp_path, out_path)
+        print("wrote", out_path)
+
+if __name__ == "__main__":
+    # python rollups.py rebuild [data directory]
+    if len(sys.argv) < 2 or sys.argv[1] != "rebuild":
+        print("usage: python rollups.py rebuild [directory]")
+        sys.exit(1)
+    rebuild(sys.argv[2] if len(sys.argv) > 2 else ".")
@@ -0,0 +1,184 @@
+import getopt
+import os
+import sys
+import compaction
+
+### RUNNING / COMPRESSING STATE MACHINE ###
+# The logic finalCode.py used to run inline. A compressor counts as running while oil
+# pressure is above OIL_PRESSURE_LOADED or air pressure is at most AIR_PRESSURE_UNLOADED
+# and as compressing once oil pressure drops to OIL_PRESSURE_LOADED or below. Every
+# switch closes the previous interval. Any phase current below IDLE_CURRENT (phase C
+# only together with air pressure below IDLE_AIR_PRESSURE) restarts the interval clock.
+#
+# RuntimeTracker.update() is the per-sample form used by the live loop; compute_intervals()
+# is the NumPy form for months of history. Both give the same intervals for the same
+# samples, and both stamp intervals with the sample timestamps.
+
+OIL_PRESSURE_LOADED = 70
+AIR_PRESSURE_UNLOADED = 100
+IDLE_CURRENT = 1
+IDLE_AIR_PRESSURE = 5
+
+RUNTIME_HEADERS = ["start_time", "stop_time", "Duration(seconds)", "Running_or_Compressing", "Trusted"]
+
+# Column names for each header generation: finalCode.py, sensorsAq2.py
+TIME_COLUMNS = ["datetime", "Timestamp"]
+OIL_PRESSURE_COLUMNS = ["Oil_Pressure_(PSI)", "Oil Pressure"]
+AIR_PRESSURE_COLUMNS = ["Air_Pressure_(PSI)", "Air Pressure"]
+CURRENT_COLUMNS = ["Phase_A_Current_(A)", "Phase_B_Current_(A)", "Phase_C_Current_(A)"]
+
+def _below(value, limit):
+    return value is not None and value == value and value < limit
+
+def _above(value, limit):
+    return value is not None and value == value and value > limit
+
+def _at_most(value, limit):
+    return value is not None and value == value and value <= limit
+
+class RuntimeTracker:
+    def __init__(self, oil_loaded=OIL_PRESSURE_LOADED, air_unloaded=AIR_PRESSURE_UNLOADED,
+                 idle_current=IDLE_CURRENT, idle_air=IDLE_AIR_PRESSURE):
+        self.oil_loaded = oil_loaded
+        self.air_unloaded = air_unloaded
+        self.idle_current = idle_current
+        self.idle_air = idle_air
+        self.start = None   # start of the open interval
+        self.state = 0      # 1 running, 0 compressing
+
+    def update(self, when, oil_pressure, air_pressure, current_a, current_b, current_c):
+        # Returns a finished interval as a runtime row, or None
+        interval = None
+        if (self.start is None or _below(current_a, self.idle_current) or _below(current_b, self.idle_current)
+                or (_below(current_c, self.idle_current) and _below(air_pressure, self.idle_air))):
+            self.start = when
+            self.state = 1
+
+        if _above(oil_pressure, self.oil_loaded) or _at_most(air_pressure, self.air_unloaded):
+            if self.state == 0:
+                interval = self._close(when, "Running")
+            self.state = 1
+        elif _at_most(oil_pressure, self.oil_loaded):
+            if self.state == 1:
+                interval = self._close(when, "Compressing")
+            self.state = 0
+        return interval
+
+    def _close(self, when, label):
+        duration = (when - self.start).total_seconds()
+        row = [self.start, when, duration, label, 0 if duration < 0 else 1]
+        self.start = when
+        return row
+
+### VECTORISED BATCH MODE ###
+def compute_intervals(times, oil_pressure, air_pressure, current_a, current_b, current_c,
+                      oil_loaded=OIL_PRESSURE_LOADED, air_unloaded=AIR_PRESSURE_UNLOADED,
+                      idle_current=IDLE_CURRENT, idle_air=IDLE_AIR_PRESSURE):
+    # Same result as feeding every sample through RuntimeTracker.update(), without a
+    # Python loop. Missing values are NaN, which fails every comparison just like None
+    # does in the live loop.
+    import numpy as np
+    import pandas as pd
+    times = np.asarray(times, dtype="datetime64[ns]")
+    oil, air, a, b, c = (np.asarray(values, dtype=float) for values in
+                         (oil_pressure, air_pressure, current_a, current_b, current_c))
+    count = len(times)
+    if count == 0:
+        return pd.DataFrame(columns=RUNTIME_HEADERS)
+    positions = np.arange(count)
+
+    with np.errstate(invalid="ignore"):
+        restart = (a < idle_current) | (b < idle_current) | ((c < idle_current) & (air < idle_air))
+        running = (oil > oil_loaded) | (air <= air_unloaded)
+        compressing = ~running & (oil <= oil_loaded)
+    restart[0] = True
+
+    # state after each sample: running wins, then compressing, then a restart sets running,
+    # otherwise the previous state carries over (0 before the first sample)
+    decided = running | compressing | restart
+    value = np.where(running | (~compressing & restart), 1, 0)
+    last_decided = np.maximum.accumulate(np.where(decided, positions, -1))
+    state = np.where(last_decided >= 0, value[np.maximum(last_decided, 0)], 0)
+    previous = np.concatenate([[0], state[:-1]])
+
+    closes_running = running & ~restart & (previous == 0)
+    closes_compressing = compressing & (restart | (previous == 1))
+    closes = closes_running | closes_compressing
+
+    # an interval starts at the latest restart up to this sample or the latest close before it
+    last_restart = np.maximum.accumulate(np.where(restart, positions, -1))
+    last_close = np.maximum.accumulate(np.where(closes, positions, -1))
+    last_close_before = np.concatenate([[-1], last_close[:-1]])
+    start = np.maximum(last_restart, last_close_before)
+
+    stops = positions[closes]
+    starts = start[closes]
+    durations = (times[stops] - times[starts]) / np.timedelta64(1, "s")
+    return pd.DataFrame({
+        RUNTIME_HEADERS[0]: times[starts],
+        RUNTIME_HEADERS[1]: times[stops],
+        RUNTIME_HEADERS[2]: durations,
+        RUNTIME_HEADERS[3]: np.where(closes_running[closes], "Running", "Compressing"),
+        RUNTIME_HEADERS[4]: np.where(durations < 0, 0, 1),
+    })
+
+def _column(data, names):
+    for name in names:
+        if name in data.columns:
+            return data[name]
+    import numpy as np
+    return np.full(len(data), np.nan)
+
+def intervals_from_frame(data, **thresholds):
+    # Runtime intervals for a frame of -data.csv rows (finalCode.py or sensorsAq2.py headers)
+    import pandas as pd
+    times = pd.to_datetime(_column(data, TIME_COLUMNS), format="ISO8601")
+    currents = [pd.to_numeric(_column(data, [name]), errors="coerce") for name in CURRENT_COLUMNS]
+    return compute_intervals(times, pd.to_numeric(_column(data, OIL_PRESSURE_COLUMNS), errors="coerce"),
+                             pd.to_numeric(_column(data, AIR_PRESSURE_COLUMNS), errors="coerce"),
+                             *currents, **thresholds)
+
+### RECOMPUTE HISTORY ###
+def data_files(paths):
+    # -data.csv and compacted -data.cdz days, oldest first
+    dated = []
+    for path in paths:
+        if os.path.isdir(path):
+            dated.extend(compaction.day_files(path, "data"))
+        elif compaction.file_day(path) is not None:
+            dated.append((compaction.file_day(path), path))
+    return [path for day, path in sorted(dated, key=lambda item: (item[0], item[1].endswith(".csv")))]
+
+def recompute(paths, out_directory, **thresholds):
+    # The live tracker carries its state across midnight, so the days are processed as one
+    # series and every interval is filed under the day it ended, like the live loop does
+    import pandas as pd
+    frames = [compaction.read_day(path) for path in data_files(paths)]
+    if not frames:
+        return pd.DataFrame(columns=RUNTIME_HEADERS)
+    intervals = intervals_from_frame(pd.concat(frames, ignore_index=True), **thresholds)
+    os.makedirs(out_directory, exist_ok=True)
+    for day, rows in intervals.groupby(intervals[RUNTIME_HEADERS[1]].dt.strftime("%m-%d-%Y")):
+        rows.to_csv(os.path.join(out_directory, "{}-runtime.csv".format(day)), index=False)
+    return intervals
+
+if __name__ == "__main__":
+    # python runtimeEngine.py [--out DIR] [--oil-loaded PSI] [--air-unloaded PSI]
+    #                         [--idle-current A] [--idle-air PSI] <data files or directories>
+    opts, args = getopt.getopt(sys.argv[1:], "o:", ["out=", "oil-loaded=", "air-unloaded=", "idle-current=", "idle-air="])
+    out_directory = "recomputed"
+    thresholds = {}
+    for opt, arg in opts:
+        if opt in ("-o", "--out"):
+            out_directory = arg
+        elif opt == "--oil-loaded":
+            thresholds["oil_loaded"] = float(arg)
+        elif opt == "--air-unloaded":
+            thresholds["air_unloaded"] = float(arg)
+        elif opt == "--idle-current":
+            thresholds["idle_current"] = float(arg)
+        elif opt == "--idle-air":
+            thresholds["idle_air"] = float(arg)
+    intervals = recompute(args or ["."], out_directory, **thresholds)
+    for label, rows in intervals.groupby(RUNTIME_HEADERS[3]):
+        print("{}: {} intervals, {:.2f} h".format(label, len(rows), rows[RUNTIME_HEADERS[2]].sum() / 3600))
@@ -0,0 +1,97 @@
+import threading
+import time
+import metrics
+
+### MULTI-RATE DEADLINE SCHEDULER ###
+# Each task runs on its own grid of monotonic deadlines (start + k * period), so the
+# time spent doing I/O never stretches the period. A task that overruns skips the
+# deadlines it missed instead of running late catch-up calls back to back.
+
+class Task:
+    def __init__(self, name, period, func, offset=0.0):
+        self.name = name
+        self.period = period
+        self.func = func
+        self.offset = offset
+        self.deadline = None
+        self.runs = 0
+        self.missed = 0
+        self.total_jitter = 0.0
+        self.max_jitter = 0.0
+        self.max_duration = 0.0
+
+    def stats(self):
+        return {
+            "period": self.period,
+            "runs": self.runs,
+            "missed": self.missed,
+            "mean_jitter": self.total_jitter / self.runs if self.runs else 0.0,
+            "max_jitter": self.max_jitter,
+            "max_duration": self.max_duration,
+        }
+
+class Scheduler:
+    def __init__(self, clock=time.monotonic, name="main"):
+        self.clock = clock
+        self.name = name
+        self.tasks = []
+        self._stop = threading.Event()
+
+    def every(self, period, func, name=None, offset=0.0):
+        task = Task(name or func.__name__, period, func, offset)
+        task.duration = metrics.histogram("task_seconds", "Task run time", scheduler=self.name, task=task.name)
+        task.lateness = metrics.histogram("task_jitter_seconds", "Task start after its deadline",
+                                          scheduler=self.name, task=task.name)
+        if self.tasks and self.tasks[0].deadline is not None:
+            task.deadline = self.clock() + offset
+        self.tasks.append(task)
+        return task
+
+    def start(self):
+        now = self.clock()
+        for task in self.tasks:
+            task.deadline = now + task.offset
+
+    def run_pending(self):
+        # Run every task whose deadline has passed, in registration order.
+        # Returns the number of seconds until the next deadline.
+        for task in self.tasks:
+            now = self.clock()
+            if now < task.deadline:
+                continue
+            jitter = now - task.deadline
+            task.func()
+            finished = self.clock()
+            task.runs += 1
+            task.total_jitter += jitter
+            task.max_jitter = max(task.max_jitter, jitter)
+            task.max_duration = max(task.max_duration, finished - now)
+            task.duration.observe(finished - now)
+            task.lateness.observe(jitter)
+            task.deadline += task.period
+            if finished >= task.deadline:
+                skipped = int((finished - task.deadline) // task.period) + 1
+                task.missed += skipped
+                task.deadline += skipped * task.period
+        next_deadline = min((task.deadline for task in self.tasks), default=self.clock() + 1.0)
+        return max(0.0, next_deadline - self.clock())
+
+    def run(self):
+        self._stop.clear()
+        self.start()
+        while not self._stop.is_set():
+            self._stop.wait(self.run_pending())
+
+    def stop(self):
+        self._stop.set()
+
+    def stats(self):
+        return {task.name: task.stats() for task in self.tasks}
+
+    def report(self):
+        lines = []
+        for name, stats in self.stats().items():
+            lines.append("{}: every {:g}s, {} runs, {} missed, jitter mean {:.1f} ms max {:.1f} ms, longest run {:.1f} ms".format(
+                name, stats["period"], stats["runs"], stats["missed"], stats["mean_jitter"] * 1000,
+                stats["max_jitter"] * 1000, stats["max_duration"] * 1000))
+        return "\n".join(lines)
@@ -0,0 +1,254 @@
+import csv
+import os
+import re
+
+### SCHEMA REGISTRY ###
+# Every header layout the acquisition scripts have written is registered here as a
+# generation ("<script>/<version>") that maps its columns to canonical channel names.
+# Each canonical channel has one unit and one compact dtype, so a file of any generation
+# loads into the same frame: float32 channels, categorical text, timestamps parsed with
+# a single fixed format. CSV headers identify their generation; the columnar day store
+# and the live ring also record the generation name in their schema.
+#
+# A script whose header changes needs a new generation, never an edit of an old one:
+# files already on disk keep their old layout.
+
+TIME = "Timestamp"
+TIMESTAMP_FORMAT = "ISO8601"    # str(datetime) as written by csv.writer, with or without microseconds
+
+# canonical name: (unit, dtype), in the order canonical frames list them
+CHANNELS = {
+    TIME: (None, "datetime64[ns]"),
+    "Compressor_Type": (None, "category"),
+    "Location": (None, "category"),
+    "Oil_Temp": ("F", "float32"),
+    "Cooler_Temp": ("F", "float32"),
+    "Motor_Temp": ("F", "float32"),
+    "Oil_Pressure": ("PSI", "float32"),
+    "Air_Pressure": ("PSI", "float32"),
+    "PSI100_Pressure": ("PSI", "float32"),
+    "Flow_Rate": ("L/min", "float32"),
+    "Phase_A_Current": ("A", "float32"),
+    "Phase_B_Current": ("A", "float32"),
+    "Phase_C_Current": ("A", "float32"),
+    "Phase_A_Voltage": ("V", "float32"),
+    "Phase_B_Voltage": ("V", "float32"),
+    "Phase_C_Voltage": ("V", "float32"),
+    "Total_Active_Power": ("W", "float32"),
+    "Humidity": ("%RH", "float32"),
+    "E_Shutdown": (None, "category"),
+    "Vibration": ("V", "float32"),
+    "Run_Signal": ("V", "float32"),
+    "Trusted": (None, "Int8"),
+    "Vibration_RMS": ("V", "float32"),
+    "Vibration_Peak": ("V", "float32"),
+    "Vibration_Crest": (None, "float32"),
+    "Vibration_Kurtosis": (None, "float32"),
+    "Vibration_Dominant": ("Hz", "float32"),
+    "Vibration_Band_1-10Hz": ("V2", "float32"),
+    "Vibration_Band_10-50Hz": ("V2", "float32"),
+    "Vibration_Band_50-150Hz": ("V2", "float32"),
+    "Vibration_Band_150-300Hz": ("V2", "float32"),
+    "Vibration_Band_300-500Hz": ("V2", "float32"),
+}
+
+# Unit conversions applied on load, (from, to): function of a Series
+CONVERSIONS = {
+    ("C", "F"): lambda values: values * 9 / 5 + 32,
+}
+
+class Generation:
+    def __init__(self, name, time_column, columns, unnamed=()):
+        # columns: (source name, canonical name, source unit) after the time column;
+        # unnamed: the same for values written past the end of the header
+        self.name = name
+        self.time_column = time_column
+        self.header = [time_column] + [source for source, canonical, unit in columns]
+        self.layout = self.header + [source for source, canonical, unit in unnamed]
+        columns = list(columns) + list(unnamed)
+        self.columns = {source: (canonical, unit) for source, canonical, unit in columns}
+        self.sources = {canonical: source for source, canonical, unit in columns}
+        self.sources[TIME] = time_column
+
+GENERATIONS = {}
+
+def register(name, time_column, columns, unnamed=()):
+    GENERATIONS[name] = Generation(name, time_column, columns, unnamed)
+    return GENERATIONS[name]
+
+def _with_units(names):
+    # finalCode.py style names carry their unit: Oil_Temp_(F) -> (Oil_Temp, F)
+    columns = []
+    for name in names:
+        match = re.match(r"^(.*)_\((.+)\)$", name)
+        canonical, unit = (match.group(1), match.group(2)) if match else (name, None)
+        columns.append((name, canonical, CHANNELS[canonical][0] if canonical in CHANNELS else unit))
+    return columns
+
+FINAL_CODE_COLUMNS = ["Compressor_Type", "Location", "Oil_Temp_(F)", "Cooler_Temp_(F)", "Motor_Temp_(F)",
+                      "Oil_Pressure_(PSI)", "Air_Pressure_(PSI)", "Flow_Rate_(L/min)", "Phase_A_Current_(A)",
+                      "Phase_B_Current_(A)", "Phase_C_Current_(A)", "Phase_A_Voltage_(V)", "Phase_B_Voltage_(V)",
+                      "Phase_C_Voltage_(V)", "Vibration_(V)", "Run_Signal_(V)", "Trusted"]
+VIBRATION_FEATURE_COLUMNS = ["Vibration_RMS_(V)", "Vibration_Peak_(V)", "Vibration_Crest", "Vibration_Kurtosis",
+                             "Vibration_Dominant_(Hz)", "Vibration_Band_1-10Hz_(V2)", "Vibration_Band_10-50Hz_(V2)",
+                             "Vibration_Band_50-150Hz_(V2)", "Vibration_Band_150-300Hz_(V2)", "Vibration_Band_300-500Hz_(V2)"]
+
+register("finalCode/1", "datetime", _with_units(FINAL_CODE_COLUMNS))
+register("finalCode/2", "datetime", _with_units(FINAL_CODE_COLUMNS + VIBRATION_FEATURE_COLUMNS))
+
+# sensorsAq.py reads eleven meter registers but names only the first six, after their
+# register numbers; the other five values follow past the end of the header. Its meter
+# is the one sensorsAq2.py reads on the same port: 1000/1002/1004 are the phase currents
+# and 1010/1012/1014 the phase voltages, whatever the Current/Voltage labels say.
+# Thermocouples are on D17/D27/D22 like sensorsAq2.py: motor, cooler, oil, in C.
+register("sensorsAq/1", "Timestamp", [
+    ("Temperature1", "Motor_Temp", "C"), ("Temperature2", "Cooler_Temp", "C"), ("Temperature3", "Oil_Temp", "C"),
+    ("Oil Pressure", "Oil_Pressure", "PSI"), ("Air Pressure", "Air_Pressure", "PSI"),
+    ("PSI100 Pressure", "PSI100_Pressure", "PSI"),
+    ("Current (1016)", "Register_1016", None), ("Voltage (1018)", "Register_1018", None),
+    ("Current (1020)", "Register_1020", None), ("Voltage (1000)", "Phase_A_Current", "A"),
+    ("Current (1002)", "Phase_B_Current", "A"), ("Voltage (1004)", "Phase_C_Current", "A")],
+    unnamed=[("1006", "Register_1006", None), ("1008", "Register_1008", None), ("1010", "Phase_A_Voltage", "V"),
+             ("1012", "Phase_B_Voltage", "V"), ("1014", "Phase_C_Voltage", "V")])
+
+register("sensorsAq2/1", "Timestamp", [
+    ("Motor Temp", "Motor_Temp", "C"), ("Cooler Temp", "Cooler_Temp", "C"), ("Oil Temp", "Oil_Temp", "C"),
+    ("Oil Pressure", "Oil_Pressure", "PSI"), ("Air Pressure", "Air_Pressure", "PSI"),
+    ("PSI100 Pressure", "PSI100_Pressure", "PSI"),
+    ("Phase_A_Current_(A)", "Phase_A_Current", "A"), ("Phase_B_Current_(A)", "Phase_B_Current", "A"),
+    ("Phase_C_Current_(A)", "Phase_C_Current", "A"), ("Phase_A_Voltage_(V)", "Phase_A_Voltage", "V"),
+    ("Phase_B_Voltage_(V)", "Phase_B_Voltage", "V"), ("Phase_C_Voltage_(V)", "Phase_C_Voltage", "V"),
+    ("Total Active Power(W)", "Total_Active_Power", "W"), ("Humditiy", "Humidity", "%RH"),
+    ("E-Shutdown", "E_Shutdown", None)])
+
+### LOOKUP ###
+def identify(header):
+    # Generation of a header: exact match first, otherwise the generation sharing the
+    # most columns (rollup means, fleet files with a Sequence column, projected loads)
+    header = list(header)
+    for generation in GENERATIONS.values():
+        if header in (generation.header, generation.layout):
+            return generation
+    columns = set(header[1:])
+    best = max(GENERATIONS.values(), key=lambda generation: (len(columns & set(generation.header[1:])),
+                                                             -len(generation.header)))
+    shared = len(columns & set(best.header[1:]))
+    return best if shared and shared * 2 >= len(columns) else None
+
+def stamp(header):
+    # Generation name a writer records in its file's schema, None for an unregistered header
+    generation = identify(header)
+    return generation.name if generation is not None and generation.header == list(header) else None
+
+def unit(channel):
+    return CHANNELS.get(channel, (None, None))[0]
+
+def numeric_channels(channels=None):
+    return [name for name, (unit, dtype) in CHANNELS.items()
+            if dtype == "float32" and (channels is None or name in channels)]
+
+### TYPED LOADING ###
+def _plan(generation, columns):
+    # Source columns to read, their dtypes, and the canonical name and unit of each
+    wanted = [source for source in generation.layout[1:]
+              if columns is None or generation.columns[source][0] in columns]
+    dtypes = {source: CHANNELS.get(generation.columns[source][0], (None, "float32"))[1] for source in wanted}
+    return wanted, dtypes
+
+def _finish(data, generation):
+    import pandas as pd
+    time_column = generation.time_column
+    if time_column in data.columns and not pd.api.types.is_datetime64_any_dtype(data[time_column]):
+        data[time_column] = pd.to_datetime(data[time_column], format=TIMESTAMP_FORMAT)
+    if time_column in data.columns:
+        data[time_column] = data[time_column].astype(CHANNELS[TIME][1])
+    for source in data.columns:
+        if source not in generation.columns:
+            continue
+        canonical, source_unit = generation.columns[source]
+        target_unit, dtype = CHANNELS.get(canonical, (source_unit, "float32"))
+        if source_unit != target_unit and (source_unit, target_unit) in CONVERSIONS:
+            data[source] = CONVERSIONS[(source_unit, target_unit)](data[source].astype("float32"))
+        if str(data[source].dtype) != dtype:
+            data[source] = data[source].astype(dtype)
+    names = {source: generation.columns[source][0] for source in data.columns if source in generation.columns}
+    names[time_column] = TIME
+    data = data.rename(columns=names)
+    order = [name for name in CHANNELS if name in data.columns]
+    return data[order + [name for name in data.columns if name not in CHANNELS]]
+
+def _header(source):
+    if isinstance(source, (str, os.PathLike)):
+        with open(source, newline="") as file:
+            return next(csv.reader(file))
+    position = source.tell()
+    line = source.readline()
+    source.seek(position)
+    if isinstance(line, bytes):
+        line = line.decode()
+    return next(csv.reader([line]))
+
+def read_csv(source, columns=None):
+    # Load a -data.csv of any generation as a canonical frame. Only the columns whose
+    # canonical names are in `columns` (plus the timestamp) are parsed, each with its
+    # explicit dtype. Unregistered layouts are returned as read, timestamp first.
+    import pandas as pd
+    header = _header(source)
+    generation = identify(header)
+    if generation is None:
+        data = pd.read_csv(source)
+        data[data.columns[0]] = pd.to_datetime(data[data.columns[0]], format=TIMESTAMP_FORMAT)
+        return data.rename(columns={data.columns[0]: TIME})
+    wanted, dtypes = _plan(generation, columns)
+    layout = header + generation.layout[len(generation.header):] if generation.header == header else header
+    wanted = [source_column for source_column in wanted if source_column in layout]
+    dtypes = {name: ("float32" if dtype == "Int8" else dtype) for name, dtype in dtypes.items() if name in wanted}
+    # names= also covers rows that run past the header, which would otherwise become the index
+    data = pd.read_csv(source, header=None, skiprows=1, names=layout, usecols=[generation.time_column] + wanted,
+                       dtype=dtypes, index_col=False)
+    return _finish(data, generation)
+
+def canonical_frame(data, columns=None):
+    # Same result as read_csv() for a frame another loader produced (catalog ranges,
+    # the columnar store, the live ring, rollup means)
+    if data.empty:
+        return data
+    generation = identify(data.columns)
+    if generation is None:
+        return data.rename(columns={data.columns[0]: TIME})
+    if columns is not None:
+        keep = [data.columns[0]] + [source for source in data.columns[1:]
+                                    if source in generation.columns and generation.columns[source][0] in columns]
+        data = data[keep]
+    data = data.rename(columns={data.columns[0]: generation.time_column})
+    return _finish(data.copy(), generation)
+
+def concat(frames):
+    # Frames of different generations side by side: missing channels become NaN and
+    # text columns are categorical again after the merge
+    import pandas as pd
+    frames = [frame for frame in frames if not frame.empty]
+    if not frames:
+        return pd.DataFrame()
+    data = pd.concat(frames, ignore_index=True) if len(frames) > 1 else frames[0]
+    for name in data.columns:
+        dtype = CHANNELS.get(name, (None, None))[1]
+        if dtype and str(data[name].dtype) != dtype:
+            data[name] = data[name].astype(dtype)
+    return data
+
+def read_files(sources, columns=None):
+    return concat([read_csv(source, columns) for source in sources])
+
+if __name__ == "__main__":
+    # python schemas.py file.csv ...  -- generation and load size of each file
+    import sys
+    import time
+    for path in sys.argv[1:]:
+        generation = identify(_header(path))
+        began = time.perf_counter()
+        data = read_csv(path)
+        elapsed = time.perf_counter() - began
+        print("{}: {}, {} rows, {} columns, {:.1f} MB in memory, loaded in {:.2f} s".format(
+            path, generation.name if generation else "unregistered", len(data), len(data.columns),
+            data.memory_usage(deep=True).sum() / 1e6, elapsed))
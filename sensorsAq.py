@@ -1,88 +1,141 @@
-import os
 import sys
-import csv
-import busio
-import board
-import digitalio
-from time import sleep
-import minimalmodbus
-from datetime import datetime, date
-import adafruit_ads1x15.ads1115 as ADS
-from adafruit_ads1x15.analog_in import AnalogIn
-import adafruit_max31855
+from datetime import datetime
+import hal
+from adsScan import AdsScanner, ScanChannel
+from spiPool import MAX31855, SpiPool, max31855_celsius
+from modbusBlocks import plan_blocks
+from modbusClient import ModbusClient
+from scheduler import Scheduler
+import metrics
+from acquisition import AcquisitionEngine
+from csvSink import DailyCsvSink
+from compaction import COMPACT_PERIOD, BackgroundCompaction
+from colStore import DailyColumnSink
+from rollups import Rollup
+from liveRing import publish
+from pushServer import PushServer
+from alerts import AlertEngine, configured_rules, default_sinks
+from pipeline import RecordPipeline, default_rules
 
 ### SENSOR FUNCTIONS ###
-def read_temp_max31855(spi, cs):
-    max31855 = adafruit_max31855.MAX31855(spi, cs)
-    return max31855.temperature
-
 def conv_pressure(voltage):
     return round((voltage - 0.5) / 4 * 300, 4)
 
 def conv_pressure2(voltage):
     return round((voltage / 3.3 - 0.1) / 0.66667, 4)
 
-def read_modbus_float(instr, register):
-    for i in range(10):
-        try:
-            value = instr.read_float(register)
-            return round(value, 4)
-        except:
-            continue
-    return None
-
 ### INITIALIZE SENSORS ###
-i2c = busio.I2C(board.SCL, board.SDA)
-ads = ADS.ADS1115(i2c)
-spi = busio.SPI(board.SCK, MOSI=board.MOSI, MISO=board.MISO)
-cs_pins = [digitalio.DigitalInOut(pin) for pin in [board.D17, board.D27, board.D22]]
+# hal.py picks the real or simulated devices (--sim / ACM_BACKEND=sim)
+i2c = hal.i2c()
+ads = hal.ads1115(i2c)
+spi = hal.spi()
+cs_pins = [hal.output_pin(pin) for pin in ["D17", "D27", "D22"]]  # Initialized high (inactive)
+# The three MAX31855s share one lock/configure per read and are decoded together
+thermocouples = SpiPool(spi)
 for cs in cs_pins:
-    cs.direction = digitalio.Direction.OUTPUT
-    cs.value = True  # Initialize as high (inactive)
+    thermocouples.add(cs, **MAX31855)
 
-oil_pressure = AnalogIn(ads, ADS.P0)
-air_pressure = AnalogIn(ads, ADS.P1)
-psi100_pressure = AnalogIn(ads, ADS.P2)
+# Each pressure keeps its own gain and data rate; conversions also land in pressure_scan.ring
+pressure_scan = AdsScanner(ads, [ScanChannel(0, data_rate=860, name="Oil Pressure"),
+                                 ScanChannel(1, data_rate=860, name="Air Pressure"),
+                                 ScanChannel(2, data_rate=860, name="PSI100 Pressure")])
 
-instr = minimalmodbus.Instrument('/dev/ttySC0', 1)
-instr.serial.baudrate = 115200
+instr = hal.modbus_instrument('/dev/ttySC0', 1, baudrate=115200)
 instr.handle_local_echo = False
+meter_registers = [1016, 1018, 1020, 1000, 1002, 1004, 1006, 1008, 1010, 1012, 1014]
+meter_blocks = plan_blocks(meter_registers)
+# Bounded retries and timeouts; an unplugged meter opens the circuit and reads as blank
+meter = ModbusClient(instr, "meter")
 
 ### SETUP CSV FILE ###
-today = date.today()
-datafile = f"{today.strftime('%m-%d-%Y')}-data.csv"
 header = ["Timestamp", "Temperature1", "Temperature2", "Temperature3", "Oil Pressure",
           "Air Pressure", "PSI100 Pressure", "Current (1016)", "Voltage (1018)",
           "Current (1020)", "Voltage (1000)", "Current (1002)", "Voltage (1004)"]
-if not os.path.isfile(datafile):
-    with open(datafile, 'w', newline='') as file:
-        writer = csv.writer(file)
-        writer.writerow(header)
+data_sink = DailyCsvSink("data", header)
+rollup = Rollup(header)
+# Every record is also published to shared memory for the live dashboards
+live_ring = publish("data", header)
+# --binary also writes the columnar day store read by the dashboards
+binary_sink = DailyColumnSink("data", header) if "--binary" in sys.argv else None
+# --push serves a live page on port 8080 and pushes every record to the open browsers
+push_server = PushServer(header).start() if "--push" in sys.argv else None
 
-### DATA GATHERING LOOP ###
-while True:
-    data_list = [datetime.now()]
-    
+### ALERT RULES ###
+alert_engine = AlertEngine(header, configured_rules(default_rules("sensorsAq")), default_sinks())
+
+### RECORD PIPELINE ###
+# CSV, rollup, alerts, then the live outputs; replay.py runs recorded days through the same code
+pipeline = RecordPipeline(header, data_sink, rollup, alert_engine,
+                          [("live_ring", live_ring), ("push", push_server), ("binary", binary_sink)])
+
+### SAMPLE RATES (seconds) ###
+RECORD_PERIOD = 1.0
+PRESSURE_PERIOD = 1.0
+METER_PERIOD = 1.0
+TEMPERATURE_PERIOD = 1.0
+STATS_PERIOD = 60.0
+
+### CHANNEL READERS ###
+def read_temperatures():
     # Read temperatures using MAX31855
-    for cs in cs_pins:
-        cs.value = False  # Enable sensor
-        temperature = read_temp_max31855(spi, cs)
-        data_list.append(temperature)
-        cs.value = True  # Disable sensor
-    
-    # Get Pressure readings
-    data_list.append(conv_pressure(oil_pressure.voltage))
-    data_list.append(conv_pressure(air_pressure.voltage))
-    data_list.append(conv_pressure2(psi100_pressure.voltage))
-    
-    # Modbus data
-    for register in [1016, 1018, 1020, 1000, 1002, 1004, 1006, 1008, 1010, 1012, 1014]:
-        data_list.append(read_modbus_float(instr, register))
+    return max31855_celsius(thermocouples.read())
+
+def read_pressures():
+    pressure_scan.scan()
+    oil, air, psi100 = pressure_scan.volts()
+    return [conv_pressure(oil), conv_pressure(air), conv_pressure2(psi100)]
+
+def read_meter():
+    return meter.read_floats(meter_registers, meter_blocks)
+
+### RECORD TASK ###
+def write_record():
+    lap = record_stages.start()
+    latest = engine.snapshot()
+    data_list = [datetime.now()]
+    data_list.extend(latest["temperatures"])
+    data_list.extend(latest["pressures"])
+    data_list.extend(latest["meter"])
+    lap("snapshot")
     
-    # Write to CSV
-    with open(datafile, 'a', newline='') as file:
-        writer = csv.writer(file)
-        writer.writerow(data_list)
+    # CSV, rollup, alerts and the live outputs
+    pipeline.process(data_list, lap)
     print(data_list)
-    
-    sleep(1)  # Sleep for 1 second to prevent too frequent sampling
+    lap("print")
+
+def print_stats():
+    print(scheduler.report())
+    print(engine.report())
+    print(meter.report())
+    print(alert_engine.report())
+    print(compactor.report())
+    if push_server:
+        print(push_server.report())
+
+### DATA GATHERING LOOP ###
+engine = AcquisitionEngine()
+engine.bus("spi").every(TEMPERATURE_PERIOD, read_temperatures, default=[None] * len(cs_pins))
+engine.bus("i2c").every(PRESSURE_PERIOD, read_pressures, default=[None] * 3)
+engine.bus("rs485").every(METER_PERIOD, read_meter, default=[None] * len(meter_registers))
+engine.start()
+engine.wait_ready()
+
+# Latency histograms, error counters and queue depths on http://127.0.0.1:9108/metrics
+# and in metrics.prom; SIGUSR2 or POST /disable switches collection off
+record_stages = metrics.Stages("record")
+
+# Closed days are compacted, and raw days past retention removed, by a low-priority
+# process started from here at most once an hour
+compactor = BackgroundCompaction()
+
+scheduler = Scheduler()
+scheduler.every(RECORD_PERIOD, write_record)
+scheduler.every(STATS_PERIOD, print_stats, offset=STATS_PERIOD)
+scheduler.every(COMPACT_PERIOD, compactor.run, name="compaction", offset=STATS_PERIOD)
+scheduler.every(metrics.DUMP_PERIOD, metrics.dump, name="metrics", offset=metrics.DUMP_PERIOD)
+metrics.watch(scheduler, engine, [meter], alert_engine, push_server, sinks={"csv": data_sink})
+metrics.serve()
+try:
+    scheduler.run()
+finally:
+    pipeline.close()
@@ -1,39 +1,32 @@
-import os
 import sys
-import csv
-import busio
-import board
-import digitalio
-from time import sleep
-import minimalmodbus
-from datetime import datetime, date
-import adafruit_ads1x15.ads1115 as ADS
-from adafruit_ads1x15.analog_in import AnalogIn
-import adafruit_max31855
-import smbus2
+from datetime import datetime
+import hal
+from adsScan import AdsScanner, ScanChannel
+from spiPool import MAX31855, SpiPool, max31855_celsius
+from modbusBlocks import plan_blocks
+from modbusClient import ModbusClient
+from scheduler import Scheduler
+import metrics
+from acquisition import AcquisitionEngine
+from csvSink import DailyCsvSink
+from compaction import COMPACT_PERIOD, BackgroundCompaction
+from colStore import DailyColumnSink
+from rollups import Rollup
+from liveRing import publish
+from pushServer import PushServer
+from alerts import AlertEngine, configured_rules, default_sinks
+from pipeline import RecordPipeline, default_rules
 
 I2C_ADDRESS = 0x28
-i2c_bus = smbus2.SMBus(1)
+i2c_bus = hal.smbus(1)
 
 ### SENSOR FUNCTIONS ###
-def read_temp_max31855(spi, cs):
-    max31855 = adafruit_max31855.MAX31855(spi, cs)
-    return max31855.temperature
-
 def conv_pressure(voltage):
     return round((voltage - 0.5) / 4 * 300, 4)
 
 def conv_pressure2(voltage):
     return round((voltage / 3.3 - 0.1) / 0.66667, 4)
 
-def read_modbus_float(instr, register):
-    for i in range(10):
-        try:
-            value = instr.read_float(register)
-            return round(value, 4)
-        except:
-            continue
-    return None
 def read_humidity_temperature():
     # Sending a read measurement request to the sensor
     # The HYT939 doesn't require a specific command to start measurement in its default mode
@@ -63,73 +56,163 @@ def conv_pressure2(adc_value):
 '''
 
 ### INITIALIZE SENSORS ###
-i2c = busio.I2C(board.SCL, board.SDA)
-ads1 = ADS.ADS1115(i2c)
-ads2 = ADS.ADS1115(i2c, address=0x49)
-spi = busio.SPI(board.SCK, MOSI=board.MOSI, MISO=board.MISO)
-cs_pins = [digitalio.DigitalInOut(pin) for pin in [board.D17, board.D27, board.D22]]
+# hal.py picks the real or simulated devices (--sim / ACM_BACKEND=sim)
+i2c = hal.i2c()
+ads1 = hal.ads1115(i2c)
+ads2 = hal.ads1115(i2c, address=0x49)
+spi = hal.spi()
+cs_pins = [hal.output_pin(pin) for pin in ["D17", "D27", "D22"]]  # Initialized high (inactive)
+# The three MAX31855s share one lock/configure per read and are decoded together
+thermocouples = SpiPool(spi)
 for cs in cs_pins:
-    cs.direction = digitalio.Direction.OUTPUT
-    cs.value = True  # Initialize as high (inactive)
+    thermocouples.add(cs, **MAX31855)
 
-oil_pressure = AnalogIn(ads1, ADS.P0)
-air_pressure = AnalogIn(ads1, ADS.P1)
-psi100_pressure = AnalogIn(ads1, ADS.P2)
+# Pressures are scanned round-robin at 860 SPS into pressure_scan.ring; the E-Shutdown
+# input is ads2's only channel, so it stays in continuous mode and reads cost no conversion
+pressure_scan = AdsScanner(ads1, [ScanChannel(0, data_rate=860, name="Oil Pressure"),
+                                  ScanChannel(1, data_rate=860, name="Air Pressure"),
+                                  ScanChannel(2, data_rate=860, name="PSI100 Pressure")])
+e_shutdown_scan = AdsScanner(ads2, [ScanChannel(0, data_rate=860, name="E-Shutdown")])
 
 '''oil_pressure = ads1.read_adc(0)
 air_pressure = ads1.read_adc(1)
 psi100_pressure = ads1.read_adc(2)'''
 
 
-instr = minimalmodbus.Instrument('/dev/ttySC0', 1)
-instr.serial.baudrate = 9600
+instr = hal.modbus_instrument('/dev/ttySC0', 1, baudrate=9600)
 instr.handle_local_echo = False
-instr.mode = minimalmodbus.MODE_RTU  
+instr.mode = hal.MODE_RTU
 instr.clear_buffers_before_each_transaction = True
 #instr.debug = True
+meter_registers = [1000, 1002, 1004, 1010, 1012, 1014, 1034]
+meter_blocks = plan_blocks(meter_registers)
+# Bounded retries and timeouts; an unplugged meter opens the circuit and reads as blank
+meter = ModbusClient(instr, "meter")
 
 ### SETUP CSV FILE ###
-today = date.today()
-datafile = f"{today.strftime('%m-%d-%Y')}-data.csv"
 header = ["Timestamp", "Motor Temp", "Cooler Temp", "Oil Temp", "Oil Pressure",
           "Air Pressure", "PSI100 Pressure", "Phase_A_Current_(A)", "Phase_B_Current_(A)", 
            "Phase_C_Current_(A)", "Phase_A_Voltage_(V)", "Phase_B_Voltage_(V)", "Phase_C_Voltage_(V)", "Total Active Power(W)", "Humditiy", "E-Shutdown"]
-if not os.path.isfile(datafile):
-    with open(datafile, 'w', newline='') as file:
-        writer = csv.writer(file)
-        writer.writerow(header)
+data_sink = DailyCsvSink("data", header)
+rollup = Rollup(header, text_columns=["E-Shutdown"])
+# Every record is also published to shared memory for the live dashboards
+live_ring = publish("data", header, text_columns=["E-Shutdown"])
+# --binary also writes the columnar day store read by the dashboards
+binary_sink = DailyColumnSink("data", header, text_columns=["E-Shutdown"]) if "--binary" in sys.argv else None
+# --push serves a live page on port 8080 and pushes every record to the open browsers
+push_server = PushServer(header).start() if "--push" in sys.argv else None
 
-### DATA GATHERING LOOP ###
-while True:
-    data_list = [datetime.now()]
-    # Read temperatures using MAX31855
-    for cs in cs_pins:
-        cs.value = False  # Enable sensor
-        temperature = read_temp_max31855(spi, cs)
-        data_list.append(temperature)
-        cs.value = True  # Disable sensor
-    # Get Pressure readings
-    data_list.append(conv_pressure(oil_pressure.voltage))
-    data_list.append(conv_pressure(air_pressure.voltage))
-    data_list.append(conv_pressure2(psi100_pressure.voltage))
-    # Modbus data
-    for register in [1000, 1002, 1004, 1010, 1012, 1014, 1034]:
-        data_list.append(read_modbus_float(instr, register))
-    data_list.append(read_humidity_temperature())
-    # E-Shutdown logic
-    channel_value = AnalogIn(ads2, ADS.P0).value
+### ALERT RULES ###
+# Checked on every record; raised and cleared alerts go to alerts.log, the local alert
+# socket and the ACM_ALERT_COMMAND hook
+alert_engine = AlertEngine(header, configured_rules(default_rules("sensorsAq2")), default_sinks())
+
+### RECORD PIPELINE ###
+# CSV, rollup, alerts, then the live outputs; replay.py runs recorded days through the same code
+pipeline = RecordPipeline(header, data_sink, rollup, alert_engine,
+                          [("live_ring", live_ring), ("push", push_server), ("binary", binary_sink)])
+
+### SAMPLE RATES (seconds) ###
+RECORD_PERIOD = 1.0
+# A 3-channel single-shot scan at 860 SPS takes ~5 ms; each record holds the mean of the
+# ~100 scans since the one before
+SCAN_PERIOD = 0.01
+PRESSURE_PERIOD = RECORD_PERIOD
+E_SHUTDOWN_PERIOD = 0.25
+METER_PERIOD = 1.0
+TEMPERATURE_PERIOD = 2.0
+HUMIDITY_PERIOD = 10.0
+STATS_PERIOD = 60.0
+
+### CHANNEL READERS ###
+# Each reader returns its channels; the bus workers call them at their own rates
+def read_temperatures():
+    return max31855_celsius(thermocouples.read())
+
+def scan_pressures():
+    pressure_scan.scan()
+
+scanned = 0
+
+def read_pressures():
+    # Mean of every conversion since the last call, so the whole ring is used
+    global scanned
+    written = pressure_scan.ring.written
+    oil, air, psi100 = pressure_scan.mean_volts(scanned)
+    scanned = written
+    if oil is None or air is None or psi100 is None:
+        return [None] * 3
+    return [conv_pressure(oil), conv_pressure(air), conv_pressure2(psi100)]
+
+def read_meter():
+    return meter.read_floats(meter_registers, meter_blocks)
+
+def read_e_shutdown():
+    e_shutdown_scan.stream(0, samples=1)
+    channel_value = e_shutdown_scan.channels[0].last
     if channel_value < 60:
-        e_shutdown = "E-Shutdown has been pressed"
+        return "E-Shutdown has been pressed"
     elif 200 <= channel_value <= 300:
-        e_shutdown = "E-Shutdown is"
-    else:
-        e_shutdown = "Normal"
-    data_list.append(e_shutdown)
-    
-    # Write to CSV
-    with open(datafile, 'a', newline='') as file:
-        writer = csv.writer(file)
-        writer.writerow(data_list)
+        return "E-Shutdown is"
+    return "Normal"
+
+def write_record():
+    lap = record_stages.start()
+    latest = engine.snapshot()
+    data_list = [datetime.now()]
+    data_list.extend(latest["temperatures"])
+    data_list.extend(latest["pressures"])
+    data_list.extend(latest["meter"])
+    data_list.append(latest["humidity"])
+    data_list.append(latest["e_shutdown"])
+    lap("snapshot")
+
+    # CSV, rollup, alerts and the live outputs
+    pipeline.process(data_list, lap)
     print(data_list)
-    
-    sleep(1)  # Sleep for 1 second to prevent too frequent sampling
+    lap("print")
+
+def print_stats():
+    print(scheduler.report())
+    print(engine.report())
+    print(meter.report())
+    print(alert_engine.report())
+    print(compactor.report())
+    if push_server:
+        print(push_server.report())
+
+### DATA GATHERING LOOP ###
+# SPI, I2C and RS485 each run in their own worker. The ADS1115s (busio) and the HYT939
+# (smbus2) are both on I2C bus 1, so they share one worker and lock.
+engine = AcquisitionEngine()
+spi_worker = engine.bus("spi")
+spi_worker.every(TEMPERATURE_PERIOD, read_temperatures, default=[None] * len(cs_pins))
+i2c_worker = engine.bus("i2c")
+i2c_worker.every(SCAN_PERIOD, scan_pressures, name="pressure_scan")
+i2c_worker.every(PRESSURE_PERIOD, read_pressures, default=[None] * 3)
+i2c_worker.every(E_SHUTDOWN_PERIOD, read_e_shutdown)
+i2c_worker.every(HUMIDITY_PERIOD, read_humidity_temperature, name="humidity")
+rs485_worker = engine.bus("rs485")
+rs485_worker.every(METER_PERIOD, read_meter, default=[None] * len(meter_registers))
+engine.start()
+engine.wait_ready()
+
+# Latency histograms, error counters and queue depths on http://127.0.0.1:9108/metrics
+# and in metrics.prom; SIGUSR2 or POST /disable switches collection off
+record_stages = metrics.Stages("record")
+
+# Closed days are compacted, and raw days past retention removed, by a low-priority
+# process started from here at most once an hour
+compactor = BackgroundCompaction()
+
+scheduler = Scheduler()
+scheduler.every(RECORD_PERIOD, write_record)
+scheduler.every(STATS_PERIOD, print_stats, offset=STATS_PERIOD)
+scheduler.every(COMPACT_PERIOD, compactor.run, name="compaction", offset=STATS_PERIOD)
+scheduler.every(metrics.DUMP_PERIOD, metrics.dump, name="metrics", offset=metrics.DUMP_PERIOD)
+metrics.watch(scheduler, engine, [meter], alert_engine, push_server, sinks={"csv": data_sink})
+metrics.serve()
+try:
+    scheduler.run()
+finally:
+    pipeline.close()
@@ -0,0 +1,400 @@
+import csv
+import math
+import random
+import struct
+import threading
+import time
+
+### SIMULATED DEVICES ###
+# Stand-ins for the Blinka, smbus2 and minimalmodbus objects the acquisition scripts use,
+# selected through hal.py. Each device answers with the same data format as the real
+# part: MAX31855 frames on SPI, ADS1115 counts, HYT939 bytes and Modbus registers. Every
+# transaction sleeps for a configurable latency and fails at a configurable rate, so
+# loop timing and error handling can be measured off the Pi.
+
+### SIGNAL SOURCES ###
+def f_to_c(value):
+    return (value - 32) * 5 / 9
+
+def pressure_volts(psi):
+    # inverse of conv_pressure() for the 300 PSI transducers
+    return psi / 300 * 4 + 0.5
+
+def psi100_volts(value):
+    # inverse of conv_pressure2()
+    return (value * 0.66667 + 0.1) * 3.3
+
+def flow_volts(value):
+    # inverse of conv_flowRate()
+    return value / 23
+
+def e_shutdown_volts(state):
+    # voltages that land in the E-Shutdown ranges of sensorsAq2.py
+    if state == "E-Shutdown has been pressed":
+        return 0.005
+    if state == "E-Shutdown is":
+        return 0.03
+    return 3.3
+
+class SimChannel:
+    # columns: (recorded column, converter to the device's native unit) tried in order
+    # synthetic: (base, amplitude, period in seconds, noise) used when no column matches
+    def __init__(self, columns, synthetic):
+        self.columns = columns
+        self.synthetic = synthetic
+
+SIM_CHANNELS = {
+    # MAX31855 thermocouples by chip-select pin, in degrees C
+    ("thermocouple", "D17"): SimChannel([("Motor Temp", None), ("Motor_Temp_(F)", f_to_c), ("Temperature1", None)], (75.0, 5.0, 900, 0.2)),
+    ("thermocouple", "D27"): SimChannel([("Cooler Temp", None), ("Cooler_Temp_(F)", f_to_c), ("Temperature2", None)], (60.0, 4.0, 900, 0.2)),
+    ("thermocouple", "D22"): SimChannel([("Oil Temp", None), ("Oil_Temp_(F)", f_to_c), ("Temperature3", None)], (85.0, 6.0, 900, 0.2)),
+    # ADS1115 inputs by (address, channel), in volts
+    ("ads1115", 0x48, 0): SimChannel([("Oil Pressure", pressure_volts)], (1.7, 0.4, 120, 0.005)),
+    ("ads1115", 0x48, 1): SimChannel([("Air Pressure", pressure_volts)], (2.1, 0.3, 120, 0.005)),
+    ("ads1115", 0x48, 2): SimChannel([("PSI100 Pressure", psi100_volts)], (1.2, 0.1, 300, 0.005)),
+    ("ads1115", 0x48, 3): SimChannel([], (0.0, 0.0, 1, 0.001)),
+    ("ads1115", 0x49, 0): SimChannel([("E-Shutdown", e_shutdown_volts)], (3.3, 0.0, 1, 0.0)),
+    # MCP3008 inputs used by finalCode.py, in volts
+    ("mcp3008", 0): SimChannel([("Oil_Pressure_(PSI)", pressure_volts)], (1.7, 0.4, 120, 0.005)),
+    ("mcp3008", 1): SimChannel([("Air_Pressure_(PSI)", pressure_volts)], (2.1, 0.3, 120, 0.005)),
+    ("mcp3008", 2): SimChannel([("Flow_Rate_(L/min)", flow_volts)], (1.5, 0.2, 120, 0.01)),
+    ("mcp3008", 3): SimChannel([("Vibration_(V)", None)], (1.65, 0.5, 1 / 29.5, 0.05)),
+    ("mcp3008", 4): SimChannel([("Run_Signal_(V)", None)], (3.3, 0.0, 1, 0.0)),
+    # HYT939
+    ("hyt939", "humidity"): SimChannel([("Humditiy", None), ("Humidity", None)], (45.0, 5.0, 3600, 0.2)),
+    ("hyt939", "temperature"): SimChannel([], (30.0, 2.0, 3600, 0.1)),
+}
+
+# Power meter registers, laid out like the meter read by sensorsAq2.py
+SIM_METER = {
+    1000: SimChannel([("Phase_A_Current_(A)", None)], (31.2, 1.5, 60, 0.1)),
+    1002: SimChannel([("Phase_B_Current_(A)", None)], (30.8, 1.5, 60, 0.1)),
+    1004: SimChannel([("Phase_C_Current_(A)", None)], (31.5, 1.5, 60, 0.1)),
+    1006: SimChannel([], (0.0, 0.0, 1, 0.0)),
+    1008: SimChannel([], (0.0, 0.0, 1, 0.0)),
+    1010: SimChannel([("Phase_A_Voltage_(V)", None)], (479.6, 2.0, 300, 0.3)),
+    1012: SimChannel([("Phase_B_Voltage_(V)", None)], (481.2, 2.0, 300, 0.3)),
+    1014: SimChannel([("Phase_C_Voltage_(V)", None)], (480.4, 2.0, 300, 0.3)),
+    1016: SimChannel([], (31.2, 1.5, 60, 0.1)),
+    1018: SimChannel([], (30.8, 1.5, 60, 0.1)),
+    1020: SimChannel([], (31.5, 1.5, 60, 0.1)),
+    1034: SimChannel([("Total Active Power(W)", None)], (21450.0, 800.0, 60, 20.0)),
+}
+
+class Signals:
+    # Replays a recorded -data.csv at one row per second, falling back to synthetic
+    # waveforms for channels the recording does not have
+    def __init__(self, replay=None, seed=0, clock=time.monotonic):
+        self.clock = clock
+        self.start = clock()
+        self.random = random.Random(seed)
+        self.columns = {}
+        if replay:
+            with open(replay, newline="") as file:
+                reader = csv.reader(file)
+                header = next(reader)
+                rows = list(reader)
+            for index, name in enumerate(header):
+                self.columns[name] = [_parse(row[index]) if index < len(row) else None for row in rows]
+
+    def value(self, channel):
+        elapsed = self.clock() - self.start
+        for column, convert in channel.columns:
+            values = self.columns.get(column)
+            if values:
+                value = values[int(elapsed) % len(values)]
+                if value is not None:
+                    return convert(value) if convert else value
+        base, amplitude, period, noise = channel.synthetic
+        return base + amplitude * math.sin(2 * math.pi * elapsed / period) + self.random.gauss(0, noise)
+
+def _parse(text):
+    if text == "":
+        return None
+    try:
+        return float(text)
+    except ValueError:
+        return text
+
+### BUSES ###
+class SimBus:
+    # Shared latency and error model for every device on one bus
+    def __init__(self, latency=0.0, error_rate=0.0, seed=0):
+        self.latency = latency
+        self.error_rate = error_rate
+        self.random = random.Random(seed)
+        self.transactions = 0
+        self.errors = 0
+        self._lock = threading.Lock()
+
+    def transaction(self, extra=0.0):
+        self.transactions += 1
+        delay = self.latency + extra
+        if delay > 0:
+            time.sleep(delay)
+        if self.error_rate and self.random.random() < self.error_rate:
+            self.errors += 1
+            raise OSError("simulated bus error")
+
+    def try_lock(self):
+        return self._lock.acquire(False)
+
+    def unlock(self):
+        self._lock.release()
+
+class SimPin:
+    # digitalio.DigitalInOut stand-in; SimSPI answers for whichever chip select is low
+    def __init__(self, name, registry):
+        self.name = name
+        self.direction = None
+        self.value = True
+        registry[name] = self
+
+    def switch_to_output(self, value=False, drive_mode=None):
+        self.value = value
+
+class SimSPI(SimBus):
+    def __init__(self, signals, latency=0.0001, error_rate=0.0, seed=0):
+        SimBus.__init__(self, latency, error_rate, seed)
+        self.signals = signals
+        self.pins = {}
+        self.settings = {}
+
+    def configure(self, **settings):
+        self.settings = settings
+
+    def _selected(self):
+        for pin in self.pins.values():
+            if pin.value is False:
+                return pin.name
+        return None
+
+    def readinto(self, buffer, start=0, end=None, write_value=0):
+        self.transaction()
+        end = len(buffer) if end is None else end
+        channel = SIM_CHANNELS.get(("thermocouple", self._selected()))
+        if channel is None:
+            for index in range(start, end):
+                buffer[index] = 0
+            return
+        celsius = self.signals.value(channel)
+        if end - start >= 4:
+            frame = max31855_frame(celsius)
+        else:
+            frame = max6675_frame(celsius)
+        buffer[start:end] = frame[:end - start]
+
+    def write(self, buffer, start=0, end=None):
+        self.transaction()
+
+    def write_readinto(self, out_buffer, in_buffer, out_start=0, out_end=None, in_start=0, in_end=None):
+        self.readinto(in_buffer, in_start, in_end)
+
+def max31855_frame(celsius):
+    # 14-bit thermocouple temperature in 0.25 C steps, 12-bit internal temperature at 25 C
+    thermocouple = int(round(celsius * 4)) & 0x3FFF
+    internal = int(25 * 16) & 0xFFF
+    return struct.pack(">I", (thermocouple << 18) | (internal << 4))
+
+def max6675_frame(celsius):
+    # 2-byte frame decoded by conv_temp() in finalCode.py
+    return struct.pack(">H", (int(round(celsius * 4)) << 3) & 0x7FF8)
+
+class SimI2C(SimBus):
+    def __init__(self, signals, latency=0.0005, error_rate=0.0, seed=0):
+        SimBus.__init__(self, latency, error_rate, seed)
+        self.signals = signals
+
+### DEVICES ###
+class SimMAX31855:
+    # Decodes the frame the same way adafruit_max31855 does
+    def __init__(self, spi, cs):
+        self.spi = spi
+        self.cs = cs
+        self._buffer = bytearray(4)
+
+    @property
+    def temperature(self):
+        while not self.spi.try_lock():
+            time.sleep(0)
+        try:
+            self.cs.value = False
+            self.spi.readinto(self._buffer)
+            self.cs.value = True
+        finally:
+            self.spi.unlock()
+        raw = struct.unpack(">i", self._buffer)[0]
+        if raw & 0x10000:
+            raise RuntimeError("thermocouple fault")
+        return (raw >> 18) * 0.25
+
+ADS_FULL_SCALE = {2 / 3: 6.144, 1: 4.096, 2: 2.048, 4: 1.024, 8: 0.512, 16: 0.256}
+ADS_MODE_CONTINUOUS = 0x0000
+ADS_MODE_SINGLE = 0x0100
+
+class SimADS1115:
+    def __init__(self, i2c, address=0x48, gain=1, data_rate=128, mode=ADS_MODE_SINGLE):
+        self.i2c = i2c
+        self.address = address
+        self.gain = gain
+        self.data_rate = data_rate
+        self.mode = mode
+        self.bits = 16
+        self._last_pin = None
+        self._last_read = 0.0
+
+    def read(self, pin, is_differential=False):
+        now = time.monotonic()
+        if self.mode == ADS_MODE_CONTINUOUS and pin == self._last_pin:
+            # the next conversion is ready one data-rate period after the previous one
+            self.i2c.transaction(max(0.0, 1.0 / self.data_rate - (now - self._last_read)))
+        else:
+            self.i2c.transaction(1.0 / self.data_rate)
+        self._last_pin = pin
+        self._last_read = time.monotonic()
+        channel = SIM_CHANNELS.get(("ads1115", self.address, pin))
+        volts = self.i2c.signals.value(channel) if channel else 0.0
+        counts = int(volts / ADS_FULL_SCALE[self.gain] * 32768)
+        return max(-32768, min(32767, counts))
+
+class SimADSAnalogIn:
+    def __init__(self, ads, pin):
+        self.ads = ads
+        self.pin = pin
+
+    @property
+    def value(self):
+        return self.ads.read(self.pin)
+
+    @property
+    def voltage(self):
+        return self.value * ADS_FULL_SCALE[self.ads.gain] / 32767
+
+class SimMCP3008:
+    def __init__(self, spi, cs, reference_voltage=3.3):
+        self.spi = spi
+        self.cs = cs
+        self.reference_voltage = reference_voltage
+
+    def read(self, pin):
+        while not self.spi.try_lock():
+            time.sleep(0)
+        try:
+            self.spi.transaction()
+        finally:
+            self.spi.unlock()
+        channel = SIM_CHANNELS.get(("mcp3008", pin))
+        volts = self.spi.signals.value(channel) if channel else 0.0
+        return max(0, min(1023, int(volts / self.reference_voltage * 1023)))
+
+class SimMCPAnalogIn:
+    def __init__(self, mcp, pin):
+        self.mcp = mcp
+        self.pin = pin
+
+    @property
+    def value(self):
+        return self.mcp.read(self.pin) << 6
+
+    @property
+    def voltage(self):
+        return self.value * self.mcp.reference_voltage / 65535
+
+class SimSMBus(SimBus):
+    def __init__(self, signals, latency=0.001, error_rate=0.0, seed=0):
+        SimBus.__init__(self, latency, error_rate, seed)
+        self.signals = signals
+
+    def read_i2c_block_data(self, address, register, length):
+        self.transaction()
+        humidity = self.signals.value(SIM_CHANNELS[("hyt939", "humidity")])
+        temperature = self.signals.value(SIM_CHANNELS[("hyt939", "temperature")])
+        humidity_raw = max(0, min(0x3FFF, int(humidity * 16384 / 100)))
+        temperature_raw = max(0, min(0x3FFF, int((temperature + 40) * 16383 / 165))) << 2
+        data = [(humidity_raw >> 8) & 0x3F, humidity_raw & 0xFF, (temperature_raw >> 8) & 0xFF, temperature_raw & 0xFC]
+        return data[:length]
+
+    def write_byte(self, address, value):
+        self.transaction()
+
+### STAND-IN POWER METER ###
+class SimSerial:
+    def __init__(self, baudrate=9600, timeout=0.05):
+        self.baudrate = baudrate
+        self.timeout = timeout
+
+class SlaveReportedException(IOError):
+    # Named like the minimalmodbus exceptions for a Modbus exception response
+    pass
+
+class IllegalRequestError(SlaveReportedException):
+    pass
+
+class SimModbusInstrument:
+    # Behaves like minimalmodbus.Instrument for read_float/read_registers and sleeps for
+    # as long as the same RTU transaction would take on the wire. A failed transaction
+    # waits out the serial timeout and raises, like a meter that does not answer. A read
+    # that covers a register the meter does not map is answered with an illegal data
+    # address exception, as the real meter does.
+    def __init__(self, values=None, baudrate=9600, turnaround=0.005, signals=None, error_rate=0.0, seed=0):
+        self.values = values
+        self.signals = signals or Signals(seed=seed)
+        self.serial = SimSerial(baudrate)
+        self.turnaround = turnaround
+        self.error_rate = error_rate
+        self.online = True      # False: the meter is unplugged and never answers
+        self.random = random.Random(seed)
+        self.mode = "rtu"
+        self.handle_local_echo = False
+        self.clear_buffers_before_each_transaction = True
+        self.transactions = 0
+        self.errors = 0
+
+    def _wire_time(self, request_bytes, response_bytes):
+        char_time = 11.0 / self.serial.baudrate
+        # both frames plus the 3.5 character silent interval after each
+        return (request_bytes + response_bytes + 7) * char_time + self.turnaround
+
+    def _transaction(self, response_bytes):
+        self.transactions += 1
+        if not self.online or (self.error_rate and self.random.random() < self.error_rate):
+            self.errors += 1
+            time.sleep(self.serial.timeout)
+            raise IOError("No communication with the instrument (no answer)")
+        time.sleep(self._wire_time(8, response_bytes))
+
+    def _check_mapped(self, start, count):
+        registers = self.values.keys() if self.values is not None else SIM_METER.keys()
+        mapped = set(registers) | set(register + 1 for register in registers)
+        if self.online and not mapped.issuperset(range(start, start + count)):
+            self.transactions += 1
+            time.sleep(self._wire_time(8, 5))
+            raise IllegalRequestError("Slave reported illegal data address")
+
+    def _register_value(self, register):
+        if self.values is not None:
+            return self.values.get(register)
+        channel = SIM_METER.get(register)
+        return self.signals.value(channel) if channel else None
+
+    def _words(self, start, count):
+        words = [0] * count
+        registers = self.values.keys() if self.values is not None else SIM_METER.keys()
+        for register in registers:
+            offset = register - start
+            if 0 <= offset <= count - 2:
+                words[offset], words[offset + 1] = struct.unpack('>HH', struct.pack('>f', self._register_value(register)))
+        return words
+
+    def read_registers(self, registeraddress, number_of_registers, functioncode=3):
+        self._check_mapped(registeraddress, number_of_registers)
+        self._transaction(5 + 2 * number_of_registers)
+        return self._words(registeraddress, number_of_registers)
+
+    def read_float(self, registeraddress, functioncode=3, number_of_registers=2, byteorder=0):
+        self._check_mapped(registeraddress, 2)
+        self._transaction(9)
+        return struct.unpack('>f', struct.pack('>HH', *self._words(registeraddress, 2)))[0]
+
+# Values used by `python modbusBlocks.py` so both read paths see the same registers
+DEFAULT_METER_VALUES = {register: channel.synthetic[0] for register, channel in SIM_METER.items()}
@@ -0,0 +1,80 @@
+import struct
+import time
+import metrics
+
+### PERSISTENT SPI DEVICE POOL ###
+# Chips are registered once at startup. Every read cycle takes the bus lock and calls
+# configure() once per group of chips sharing the same SPI settings, clocks each chip's
+# frame into one preallocated buffer for the group, and unpacks the whole buffer with a
+# single struct call. Nothing is allocated per chip per cycle.
+
+# MAX31855 thermocouple amplifier: 32-bit frame, SPI mode 0 (adafruit_max31855 defaults)
+MAX31855 = {"frame": 4, "baudrate": 100000, "phase": 0, "polarity": 0}
+# 16-bit thermocouple frame read by finalCode.py
+MAX6675 = {"frame": 2, "baudrate": 4000000, "phase": 0, "polarity": 0}
+
+FRAME_FORMATS = {2: "H", 4: "i"}
+
+class SpiGroup:
+    def __init__(self, frame, baudrate, phase, polarity):
+        self.frame = frame
+        self.settings = {"baudrate": baudrate, "phase": phase, "polarity": polarity}
+        self.pins = []
+        self.slots = []     # position of each chip in the pool's read order
+        self.buffer = bytearray()
+        self.format = ""
+
+    def add(self, cs, slot):
+        self.pins.append(cs)
+        self.slots.append(slot)
+        self.buffer = bytearray(self.frame * len(self.pins))
+        self.format = ">{}{}".format(len(self.pins), FRAME_FORMATS[self.frame])
+
+class SpiPool:
+    def __init__(self, spi):
+        self.spi = spi
+        self.groups = {}
+        self.count = 0
+        self.latency = []
+
+    def add(self, cs, frame=4, baudrate=100000, phase=0, polarity=0):
+        # Register a chip; read() returns its frame at the returned position
+        key = (frame, baudrate, phase, polarity)
+        if key not in self.groups:
+            self.groups[key] = SpiGroup(frame, baudrate, phase, polarity)
+        cs.value = True
+        self.groups[key].add(cs, self.count)
+        self.latency.append(metrics.histogram("spi_frame_seconds", "SPI frame read per chip", chip=self.count))
+        self.count += 1
+        return self.count - 1
+
+    def read(self):
+        # Raw frames of every chip as integers, in the order they were added
+        frames = [None] * self.count
+        while not self.spi.try_lock():
+            time.sleep(0)
+        try:
+            for group in self.groups.values():
+                self.spi.configure(**group.settings)
+                for index, cs in enumerate(group.pins):
+                    began = time.perf_counter()
+                    cs.value = False
+                    self.spi.readinto(group.buffer, start=index * group.frame, end=(index + 1) * group.frame)
+                    cs.value = True
+                    self.latency[group.slots[index]].observe(time.perf_counter() - began)
+        finally:
+            self.spi.unlock()
+        for group in self.groups.values():
+            for slot, raw in zip(group.slots, struct.unpack(group.format, group.buffer)):
+                frames[slot] = raw
+        return frames
+
+### FRAME DECODING ###
+def max31855_celsius(frames):
+    # Thermocouple temperature in 0.25 C steps from the top 14 bits; None when the chip
+    # flags a fault (open circuit or short to GND/VCC)
+    return [None if raw & 0x10000 else (raw >> 18) * 0.25 for raw in frames]
+
+def max6675_celsius(frames):
+    # Same decoding as conv_temp() in finalCode.py, in C
+    return [((raw & 0x7ff8) >> 3) * 0.25 for raw in frames]
@@ -1,30 +1,43 @@
 # Import necessary libraries
 import streamlit as st  # Streamlit framework for creating web apps
-import pandas as pd  # Pandas for data manipulation
 import plotly.express as px  # Plotly Express for interactive plots
 import os  # Operating system interfaces
-from datetime import date  # Date handling
+from datetime import date, datetime, timedelta  # Date handling
 import time  # Time access and conversions
+import colStore  # Columnar day store written with --binary
+import liveRing  # Shared-memory ring published by the acquisition script
+from tailReader import CsvTail  # Incremental CSV reader
+from downsample import downsample_frame, window  # Plot decimation
 
 # Add a title to the Streamlit web app
 st.title('Real-Time Sensor Data Visualization')
 
-# Define a function to read sensor data from a CSV file, caching it to improve performance
-@st.cache_data(ttl=60)
+# Define a function to read sensor data, parsing only the rows appended since the last refresh
 def get_data(file_path):
-    try:
-        # Attempt to read the CSV file
-        data = pd.read_csv(file_path)
-        # Convert 'Timestamp' column to datetime objects
-        data['Timestamp'] = pd.to_datetime(data['Timestamp'])
-        return data
-    except FileNotFoundError:
-        # Return an empty DataFrame if the file is not found
-        return pd.DataFrame()
+    # Prefer the columnar store when the acquisition script writes one, it loads without parsing
+    binary_path = file_path[:-len(".csv")] + ".col"
+    if os.path.isdir(binary_path):
+        return colStore.load_day(binary_path)
+    # The tail reader starts over by itself when the file name changes at midnight
+    return st.session_state.tail.read(file_path)
+
+# Define a function to read the last minutes straight from the acquisition script's
+# shared-memory ring; returns None when no acquisition script is publishing one
+def get_live_data(window_length):
+    reader = st.session_state.get('live')
+    # A ring that stopped moving belongs to a script that exited or restarted
+    if reader is None or reader.stale(10):
+        reader = liveRing.attach()
+        st.session_state.live = reader
+    if reader is None:
+        return None
+    return reader.frame(seconds=window_length.total_seconds())
 
 # Define a function to create a line plot using the data
 def create_plot(data, metrics):
     if not data.empty and metrics:
+        # Cut long series down to about one point per pixel, keeping spikes
+        data = downsample_frame(data, 'Timestamp', metrics)
         # Create a line plot with markers for selected metrics over time
         fig = px.line(data, x='Timestamp', y=metrics, title='Sensor Data over Time', markers=True)
         # Customize line width and mode
@@ -57,9 +70,9 @@ metrics = st.sidebar.multiselect(
     default=["Temperature1", "Oil Pressure"]
 )
 
-# Prepare the file path for the CSV file based on today's date
-today = date.today()
-datafile = f"{today.strftime('%m-%d-%Y')}-data.csv"
+# Let the user zoom the plot into a recent window; short windows are plotted at full resolution
+windows = {"Full day": None, "Last hour": timedelta(hours=1), "Last 10 minutes": timedelta(minutes=10)}
+plot_window = st.sidebar.selectbox('Plot window', list(windows))
 
 # Create containers to display the plot and DataFrame
 plot_container = st.empty()
@@ -68,10 +81,18 @@ data_container = st.empty()
 # Initialize session state to track iterations
 if 'iteration' not in st.session_state:
     st.session_state.iteration = 0
+if 'tail' not in st.session_state:
+    st.session_state.tail = CsvTail()
 
-# Main loop to update the data and refresh the plot continuously
+# Main loop to update the data and refresh the plot continuously. This page polls once a
+# second; the event-driven view is the push server's live page (--push)
 while True:
-    data = get_data(datafile)  # Load data
+    # Prepare the file path for the CSV file based on today's date
+    datafile = f"{date.today().strftime('%m-%d-%Y')}-data.csv"
+    # Recent windows come from shared memory; the full day still needs the file on disk
+    data = get_live_data(windows[plot_window]) if windows[plot_window] is not None else None
+    if data is None or data.empty:
+        data = get_data(datafile)  # Load new data
     if not data.empty:
         # Update the DataFrame display every 10 iterations or the first iteration
         if st.session_state.iteration == 0 or st.session_state.iteration % 10 == 0:
@@ -79,7 +100,10 @@ while True:
             data_container.dataframe(data)
         st.session_state.iteration += 1
         
-        fig = create_plot(data, metrics)  # Generate the plot
+        if windows[plot_window] is not None:
+            fig = create_plot(window(data, 'Timestamp', datetime.now() - windows[plot_window]), metrics)
+        else:
+            fig = create_plot(data, metrics)  # Generate the plot
         if isinstance(fig, str):
             plot_container.write(fig)  # Display error message if necessary
         elif fig:
@@ -1,24 +1,45 @@
 import streamlit as st
-import pandas as pd
 import plotly.express as px
+from datetime import date, datetime, time
+import colStore
+from downsample import downsample_frame, window
+from catalog import Catalog
+import schemas
+import parseCache
 
 # Streamlit UI for file upload
 st.title('Compressor Data Visualization')
-uploaded_file = st.file_uploader("Choose a CSV file", type="csv")
-
-if uploaded_file is not None:
-    # Reading the uploaded data
-    data = pd.read_csv(uploaded_file)
-    data['datetime'] = pd.to_datetime(data['datetime'])
-
-    # Data Filtering UI
-    compressor_type = st.sidebar.multiselect('Compressor Type', options=data['Compressor_Type'].unique(), default=data['Compressor_Type'].unique())
-    location = st.sidebar.multiselect('Location', options=data['Location'].unique(), default=data['Location'].unique())
-    trusted = st.sidebar.checkbox('Only Trusted Data', value=True)
+source = st.sidebar.radio('Data source', ['Upload CSV', 'CSV directory', 'Binary day store'])
+data = None
+if source == 'Upload CSV':
+    uploaded_file = st.file_uploader("Choose a CSV file", type="csv")
+    if uploaded_file is not None:
+        # Reading the uploaded data under the canonical channel names, whichever script wrote it;
+        # parsed once per distinct file, filter changes reuse the cached frame
+        data = parseCache.load(uploaded_file)
+else:
+    # Days written by finalCode.py, as daily CSVs or with --binary
+    directory = st.sidebar.text_input('Data directory', '.')
+    days = st.sidebar.date_input('Days', value=(date.today(), date.today()))
+    if days:
+        start, end = days if len(days) == 2 else (days[0], days[0])
+        if source == 'CSV directory':
+            data = Catalog(directory).update().read_range(datetime.combine(start, time.min), datetime.combine(end, time.max))
+        else:
+            data = colStore.load_range(directory, start, end)
+        data = schemas.canonical_frame(data)
+        if data.empty:
+            data = None
 
-    # Applying Filters
-    filtered_data = data[data['Compressor_Type'].isin(compressor_type) & data['Location'].isin(location)]
-    if trusted:
+if data is not None:
+    # Data Filtering UI (files from sensorsAq.py/sensorsAq2.py have no type, location or trust flag)
+    filtered_data = data
+    if 'Compressor_Type' in data.columns:
+        compressor_type = st.sidebar.multiselect('Compressor Type', options=data['Compressor_Type'].unique(), default=data['Compressor_Type'].unique())
+        location = st.sidebar.multiselect('Location', options=data['Location'].unique(), default=data['Location'].unique())
+        # Applying Filters
+        filtered_data = data[data['Compressor_Type'].isin(compressor_type) & data['Location'].isin(location)]
+    if 'Trusted' in data.columns and st.sidebar.checkbox('Only Trusted Data', value=True):
         filtered_data = filtered_data[filtered_data['Trusted'] == 1]
 
     # Displaying filtered data
@@ -27,28 +48,38 @@ if uploaded_file is not None:
     # Visualization selection
     metric = st.sidebar.selectbox('Select metric to visualize', 
                                   ['All Phase Currents', 'All Phase Voltages'] + 
-                                  ['Oil_Temp_(F)', 'Cooler_Temp_(F)', 'Motor_Temp_(F)', 
-                                   'Oil_Pressure_(PSI)', 'Air_Pressure_(PSI)', 'Flow_Rate_(L/min)'])
+                                  [channel for channel in ['Oil_Temp', 'Cooler_Temp', 'Motor_Temp',
+                                   'Oil_Pressure', 'Air_Pressure', 'Flow_Rate'] if channel in data.columns])
 
-    # Plotting
+    # Narrowing the window brings back full resolution once it fits the chart
+    plot_data = filtered_data
+    if not plot_data.empty:
+        first, last = plot_data['Timestamp'].min().to_pydatetime(), plot_data['Timestamp'].max().to_pydatetime()
+        if first < last:
+            start, end = st.sidebar.slider('Time window', min_value=first, max_value=last, value=(first, last))
+            plot_data = window(plot_data, 'Timestamp', start, end)
+
+    # Plotting, cut down to about one point per pixel while keeping spikes
     if metric in ['All Phase Currents', 'All Phase Voltages']:
         if metric == 'All Phase Currents':
-            fig = px.line(filtered_data, x='datetime', 
-                          y=['Phase_A_Current_(A)', 'Phase_B_Current_(A)', 'Phase_C_Current_(A)'], 
+            columns = ['Phase_A_Current', 'Phase_B_Current', 'Phase_C_Current']
+            fig = px.line(downsample_frame(plot_data, 'Timestamp', columns), x='Timestamp', 
+                          y=columns, 
                           title='Phase Currents over Time')
         else:
-            fig = px.line(filtered_data, x='datetime', 
-                          y=['Phase_A_Voltage_(V)', 'Phase_B_Voltage_(V)', 'Phase_C_Voltage_(V)'], 
+            columns = ['Phase_A_Voltage', 'Phase_B_Voltage', 'Phase_C_Voltage']
+            fig = px.line(downsample_frame(plot_data, 'Timestamp', columns), x='Timestamp', 
+                          y=columns, 
                           title='Phase Voltages over Time')
     else:
-        fig = px.line(filtered_data, x='datetime', y=metric, title=f'{metric} over Time', markers=True,
+        fig = px.line(downsample_frame(plot_data, 'Timestamp', [metric]), x='Timestamp', y=metric, title=f'{metric} over Time', markers=True,
                       color_discrete_sequence=px.colors.qualitative.Set2)
         fig.update_traces(line=dict(width=2.5), mode='markers+lines')
     
     # Customizing the layout for all plots
     fig.update_layout(
         xaxis_title='DateTime',
-        yaxis_title=metric,
+        yaxis_title='{} ({})'.format(metric, schemas.unit(columns[0] if metric.startswith('All') else metric)),
         font=dict(family='Arial, sans-serif', size=12, color='RebeccaPurple'),
         hovermode='x unified',
         margin=dict(l=20, r=20, t=40, b=20),
@@ -59,5 +90,7 @@ if uploaded_file is not None:
     fig.update_traces(hovertemplate='<b>Time:</b> %{x}<br><b>Value:</b> %{y}')
     
     st.plotly_chart(fig, use_container_width=True)
-else:
+elif source == 'Upload CSV':
     st.write("Please upload a CSV file to proceed.")
+else:
+    st.write("No stored data for the selected days.")
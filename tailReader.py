@@ -0,0 +1,116 @@
+import csv
+import io
+import os
+import numpy as np
+import pandas as pd
+import schemas
+
+### INCREMENTAL CSV TAIL READER ###
+# Remembers how far into the file it has parsed and only parses rows appended since the
+# last call. A line without its newline yet is held back until the writer finishes it.
+# Passing a different path (the next day's file), or finding the file shorter than what
+# was already read, on another inode or with another header line (replaced rather than
+# appended to), starts over from the top of that file. Values a script writes past the
+# end of its header (sensorsAq.py) get the registry's names (schemas.py).
+# The parsed rows are copied into per-column arrays with spare capacity, so a refresh
+# costs the new rows rather than the whole day; the frame handed out is a view of the
+# filled part, built only when rows were added. A column whose type changes partway
+# (a blank, then text) is moved to a wider array once.
+
+INITIAL_ROWS = 4096
+
+def _common_dtype(old, new):
+    try:
+        return np.result_type(old, new)
+    except TypeError:
+        return np.dtype(object)
+
+class CsvTail:
+    def __init__(self):
+        self.reset()
+
+    def reset(self, path=None):
+        self.path = path
+        self.offset = 0
+        self.header = None
+        self.names = None       # header plus the registry's names for values past its end
+        self.inode = None
+        self._header_line = None
+        self.rows = 0
+        self._columns = {}      # name -> array whose first self.rows entries are filled
+        self._frame = pd.DataFrame()
+        self._partial = b""
+
+    @property
+    def frame(self):
+        if self._frame is None:
+            self._frame = pd.DataFrame({name: column[:self.rows] for name, column in self._columns.items()}, copy=False)
+        return self._frame
+
+    def _append(self, rows):
+        # Only entries past self.rows are written, so frames handed out earlier stay as they were
+        filled = self.rows + len(rows)
+        for name in self.names:
+            values = rows[name].to_numpy()
+            column = self._columns.get(name)
+            if column is None:
+                column = np.empty(max(filled, INITIAL_ROWS), dtype=values.dtype)
+            else:
+                dtype = _common_dtype(column.dtype, values.dtype)
+                if len(column) < filled or dtype != column.dtype:
+                    grown = np.empty(max(filled, 2 * len(column)), dtype=dtype)
+                    grown[:self.rows] = column[:self.rows]
+                    column = grown
+            column[self.rows:filled] = values
+            self._columns[name] = column
+        self.rows = filled
+        self._frame = None
+
+    def _same_header(self, path):
+        if self._header_line is None:
+            return True
+        with open(path, "rb") as file:
+            return file.read(len(self._header_line)) == self._header_line
+
+    def read(self, path):
+        if path != self.path:
+            self.reset(path)
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            self.reset(path)
+            return self.frame
+        size = stat.st_size
+        if size < self.offset or (self.inode is not None and stat.st_ino != self.inode) or not self._same_header(path):
+            self.reset(path)
+        if self.inode is None:
+            self.inode = stat.st_ino
+        if size == self.offset:
+            return self.frame
+
+        with open(path, "rb") as file:
+            file.seek(self.offset)
+            chunk = file.read(size - self.offset)
+        self.offset += len(chunk)
+        chunk = self._partial + chunk
+        cut = chunk.rfind(b"\n") + 1
+        complete, self._partial = chunk[:cut], chunk[cut:]
+        if not complete:
+            return self.frame
+
+        if self.header is None:
+            line_end = complete.index(b"\n") + 1
+            self._header_line = complete[:line_end]
+            self.header = next(csv.reader([self._header_line.decode()]))
+            generation = schemas.identify(self.header)
+            self.names = generation.layout if generation is not None and generation.header == self.header else self.header
+            complete = complete[line_end:]
+            if not complete:
+                return self.frame
+
+        rows = pd.read_csv(io.BytesIO(complete), header=None, names=self.names, index_col=False)
+        # the first column is the record timestamp ("Timestamp" or "datetime")
+        time_column = self.header[0]
+        rows[time_column] = pd.to_datetime(rows[time_column], format="ISO8601")
+        self._append(rows)
+        return self.frame
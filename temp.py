@@ -1,32 +1,24 @@
-import busio
-import board
-import digitalio
 from datetime import datetime
-import adafruit_max31855
 from time import sleep
+import hal
+from spiPool import MAX31855, SpiPool, max31855_celsius
 
 ### INITIALIZE SENSORS ###
-# Set up SPI buses
-spi = busio.SPI(board.SCK, MOSI=board.MOSI, MISO=board.MISO)
+# Set up SPI buses (hal.py picks the real or simulated devices, --sim / ACM_BACKEND=sim)
+spi = hal.spi()
 
 # Thermocouple digital interface pins setup
-cs_pins = [board.D17, board.D27, board.D22]  # Define the pins
-cs_objects = [digitalio.DigitalInOut(pin) for pin in cs_pins]  # Create DigitalInOut objects
-for cs in cs_objects:
-    cs.direction = digitalio.Direction.OUTPUT
-    cs.value = True  # Set all CS high initially
+cs_pins = ["D17", "D27", "D22"]  # Define the pins
+thermocouples = SpiPool(spi)  # Drivers are set up once; every read shares one bus lock
+for pin in cs_pins:
+    thermocouples.add(hal.output_pin(pin), **MAX31855)
 
 ### DATA GATHERING LOOP ###
 while True:
     data_list = [datetime.now()]  # Start data list with the current date and time
 
     # Read temperatures using MAX31855 sensors
-    for cs in cs_objects:
-        cs.value = False  # Set CS low to enable the corresponding sensor
-        temp_sensor = adafruit_max31855.MAX31855(spi, cs)
-        temperature = temp_sensor.temperature
-        data_list.append(temperature)
-        cs.value = True  # Set CS high to disable the sensor
+    data_list.extend(max31855_celsius(thermocouples.read()))
 
     print(data_list)  # Print only the date-time and temperatures
     sleep(0.1)
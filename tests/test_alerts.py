@@ -0,0 +1,35 @@
+import os
+import sys
+import unittest
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import alerts
+
+START = datetime(2026, 1, 1)
+
+class RateOfChangeTest(unittest.TestCase):
+    def feed(self, rule, first, seconds, value, step=1.0):
+        results = []
+        for index in range(int(seconds / step)):
+            results.append(rule.check(START + timedelta(seconds=first + index * step), [value(index * step)]))
+        return results
+
+    def test_gap_starts_the_history_over(self):
+        rule = alerts.RateOfChange("rate", "Pressure", 10.0, per=60.0)
+        self.feed(rule, 0, 120, lambda second: 0.0)
+        # two hours without a value, then a different level
+        results = self.feed(rule, 7320, 30, lambda second: 50.0)
+        self.assertEqual(results, [None] * 30)
+
+    def test_window_is_bounded(self):
+        rule = alerts.RateOfChange("rate", "Pressure", 10.0, per=60.0)
+        results = self.feed(rule, 0, 300, lambda second: second, step=0.05)
+        self.assertLessEqual(len(rule._window), alerts.RATE_SLOTS + 2)
+        self.assertTrue(results[-1])
+        self.assertGreaterEqual(rule.value, 60.0)
+        self.assertLess(rule.value, 60.0 + 60.0 / alerts.RATE_SLOTS + 0.1)
+
+if __name__ == "__main__":
+    unittest.main()
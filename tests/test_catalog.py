@@ -0,0 +1,65 @@
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import catalog
+
+START = datetime(2026, 1, 1)
+NAME = "01-01-2026-data.csv"
+
+def lines(header, first, count):
+    extra = len(header) - 3
+    return ["{},{},{}{}\n".format((START + timedelta(seconds=second)).isoformat(), second, second * 2,
+                                  ",7" * extra) for second in range(first, first + count)]
+
+class CatalogTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, NAME)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def write(self, header, rows, mode="w"):
+        with open(self.path, mode) as file:
+            if mode == "w":
+                file.write(",".join(header) + "\n")
+            file.writelines(rows)
+
+    def test_appended_rows_are_scanned_incrementally(self):
+        header = ["Timestamp", "A", "B"]
+        self.write(header, lines(header, 0, 100))
+        entry = catalog.Catalog(self.directory).update().files[NAME]
+        self.assertEqual(entry["rows"], 100)
+        self.write(header, lines(header, 100, 50), "a")
+        entry = catalog.Catalog(self.directory).update().files[NAME]
+        self.assertEqual(entry["rows"], 150)
+        self.assertEqual(entry["last"], (START + timedelta(seconds=149)).isoformat())
+
+    def test_replaced_file_with_a_wider_header_is_rescanned(self):
+        header = ["Timestamp", "A", "B"]
+        self.write(header, lines(header, 0, 2000))
+        catalog.Catalog(self.directory).update()
+        # the file is replaced by a larger one whose header has another column
+        wider = header + ["C"]
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w") as file:
+            file.write(",".join(wider) + "\n")
+            file.writelines(lines(wider, 0, 2010))
+        os.replace(tmp_path, self.path)
+        entries = catalog.Catalog(self.directory).update()
+        entry = entries.files[NAME]
+        self.assertEqual(entry["header"], wider)
+        self.assertEqual(entry["rows"], 2010)
+        data = entries.read_range(START + timedelta(seconds=1990), START + timedelta(seconds=2009))
+        self.assertEqual(list(data.columns), wider)
+        self.assertEqual(len(data), 20)
+        self.assertEqual(data["C"].tolist(), [7] * 20)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,63 @@
+import math
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import colStore
+
+START = datetime(2026, 1, 1)
+
+def rows(first, count, *values):
+    return [[START + timedelta(seconds=second)] + [second if value is None else value for value in values]
+            for second in range(first, first + count)]
+
+class DailyColumnSinkTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def store(self, header, day_rows):
+        sink = colStore.DailyColumnSink("data", header, self.directory, fsync=False)
+        for row in day_rows:
+            sink.write(row)
+        sink.close()
+
+    def load(self):
+        return colStore.load_day(colStore.day_path(self.directory, START))
+
+    def test_header_change_keeps_every_row(self):
+        self.store(["Timestamp", "A", "Location"], rows(0, 3, None, "Site"))
+        # a column is added in front of Location, so positions no longer match
+        self.store(["Timestamp", "A", "B", "Location"], rows(3, 2, None, 9.0, "Site"))
+        frame = self.load()
+        self.assertEqual(len(frame), 5)
+        self.assertEqual(frame["A"].tolist(), [0, 1, 2, 3, 4])
+        self.assertEqual(frame["Location"].tolist(), ["Site"] * 5)
+        self.assertTrue(all(math.isnan(value) for value in frame["B"][:3]))
+        self.assertEqual(frame["B"][3:].tolist(), [9.0, 9.0])
+        # and a column left out again gets missing values
+        self.store(["Timestamp", "A", "Location"], rows(5, 1, None, "Site"))
+        frame = self.load()
+        self.assertEqual(len(frame), 6)
+        self.assertTrue(math.isnan(frame["B"].iloc[5]))
+
+    def test_interrupted_flush_is_completed(self):
+        self.store(["Timestamp", "A", "B"], rows(0, 4, None, 1.0))
+        path = colStore.day_path(self.directory, START)
+        # the time file was flushed but B lost its last value and a half
+        os.truncate(os.path.join(path, "c01.f4"), 4 * 2 + 2)
+        self.assertEqual(len(self.load()), 4)
+        self.store(["Timestamp", "A", "B"], rows(4, 1, None, 1.0))
+        frame = self.load()
+        self.assertEqual(frame["A"].tolist(), [0, 1, 2, 3, 4])
+        self.assertEqual(frame["B"].isna().tolist(), [False, False, True, True, False])
+
+if __name__ == "__main__":
+    unittest.main()
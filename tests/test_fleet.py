@@ -0,0 +1,198 @@
+import asyncio
+import csv
+import glob
+import json
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import fleet
+
+HEADER = ["datetime", "Location", "Value"]
+
+def rows(first, count):
+    return [["2026-01-01T00:{:02d}:{:02d}".format(seq // 60, seq % 60), "Site", float(seq)]
+            for seq in range(first, first + count)]
+
+def stored_sequences(directory):
+    sequences = []
+    for path in sorted(glob.glob(os.path.join(directory, "*-data.csv"))):
+        with open(path, newline="") as file:
+            reader = csv.reader(file)
+            index = next(reader).index(fleet.SEQUENCE_COLUMN)
+            sequences.extend(int(row[index]) for row in reader)
+    return sequences
+
+def write_spool(directory, lines):
+    os.makedirs(directory, exist_ok=True)
+    with open(os.path.join(directory, "spool.jsonl"), "wb") as file:
+        file.write(b"".join(lines))
+
+def spool_line(seq):
+    return (json.dumps([seq, rows(seq, 1)[0]]) + "\n").encode()
+
+class TempDirectory(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+class PartitionTest(TempDirectory):
+    def test_resent_records_are_dropped(self):
+        partition = fleet.Partition(self.directory, HEADER)
+        self.assertEqual(partition.store(1, rows(1, 5)), 0)
+        # a batch resent after a lost ack, overlapping the new records
+        self.assertEqual(partition.store(3, rows(3, 5)), 3)
+        partition.sink.close()
+        self.assertEqual(stored_sequences(self.directory), list(range(1, 8)))
+
+    def test_resumes_from_the_store(self):
+        partition = fleet.Partition(self.directory, HEADER)
+        partition.store(1, rows(1, 4))
+        partition.sink.close()
+        partition = fleet.Partition(self.directory, HEADER)
+        self.assertEqual(partition.seq, 4)
+        self.assertEqual(partition.store(1, rows(1, 6)), 4)
+        partition.sink.close()
+        self.assertEqual(stored_sequences(self.directory), list(range(1, 7)))
+
+    def test_resumes_after_a_header_change(self):
+        partition = fleet.Partition(self.directory, HEADER)
+        partition.store(1, rows(1, 3))
+        partition.sink.close()
+        # the day file keeps its columns, Extra starts with the next file
+        partition = fleet.Partition(self.directory, HEADER + ["Extra"], partition.seq)
+        partition.store(4, [row + [1.0] for row in rows(4, 2)])
+        partition.sink.close()
+        self.assertEqual(fleet.Partition(self.directory, HEADER + ["Extra"]).seq, 5)
+        self.assertEqual(stored_sequences(self.directory), list(range(1, 6)))
+
+class CollectorTest(TempDirectory):
+    def test_nodes_with_the_same_names_get_their_own_partitions(self):
+        collector = fleet.Collector(self.directory)
+        first = collector.partition("Unspecified", "Ingersoll Rand", HEADER, "node-a")
+        second = collector.partition("Unspecified", "Ingersoll Rand", HEADER, "node-b")
+        self.assertIsNot(first, second)
+        self.assertEqual(first.store(1, rows(1, 3)), 0)
+        self.assertEqual(second.store(1, rows(1, 3)), 0)
+        collector.close()
+        for node in ("node-a", "node-b"):
+            self.assertEqual(stored_sequences(os.path.join(self.directory, "Unspecified", "Ingersoll_Rand", node)), [1, 2, 3])
+
+    def test_header_change(self):
+        collector = fleet.Collector(self.directory)
+        partition = collector.partition("Site", "C1", HEADER, "node")
+        partition.store(1, rows(1, 2))
+        partition.connections += 1
+        with self.assertRaises(ValueError):
+            collector.partition("Site", "C1", HEADER + ["Extra"], "node")
+        partition.connections -= 1
+        reopened = collector.partition("Site", "C1", HEADER + ["Extra"], "node")
+        self.assertIsNot(reopened, partition)
+        self.assertEqual(reopened.header, HEADER + ["Extra"])
+        self.assertEqual(reopened.seq, 2)
+        collector.close()
+
+class SpoolTest(TempDirectory):
+    def uplink(self):
+        return fleet.Uplink("127.0.0.1", "Site", "C1", HEADER, port=1, spool_directory=self.directory)
+
+    def test_torn_last_line_is_cut_back(self):
+        write_spool(self.directory, [spool_line(1), spool_line(2), spool_line(3)[:12]])
+        uplink = self.uplink()
+        self.assertEqual(uplink.seq, 2)
+        uplink.write(rows(3, 1)[0])
+        uplink.close()
+        with open(uplink.spool_path, "rb") as spool:
+            batch, end = uplink._next_batch(spool)
+        self.assertEqual([seq for seq, row in batch], [1, 2, 3])
+        self.assertEqual(end, os.path.getsize(uplink.spool_path))
+
+    def test_unreadable_line_is_skipped(self):
+        write_spool(self.directory, [spool_line(1), b'[2, ["2026-01\n', spool_line(3), spool_line(4)])
+        uplink = self.uplink()
+        uplink.close()
+        with open(uplink.spool_path, "rb") as spool:
+            batch, end = uplink._next_batch(spool)
+            # the batch stops at the gap, so the collector numbers its rows right
+            self.assertEqual([seq for seq, row in batch], [1])
+            uplink._acknowledged(1, end)
+            spool.seek(uplink.offset)
+            batch, end = uplink._next_batch(spool)
+        self.assertEqual([seq for seq, row in batch], [3, 4])
+        self.assertEqual(uplink.skipped, 1)
+
+    def test_node_id_is_kept(self):
+        first = self.uplink()
+        first.close()
+        second = self.uplink()
+        second.close()
+        self.assertEqual(first.node, second.node)
+        self.assertNotEqual(first.node, fleet.node_id(tempfile.mkdtemp(dir=self.directory)))
+
+class UplinkToCollectorTest(TempDirectory):
+    # Real uplinks against a collector on an ephemeral port
+    def setUp(self):
+        TempDirectory.setUp(self)
+        self.collector = fleet.Collector(os.path.join(self.directory, "store"))
+        self.loop = asyncio.new_event_loop()
+        started = threading.Event()
+
+        def run():
+            asyncio.set_event_loop(self.loop)
+            self.server = self.loop.run_until_complete(asyncio.start_server(self.collector._handle, "127.0.0.1", 0))
+            started.set()
+            self.loop.run_forever()
+        self.thread = threading.Thread(target=run, daemon=True)
+        self.thread.start()
+        started.wait(5)
+        self.port = self.server.sockets[0].getsockname()[1]
+
+    def tearDown(self):
+        self.loop.call_soon_threadsafe(self.server.close)
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join(5)
+        self.collector.close()
+        TempDirectory.tearDown(self)
+
+    def uplink(self, name):
+        return fleet.Uplink("127.0.0.1", "Unspecified", "Ingersoll Rand", HEADER, self.port,
+                            os.path.join(self.directory, name), batch_period=0.05).start()
+
+    def wait_acked(self, uplinks, seq):
+        deadline = time.monotonic() + 10
+        while any(uplink.acked < seq for uplink in uplinks) and time.monotonic() < deadline:
+            time.sleep(0.02)
+        self.assertEqual([uplink.acked for uplink in uplinks], [seq] * len(uplinks))
+
+    def test_two_nodes_and_a_restart(self):
+        uplinks = [self.uplink("a"), self.uplink("b")]
+        for row in rows(1, 5):
+            for uplink in uplinks:
+                uplink.write(row)
+        self.wait_acked(uplinks, 5)
+        for uplink in uplinks:
+            uplink.close()
+
+        # node a restarts and carries on from its spool
+        restarted = self.uplink("a")
+        self.assertEqual(restarted.seq, 5)
+        for row in rows(6, 2):
+            restarted.write(row)
+        self.wait_acked([restarted], 7)
+        restarted.close()
+
+        base = os.path.join(self.directory, "store", "Unspecified", "Ingersoll_Rand")
+        self.assertEqual(stored_sequences(os.path.join(base, uplinks[0].node)), list(range(1, 8)))
+        self.assertEqual(stored_sequences(os.path.join(base, uplinks[1].node)), list(range(1, 6)))
+        self.assertEqual(self.collector.duplicates, 0)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,49 @@
+import os
+import subprocess
+import sys
+import unittest
+from datetime import datetime
+from multiprocessing import resource_tracker
+
+REPOSITORY = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPOSITORY)
+
+import liveRing
+
+HEADER = ["Timestamp", "Value", "State"]
+
+class LiveRingTest(unittest.TestCase):
+    def setUp(self):
+        self.suffix = "test-{}".format(os.getpid())
+
+    def test_running_writer_keeps_its_segment(self):
+        ring = liveRing.LiveRing(self.suffix, HEADER, text_columns=["State"])
+        try:
+            ring.write([datetime(2026, 1, 1), 1.0, "Run"])
+            # a second script started meanwhile
+            code = "import liveRing; print(liveRing.publish({!r}, {!r}))".format(self.suffix, HEADER)
+            output = subprocess.run([sys.executable, "-c", code], cwd=REPOSITORY, capture_output=True, text=True).stdout
+            self.assertTrue(output.endswith("None\n"), output)
+            self.assertEqual(ring.seq, 1)
+            self.assertEqual(int(ring.meta[7]), os.getpid())
+        finally:
+            ring.close()
+
+    def test_segment_of_an_exited_writer_is_replaced(self):
+        ring = liveRing.LiveRing(self.suffix, HEADER)
+        ring.meta[7] = 0
+        # left behind without unlinking, like a crashed run (whose resource tracker was
+        # another process's)
+        for view in (ring.meta, ring.slot_seq, ring.times, ring.values):
+            view.release()
+        ring.shm.close()
+        resource_tracker.unregister(ring.shm._name, "shared_memory")
+        ring = liveRing.publish(self.suffix, HEADER + ["Extra"])
+        try:
+            self.assertIsNotNone(ring)
+            self.assertEqual(int(ring.meta[2]), len(HEADER))
+        finally:
+            ring.close()
+
+if __name__ == "__main__":
+    unittest.main()
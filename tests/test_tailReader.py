@@ -0,0 +1,60 @@
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import schemas
+import tailReader
+
+NAME = "01-01-2026-data.csv"
+
+def lines(width, first, count):
+    return ["2026-01-01T00:00:{:02d}{}\n".format(second, ",{}".format(second) * (width - 1))
+            for second in range(first, first + count)]
+
+class CsvTailTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, NAME)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def write(self, header, rows, mode="w"):
+        with open(self.path, mode) as file:
+            if mode == "w":
+                file.write(",".join(header) + "\n")
+            file.writelines(rows)
+
+    def test_values_past_the_header_get_the_registry_names(self):
+        generation = schemas.GENERATIONS["sensorsAq/1"]
+        self.write(generation.header, lines(len(generation.layout), 0, 3))
+        tail = tailReader.CsvTail()
+        frame = tail.read(self.path)
+        self.assertEqual(list(frame.columns), generation.layout)
+        self.write(generation.header, lines(len(generation.layout), 3, 2), "a")
+        frame = tail.read(self.path)
+        self.assertEqual(len(frame), 5)
+        self.assertEqual(frame[generation.layout[-1]].tolist(), [0, 1, 2, 3, 4])
+
+    def test_replaced_file_is_read_from_the_top(self):
+        header = ["Timestamp", "A", "B"]
+        self.write(header, lines(3, 0, 5))
+        tail = tailReader.CsvTail()
+        tail.read(self.path)
+        # replaced by a longer file with another column
+        wider = header + ["C"]
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w") as file:
+            file.write(",".join(wider) + "\n")
+            file.writelines(lines(4, 0, 8))
+        os.replace(tmp_path, self.path)
+        frame = tail.read(self.path)
+        self.assertEqual(list(frame.columns), wider)
+        self.assertEqual(len(frame), 8)
+
+if __name__ == "__main__":
+    unittest.main()
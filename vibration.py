@@ -0,0 +1,149 @@
+import os
+import threading
+import time
+from datetime import datetime
+
+### VIBRATION BURST CAPTURE ###
+# A sampler thread reads the vibration channel on a fixed grid of SAMPLE_RATE deadlines
+# into a ring of raw ADC counts. Once per WINDOW a feature thread copies the newest window
+# out of the ring and computes the features in one vectorised pass, so the record loop
+# only picks up the latest feature row and never waits on the ADC or the FFT. A burst
+# request saves the next raw window, as uint16 counts, to a compressed .npz file.
+
+SAMPLE_RATE = 1000      # Hz, paced with sleep() so the sampler never spins on the GIL
+WINDOW = 1.0            # seconds per feature window
+RING_SECONDS = 10
+RESYNC_AFTER = 0.1      # seconds behind the grid before it is restarted
+REFERENCE_VOLTAGE = 3.3
+FULL_SCALE_COUNTS = 65535   # AnalogIn.value is scaled to 16 bits
+BANDS = ((1, 10), (10, 50), (50, 150), (150, 300), (300, 500))   # Hz
+
+def band_column(low, high):
+    return "Vibration_Band_{}-{}Hz_(V2)".format(low, high)
+
+VIBRATION_COLUMNS = (["Vibration_RMS_(V)", "Vibration_Peak_(V)", "Vibration_Crest", "Vibration_Kurtosis",
+                      "Vibration_Dominant_(Hz)"] + [band_column(low, high) for low, high in BANDS])
+
+def window_features(volts, rate, bands=BANDS):
+    # Features of one window of samples, in VIBRATION_COLUMNS order. The DC level is
+    # removed first so RMS and peak describe the vibration, not the sensor offset.
+    import numpy as np
+    x = np.asarray(volts, dtype=np.float64)
+    x = x - x.mean()
+    power = np.mean(x * x)
+    rms = np.sqrt(power)
+    peak = np.abs(x).max()
+    crest = peak / rms if rms > 0 else np.nan
+    kurtosis = np.mean(x ** 4) / (power * power) if power > 0 else np.nan
+
+    # Hann-windowed one-sided power spectrum, scaled so the bins sum to the mean square
+    taper = np.hanning(len(x))
+    spectrum = np.abs(np.fft.rfft(x * taper)) ** 2
+    spectrum *= 2 / (np.sum(taper ** 2) * len(x))
+    freqs = np.fft.rfftfreq(len(x), 1.0 / rate)
+    dominant = freqs[1 + int(np.argmax(spectrum[1:]))] if len(spectrum) > 1 else np.nan
+    edges = np.searchsorted(freqs, np.asarray(bands, dtype=float).ravel())
+    energies = [spectrum[edges[2 * i]:edges[2 * i + 1]].sum() for i in range(len(bands))]
+    return [rms, peak, crest, kurtosis, dominant] + energies
+
+class VibrationCapture:
+    def __init__(self, channel, rate=SAMPLE_RATE, window=WINDOW, bands=BANDS,
+                 ring_seconds=RING_SECONDS, burst_directory="bursts", lock=None):
+        # lock: held for each read, so a channel on a shared ADC or bus is read by one thread at a time
+        import numpy as np
+        self.channel = channel
+        self.lock = lock or threading.Lock()
+        self.rate = rate
+        self.window = int(rate * window)
+        self.bands = bands
+        self.burst_directory = burst_directory
+        self.ring = np.zeros(int(rate * ring_seconds), dtype=np.uint16)
+        self.written = 0        # samples ever taken
+        self.overruns = 0       # samples read more than one period after their deadline
+        self.errors = 0
+        self.features = [None] * len(VIBRATION_COLUMNS)
+        self.level = None       # mean voltage of the latest window
+        self.feature_time = 0.0
+        self._burst = threading.Event()
+        self._stop = threading.Event()
+        self._threads = []
+
+    def start(self):
+        self._stop.clear()
+        for target, name in ((self._sample, "vibration-sampler"), (self._extract, "vibration-features")):
+            thread = threading.Thread(target=target, name=name, daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self):
+        self._stop.set()
+
+    def request_burst(self):
+        # Save the next full window of raw counts
+        self._burst.set()
+
+    def _sample(self):
+        period = 1.0 / self.rate
+        size = len(self.ring)
+        deadline = time.perf_counter()
+        while not self._stop.is_set():
+            delay = deadline - time.perf_counter()
+            if delay < -period:
+                self.overruns += 1
+            # sleep(0) when behind still hands the bus and the GIL to the other SPI readers
+            time.sleep(max(delay, 0))
+            try:
+                with self.lock:
+                    value = self.channel.value
+                self.ring[self.written % size] = value
+            except Exception:
+                self.errors += 1
+            self.written += 1
+            deadline += period
+            # a late sample is caught up on the next deadline so the grid stays uniform;
+            # only a long stall (bus contention, swapping) restarts the grid
+            if time.perf_counter() - deadline > RESYNC_AFTER:
+                deadline = time.perf_counter()
+
+    def latest(self, count):
+        # The newest `count` samples as counts, oldest first
+        import numpy as np
+        end = self.written
+        size = len(self.ring)
+        count = min(count, end, size)
+        return self.ring[(np.arange(end - count, end)) % size]
+
+    def _extract(self):
+        next_window = self.written + self.window
+        while not self._stop.is_set():
+            if self.written < next_window:
+                time.sleep((next_window - self.written) / self.rate)
+                continue
+            next_window += self.window
+            counts = self.latest(self.window)
+            if len(counts) < self.window:
+                continue
+            start = time.perf_counter()
+            volts = counts * (REFERENCE_VOLTAGE / FULL_SCALE_COUNTS)
+            self.level = float(volts.mean())
+            self.features = [float(value) for value in window_features(volts, self.rate, self.bands)]
+            self.feature_time = time.perf_counter() - start
+            if self._burst.is_set():
+                self._burst.clear()
+                self.save_burst(counts)
+
+    def save_burst(self, counts):
+        import numpy as np
+        os.makedirs(self.burst_directory, exist_ok=True)
+        stamp = datetime.now()
+        path = os.path.join(self.burst_directory, "{}-vibration.npz".format(stamp.strftime("%m-%d-%Y-%H%M%S")))
+        np.savez_compressed(path, counts=counts, rate=self.rate, time=stamp.isoformat(),
+                            reference_voltage=REFERENCE_VOLTAGE, full_scale=FULL_SCALE_COUNTS)
+        return path
+
+def load_burst(path):
+    # (datetime, sample rate, volts) of a saved burst
+    import numpy as np
+    with np.load(path) as burst:
+        volts = burst["counts"] * (float(burst["reference_voltage"]) / float(burst["full_scale"]))
+        return datetime.fromisoformat(str(burst["time"])), float(burst["rate"]), volts